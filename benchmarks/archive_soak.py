@@ -0,0 +1,100 @@
+# soak test of the tiered order store: millions of orders flow through a store with an archive on a simulated
+# clock, most execute or are canceled seconds after they're created and a few stay pending for a minute,
+# while the archiver moves finished orders to disk and the archive's size limit deletes the oldest segments.
+# memory should level off once the first segments are deleted, rows in memory follow the live orders
+# run from the repository root: python -m benchmarks.archive_soak [orders]
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+
+from order_archive import OrderArchive
+from order_record import CANCELED, EXECUTED, PENDING, OrderRecord, new_id, symbols
+from order_store import OrderStore
+
+DEFAULT_ORDERS = 5_000_000
+# orders created per simulated second
+RATE = 10_000
+# simulated seconds until orders finish, the few that stay pending longer are canceled after LONG_LIVED
+EXECUTION_DELAY = 10
+LONG_LIVED = 60
+LONG_LIVED_SHARE = 0.01
+ARCHIVE_AFTER = 30
+MAX_FINISHED = 100_000
+MAX_BYTES = 32 * 1024 * 1024
+REPORT_EVERY = 500_000
+LOOKUPS = 1000
+PAIRS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCHF"]
+
+
+def rss_mb() -> float:
+    # resident memory now, the peak where /proc isn't there
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def lookup_us(store: OrderStore, ids: list) -> float:
+    sample = random.sample(ids, min(LOOKUPS, len(ids)))
+    start = time.perf_counter()
+    for order_id in sample:
+        assert store.get(order_id) is not None
+    return (time.perf_counter() - start) / len(sample) * 1e6
+
+
+def run(total: int):
+    directory = tempfile.mkdtemp(prefix="archive-soak-")
+    try:
+        archive = OrderArchive(directory, segment_bytes=4 * 1024 * 1024, max_bytes=MAX_BYTES)
+        archive.open()
+        store = OrderStore(cold=archive)
+        codes = [symbols.intern(pair) for pair in PAIRS]
+        # ids created each simulated second, waiting to finish
+        waiting = deque()
+        long_lived = deque()
+        # a sample of the ids of the last million orders to look up, in memory or in the archive
+        recent = deque(maxlen=10_000)
+        print(f"{RATE} orders per simulated second, archived {ARCHIVE_AFTER} s after creation, "
+              f"archive limited to {MAX_BYTES // 2 ** 20} MB")
+        print(f"{'orders':>10} {'pending':>8} {'rows':>8} {'archived':>9} {'archive MB':>11} {'RSS MB':>8} "
+              f"{'us/order':>9} {'get us':>7}")
+        created = 0
+        second = 0
+        started = time.perf_counter()
+        while created < total:
+            now = second * 1_000_000
+            batch = [OrderRecord(new_id(), codes[i % len(codes)], 10.0, created_at=now + i) for i in range(RATE)]
+            store.add_many(batch)
+            ids = [order.id for order in batch]
+            recent.extend(ids[::100])
+            waiting.append((second, ids))
+            created += RATE
+            if waiting[0][0] <= second - EXECUTION_DELAY:
+                _, due = waiting.popleft()
+                split = int(len(due) * LONG_LIVED_SHARE)
+                long_lived.append((second, due[:split]))
+                store.transition_many(due[split:split + len(due) // 10], PENDING, CANCELED)
+                store.transition_many(due[split + len(due) // 10:], PENDING, EXECUTED)
+            if long_lived and long_lived[0][0] <= second - LONG_LIVED:
+                store.transition_many(long_lived.popleft()[1], PENDING, CANCELED)
+            store.archive(now - ARCHIVE_AFTER * 1_000_000, MAX_FINISHED)
+            archive.expire()
+            second += 1
+            if created % REPORT_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print(f"{created:>10} {store.count_by_status(PENDING):>8} {len(store._columns.ids):>8} "
+                      f"{len(archive):>9} {archive.size / 2 ** 20:>11.1f} {rss_mb():>8.1f} "
+                      f"{elapsed / created * 1e6:>9.2f} {lookup_us(store, list(recent)):>7.1f}")
+        archive.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ORDERS)
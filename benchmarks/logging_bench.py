@@ -0,0 +1,74 @@
+# order placement throughput with the server's logging off, on, and on with hot loggers sampled,
+# starts its own server for every setting
+# run from the repository root: python -m benchmarks.logging_bench
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+PORT = 8101
+BASE_URL = f"http://127.0.0.1:{PORT}"
+# concurrent clients and seconds of load per setting
+CONNECTIONS = 64
+DURATION = 5.0
+SETTINGS = {
+    "off": {"LOG_LEVEL": "OFF"},
+    "json": {"LOG_LEVEL": "INFO", "LOG_FORMAT": "json"},
+    "text": {"LOG_LEVEL": "INFO", "LOG_FORMAT": "text"},
+    "sampled": {"LOG_LEVEL": "INFO", "LOG_SAMPLING": "main=0.01,routers=0.01,websocket_manager=0.01"},
+}
+
+
+async def wait_until_up(session, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(BASE_URL + "/"):
+                return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server didn't start")
+
+
+async def client(session, deadline):
+    placed = 0
+    while time.monotonic() < deadline:
+        async with session.post(BASE_URL + "/orders", json={"stocks": "EURUSD", "quantity": 10}) as response:
+            await response.read()
+            if response.status == 201:
+                placed += 1
+    return placed
+
+
+async def measure():
+    connector = aiohttp.TCPConnector(limit=CONNECTIONS)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_until_up(session)
+        start = time.monotonic()
+        counts = await asyncio.gather(*(client(session, start + DURATION) for _ in range(CONNECTIONS)))
+        return sum(counts) / (time.monotonic() - start)
+
+
+def run(settings):
+    # logs go to a file like they would in production, uvicorn's access log is off for every setting
+    env = dict(os.environ, LATENCY_ENABLED="false", EXECUTION_DELAY="3600", **settings)
+    with tempfile.TemporaryFile() as log_file:
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--no-access-log"],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=log_file)
+        try:
+            throughput = asyncio.run(measure())
+        finally:
+            server.terminate()
+            server.wait()
+        return throughput, log_file.tell()
+
+
+if __name__ == "__main__":
+    print(f"{'logging':>8} {'orders/s':>10} {'log MB':>8}")
+    for name in sys.argv[1:] or SETTINGS:
+        throughput, log_bytes = run(SETTINGS[name])
+        print(f"{name:>8} {throughput:>10.0f} {log_bytes / 1e6:>8.1f}")
@@ -0,0 +1,49 @@
+# throughput of the market data engine: ticks generated per second of CPU for both price models at a few
+# tick rates and pair counts, and what a step's quote messages cost to encode
+# run from the repository root: python -m benchmarks.market_data_bench
+import time
+
+from instruments import Instrument, instruments
+from market_data import MODELS, MarketDataEngine, QuoteBook
+
+INTERVAL = 0.1
+STEPS = 200
+TICK_RATES = (100, 1000, 10_000, 100_000)
+PAIR_COUNTS = (12, 100)
+
+
+def pairs(count: int):
+    # the configured instruments, repeated under made up names for the larger counts
+    configured = list(instruments)
+    return [configured[i] if i < len(configured) else
+            Instrument(f"P{i:05d}", i, 0.01, 0.01, 1000000, 0.00001, 1.0) for i in range(count)]
+
+
+def measure(model: str, tick_rate: int, count: int) -> tuple:
+    engine = MarketDataEngine(pairs(count), tick_rate, INTERVAL, 0.1, model=model, seed=1)
+    book = QuoteBook(engine.instruments)
+    engine.step()
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        engine.step()
+    elapsed = time.perf_counter() - start
+    # the messages of every pair, the most a step publishes
+    book.update(engine.step())
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        book.messages(changed_only=False)
+    encode = time.perf_counter() - start
+    return elapsed / STEPS, engine.ticks * count * STEPS / elapsed, encode / STEPS
+
+
+if __name__ == "__main__":
+    print(f"steps of {INTERVAL * 1000:.0f} ms, {STEPS} steps per row")
+    print(f"{'model':>6} {'pairs':>6} {'ticks/s/pair':>12} {'us/step':>10} {'ticks/s':>14} {'budget':>7} "
+          f"{'encode us/step':>14}")
+    for model in MODELS:
+        for count in PAIR_COUNTS:
+            for tick_rate in TICK_RATES:
+                per_step, ticks_per_second, encode = measure(model, tick_rate, count)
+                # share of the interval a step takes, above 100% the engine can't keep up on one core
+                print(f"{model:>6} {count:>6} {tick_rate:>12} {per_step * 1e6:>10.0f} {ticks_per_second:>14,.0f} "
+                      f"{per_step / INTERVAL:>7.1%} {encode * 1e6:>14.0f}")
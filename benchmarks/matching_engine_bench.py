@@ -0,0 +1,76 @@
+# matching engine throughput at different resting book depths
+# run from the repository root: python -m benchmarks.matching_engine_bench [depths...]
+import random
+import sys
+import time
+
+from matching_engine import BUY, SELL, OrderBook
+
+DEFAULT_DEPTHS = [100, 1_000, 10_000, 100_000]
+OPERATIONS = 100_000
+MID = 1.1000
+TICK = 0.0001
+# resting orders are spread over this many ticks on each side of the mid price
+SPREAD_TICKS = 50
+
+
+def limit_price(side, ticks_away):
+    # ticks_away > 0 is passive (joins the book), < 0 crosses the spread
+    offset = ticks_away * TICK
+    return round(MID - offset if side == BUY else MID + offset, 4)
+
+
+def seed_book(depth):
+    book = OrderBook("EURUSD")
+    resting = []
+    for i in range(depth):
+        side = BUY if i % 2 else SELL
+        order_id = f"seed-{i}"
+        book.submit(order_id, side, random.randint(1, 10), limit_price(side, random.randint(1, SPREAD_TICKS)))
+        resting.append(order_id)
+    return book, resting
+
+
+def run_depth(depth):
+    book, resting = seed_book(depth)
+    rng = random.Random(depth)
+    # pre-generate the workload so only engine time is measured: 45% passive limits, 15% aggressive
+    # limits, 10% market orders and 30% cancels, which keeps the book close to its seeded depth
+    operations = []
+    for i in range(OPERATIONS):
+        roll = rng.random()
+        side = BUY if rng.random() < 0.5 else SELL
+        quantity = rng.randint(1, 10)
+        if roll < 0.45:
+            operations.append(("limit", f"op-{i}", side, quantity, limit_price(side, rng.randint(1, SPREAD_TICKS))))
+        elif roll < 0.6:
+            operations.append(("limit", f"op-{i}", side, quantity, limit_price(side, -rng.randint(0, 3))))
+        elif roll < 0.7:
+            operations.append(("market", f"op-{i}", side, quantity, None))
+        else:
+            operations.append(("cancel", None, None, None, None))
+
+    fills = 0
+    start = time.perf_counter()
+    for kind, order_id, side, quantity, price in operations:
+        if kind == "cancel":
+            if resting:
+                # swap remove keeps picking a random resting order O(1)
+                index = rng.randrange(len(resting))
+                resting[index], resting[-1] = resting[-1], resting[index]
+                book.cancel(resting.pop())
+            continue
+        matched, _ = book.submit(order_id, side, quantity, price)
+        fills += len(matched)
+        if kind == "limit" and order_id in book:
+            resting.append(order_id)
+    elapsed = time.perf_counter() - start
+
+    print(f"{depth:>8} {len(book):>10} {OPERATIONS / elapsed:>12.0f} {fills / elapsed:>12.0f} "
+          f"{elapsed / OPERATIONS * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    print(f"{'depth':>8} {'resting':>10} {'orders/s':>12} {'matches/s':>12} {'us/order':>10}")
+    for depth in [int(arg) for arg in sys.argv[1:]] or DEFAULT_DEPTHS:
+        run_depth(depth)
@@ -0,0 +1,60 @@
+# memory per stored order and full collection pause, order dicts keyed by uuid string against the columnar OrderStore
+# run from the repository root: python -m benchmarks.memory_bench [sizes...]
+import gc
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from order_record import OrderRecord, new_id, now_timestamp, symbols
+from order_store import OrderStore
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+PAIRS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCHF"]
+
+
+def dict_orders(size):
+    # the order shape the router stored before records existed
+    orders = {}
+    for i in range(size):
+        order = {"stocks": PAIRS[i % len(PAIRS)], "quantity": 10.0, "side": None, "order_type": None,
+                 "price": None, "id": str(uuid.uuid4()), "status": "PENDING",
+                 "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                 "filled_quantity": 0.0, "average_price": None}
+        orders[order["id"]] = order
+    return orders
+
+
+def store_orders(size):
+    store = OrderStore()
+    codes = [symbols.intern(pair) for pair in PAIRS]
+    for i in range(size):
+        store.add(OrderRecord(new_id(), codes[i % len(codes)], 10.0, created_at=now_timestamp()))
+    return store
+
+
+def measure(build, size):
+    # returns (bytes per order, ms for a full collection with the orders alive)
+    gc.collect()
+    tracemalloc.start()
+    orders = build(size)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    gc.collect()
+    pause_ms = (time.perf_counter() - start) * 1000
+    del orders
+    return allocated / size, pause_ms
+
+
+def run(sizes):
+    print(f"{'orders':>10} {'dict bytes':>11} {'dict gc ms':>11} {'store bytes':>12} {'store gc ms':>12}")
+    for size in sizes:
+        dict_bytes, dict_pause = measure(dict_orders, size)
+        store_bytes, store_pause = measure(store_orders, size)
+        print(f"{size:>10} {dict_bytes:>11.0f} {dict_pause:>11.1f} {store_bytes:>12.0f} {store_pause:>12.1f}")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
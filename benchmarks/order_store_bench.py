@@ -0,0 +1,57 @@
+# microbenchmark for OrderStore lookup and cancel latency at growing store sizes
+# run from the repository root: python -m benchmarks.order_store_bench [sizes...]
+import random
+import sys
+import time
+
+from order_record import CANCELED, PENDING, OrderRecord, new_id, symbols
+from order_store import OrderStore
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SAMPLES = 10_000
+PAIRS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCHF"]
+
+
+def build_store(size):
+    store = OrderStore()
+    ids = []
+    for i in range(size):
+        order_id = new_id()
+        store.add(OrderRecord(order_id, symbols.intern(PAIRS[i % len(PAIRS)]), 10))
+        ids.append(order_id)
+    return store, ids
+
+
+def time_per_op(fn, args):
+    start = time.perf_counter_ns()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter_ns() - start) / len(args)
+
+
+def linear_lookup(orders, order_id):
+    # the list scan the router used before the store existed
+    for order in orders:
+        if order.id == order_id:
+            return order
+
+
+def run(sizes):
+    print(f"{'orders':>10} {'get ns/op':>12} {'cancel ns/op':>14} {'list scan ns/op':>16}")
+    for size in sizes:
+        store, ids = build_store(size)
+        sample = random.sample(ids, min(SAMPLES, size))
+
+        get_ns = time_per_op(store.get, sample)
+        cancel_ns = time_per_op(lambda order_id: store.transition(order_id, PENDING, CANCELED), sample)
+
+        # the linear scan is only sampled lightly, it gets too slow to run in full at large sizes
+        orders = list(store)
+        scan_ns = time_per_op(lambda order_id: linear_lookup(orders, order_id), sample[:20])
+
+        print(f"{size:>10} {get_ns:>12.0f} {cancel_ns:>14.0f} {scan_ns:>16.0f}")
+        del store, ids, orders
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
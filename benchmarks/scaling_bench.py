@@ -0,0 +1,70 @@
+# order placement throughput with 1..N workers sharing state, starts serve.py for every worker count
+# run from the repository root: python -m benchmarks.scaling_bench [worker counts...]
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+DEFAULT_WORKERS = [1, 2, 4]
+PORT = 8100
+BASE_URL = f"http://127.0.0.1:{PORT}"
+# concurrent clients and seconds of load per worker count
+CONNECTIONS = 64
+DURATION = 5.0
+
+
+async def wait_until_up(session, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(BASE_URL + "/"):
+                return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server didn't start")
+
+
+async def client(session, deadline):
+    placed = 0
+    while time.monotonic() < deadline:
+        async with session.post(BASE_URL + "/orders", json={"stocks": "EURUSD", "quantity": 10}) as response:
+            await response.read()
+            if response.status == 201:
+                placed += 1
+    return placed
+
+
+async def measure():
+    connector = aiohttp.TCPConnector(limit=CONNECTIONS)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_until_up(session)
+        start = time.monotonic()
+        counts = await asyncio.gather(*(client(session, start + DURATION) for _ in range(CONNECTIONS)))
+        return sum(counts) / (time.monotonic() - start)
+
+
+def run(workers):
+    # no simulated latency, executions far enough out to stay off the measurement and sockets of its own
+    # so a running server isn't disturbed
+    env = dict(os.environ, LATENCY_ENABLED="false", EXECUTION_DELAY="3600",
+               STATE_ADDRESS=f"/tmp/scaling_bench_state_{PORT}.sock",
+               STATE_HUB_ADDRESS=f"/tmp/scaling_bench_hub_{PORT}.sock")
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--port", str(PORT)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return asyncio.run(measure())
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    print(f"{'workers':>8} {'orders/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in [int(arg) for arg in sys.argv[1:]] or DEFAULT_WORKERS:
+        throughput = run(workers)
+        baseline = baseline or throughput
+        print(f"{workers:>8} {throughput:>10.0f} {throughput / baseline:>8.2f}")
@@ -0,0 +1,81 @@
+# compares ExecutionScheduler against one sleeping asyncio task per pending order
+# run from the repository root: python -m benchmarks.scheduler_bench [sizes...]
+import asyncio
+import sys
+import time
+import tracemalloc
+import uuid
+
+from execution_scheduler import ExecutionScheduler
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+async def execute_after(order_id, delay):
+    # the per order task the router used before the scheduler existed
+    await asyncio.sleep(delay)
+
+
+async def noop(order_ids):
+    pass
+
+
+def measure(setup):
+    # returns (ns per scheduled order, bytes per pending order)
+    tracemalloc.start()
+    start = time.perf_counter_ns()
+    keep_alive = setup()
+    elapsed = time.perf_counter_ns() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, keep_alive
+
+
+async def bench_size(size):
+    ids = [str(uuid.uuid4()) for _ in range(size)]
+
+    def tasks():
+        return [asyncio.create_task(execute_after(order_id, 60)) for order_id in ids]
+
+    task_ns, task_bytes, pending = measure(tasks)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    scheduler = ExecutionScheduler(noop, default_delay=60)
+
+    def wheel():
+        for order_id in ids:
+            scheduler.schedule(order_id, symbol="EURUSD")
+
+    wheel_ns, wheel_bytes, _ = measure(wheel)
+    await scheduler.stop()
+
+    # time to fire every pending execution when they all become due together
+    fired = []
+
+    async def collect(order_ids):
+        fired.extend(order_ids)
+
+    scheduler = ExecutionScheduler(collect, default_delay=0)
+    for order_id in ids:
+        scheduler.schedule(order_id)
+    start = time.perf_counter()
+    while len(fired) < size:
+        await asyncio.sleep(0)
+    drain_s = time.perf_counter() - start
+    await scheduler.stop()
+
+    print(f"{size:>8} {task_ns / size:>10.0f} {task_bytes / size:>11.0f} "
+          f"{wheel_ns / size:>11.0f} {wheel_bytes / size:>12.0f} {size / drain_s:>12.0f}")
+
+
+async def main(sizes):
+    print(f"{'pending':>8} {'task ns':>10} {'task bytes':>11} {'sched ns':>11} {'sched bytes':>12} "
+          f"{'fired/s':>12}")
+    for size in sizes:
+        await bench_size(size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES))
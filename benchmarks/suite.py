@@ -0,0 +1,309 @@
+# in-process microbenchmarks: the app is driven through httpx's ASGI transport (no sockets, no Docker, no
+# simulated latency) and the order store, scheduler, broadcast and JSON encoding are called directly.
+# every benchmark runs a warmup sample and then repeated timed samples, the results are saved as JSON
+# named after the commit so runs on two commits can be compared
+# run from the repository root:
+#   python -m benchmarks.suite [names...] [--samples N] [--output PATH] [--compare PATH]
+import os
+
+# the app reads its settings when imported: no simulated latency, no executions firing during a run,
+# no market data ticking in the background, no log output and nothing written to disk
+os.environ.update(LATENCY_ENABLED="false", EXECUTION_DELAY="3600", LOG_LEVEL="OFF", WAL_MODE="off",
+                  ARCHIVE_ENABLED="false", STATE_BACKEND="local", MARKET_DATA_ENABLED="false")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+import main
+from execution_scheduler import ExecutionScheduler
+from order_json import OrderEncoder
+from order_record import CANCELED, PENDING, OrderRecord, format_id, new_id, now_timestamp, symbols
+from order_store import OrderStore
+from websocket_manager import ConnectionManager
+
+SAMPLES = 20
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ORDER = {"stocks": "EURUSD", "quantity": 10}
+PAIRS = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCHF"]
+# orders already in the store that lookups pick from
+STORE_SIZE = 100_000
+
+
+class Benchmark(NamedTuple):
+    # run(ops) does its setup, then returns the nanoseconds ops operations took
+    run: Callable[[int], Awaitable[int]]
+    ops: int
+
+
+def new_record(i: int = 0) -> OrderRecord:
+    return OrderRecord(new_id(), symbols.intern(PAIRS[i % len(PAIRS)]), 10.0, created_at=now_timestamp())
+
+
+class NullWebSocket:
+    # a connected client whose frames go nowhere
+    def __init__(self, subprotocols: List[str] = ()):
+        self.scope = {"subprotocols": list(subprotocols)}
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+
+class Suite:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        records = [new_record(i) for i in range(STORE_SIZE)]
+        self.store = OrderStore()
+        self.store.add_many(records)
+        self.store_ids = [record.id for record in records]
+        self.benchmarks: Dict[str, Benchmark] = {
+            "http_create": Benchmark(self.http_create, 200),
+            "http_get": Benchmark(self.http_get, 200),
+            "http_cancel": Benchmark(self.http_cancel, 200),
+            "http_list_100": Benchmark(self.http_list, 50),
+            "store_get": Benchmark(self.store_get, 10_000),
+            "store_add": Benchmark(self.store_add, 10_000),
+            "store_cancel": Benchmark(self.store_cancel, 10_000),
+            "scheduler_schedule": Benchmark(self.scheduler_schedule, 10_000),
+            "scheduler_cancel": Benchmark(self.scheduler_cancel, 10_000),
+            "broadcast_1": Benchmark(lambda ops: self.broadcast(1, ops), 500),
+            "broadcast_100": Benchmark(lambda ops: self.broadcast(100, ops), 100),
+            "broadcast_1000": Benchmark(lambda ops: self.broadcast(1000, ops), 20),
+            "encode_order": Benchmark(self.encode_order, 10_000),
+            "encode_order_cached": Benchmark(self.encode_order_cached, 10_000),
+            "encode_page_100": Benchmark(self.encode_page, 200),
+        }
+
+    async def _create(self) -> str:
+        response = await self.client.post("/orders", json=ORDER)
+        if response.status_code != 201:
+            raise RuntimeError(f"Creating an order failed: {response.status_code} {response.text}")
+        return response.json()["id"]
+
+    async def http_create(self, ops: int) -> int:
+        start = time.perf_counter_ns()
+        for _ in range(ops):
+            response = await self.client.post("/orders", json=ORDER)
+        elapsed = time.perf_counter_ns() - start
+        if response.status_code != 201:
+            raise RuntimeError(f"Creating an order failed: {response.status_code}")
+        return elapsed
+
+    async def http_get(self, ops: int) -> int:
+        order_id = await self._create()
+        start = time.perf_counter_ns()
+        for _ in range(ops):
+            response = await self.client.get(f"/orders/{order_id}")
+        elapsed = time.perf_counter_ns() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"Getting an order failed: {response.status_code}")
+        return elapsed
+
+    async def http_cancel(self, ops: int) -> int:
+        order_ids = [await self._create() for _ in range(ops)]
+        start = time.perf_counter_ns()
+        for order_id in order_ids:
+            response = await self.client.delete(f"/orders/{order_id}")
+        elapsed = time.perf_counter_ns() - start
+        if response.status_code != 204:
+            raise RuntimeError(f"Canceling an order failed: {response.status_code}")
+        return elapsed
+
+    async def http_list(self, ops: int) -> int:
+        start = time.perf_counter_ns()
+        for _ in range(ops):
+            response = await self.client.get("/orders", params={"limit": 100})
+        elapsed = time.perf_counter_ns() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"Listing orders failed: {response.status_code}")
+        return elapsed
+
+    async def store_get(self, ops: int) -> int:
+        sample = random.choices(self.store_ids, k=ops)
+        get = self.store.get
+        start = time.perf_counter_ns()
+        for order_id in sample:
+            get(order_id)
+        return time.perf_counter_ns() - start
+
+    async def store_add(self, ops: int) -> int:
+        store = OrderStore()
+        records = [new_record(i) for i in range(ops)]
+        start = time.perf_counter_ns()
+        for record in records:
+            store.add(record)
+        return time.perf_counter_ns() - start
+
+    async def store_cancel(self, ops: int) -> int:
+        store = OrderStore()
+        records = [new_record(i) for i in range(ops)]
+        store.add_many(records)
+        start = time.perf_counter_ns()
+        for record in records:
+            store.transition(record.id, PENDING, CANCELED)
+        return time.perf_counter_ns() - start
+
+    async def scheduler_schedule(self, ops: int) -> int:
+        scheduler = ExecutionScheduler(self._execute, default_delay=3600)
+        order_ids = [new_id() for _ in range(ops)]
+        start = time.perf_counter_ns()
+        for order_id in order_ids:
+            scheduler.schedule(order_id)
+        elapsed = time.perf_counter_ns() - start
+        await scheduler.stop()
+        return elapsed
+
+    async def scheduler_cancel(self, ops: int) -> int:
+        scheduler = ExecutionScheduler(self._execute, default_delay=3600)
+        order_ids = [new_id() for _ in range(ops)]
+        scheduler.schedule_many((order_id, None) for order_id in order_ids)
+        start = time.perf_counter_ns()
+        for order_id in order_ids:
+            scheduler.cancel(order_id)
+        elapsed = time.perf_counter_ns() - start
+        await scheduler.stop()
+        return elapsed
+
+    @staticmethod
+    async def _execute(order_ids: List[int]):
+        pass
+
+    async def broadcast(self, subscribers: int, ops: int) -> int:
+        # one pending order update queued for every subscriber of the order, the writers drain the
+        # queues once the timed part is over
+        manager = ConnectionManager(queue_size=ops + 1)
+        record = new_record()
+        order_id = format_id(record.id)
+        for _ in range(subscribers):
+            websocket = NullWebSocket()
+            await manager.connect(websocket)
+            manager.subscribe(websocket, order_id)
+        update = [({"action": "new_order", "data": record}, order_id)]
+        start = time.perf_counter_ns()
+        for _ in range(ops):
+            await manager.publish(update)
+        elapsed = time.perf_counter_ns() - start
+        for websocket in list(manager.active_connections):
+            manager.disconnect(websocket)
+        await asyncio.sleep(0)
+        return elapsed
+
+    async def encode_order(self, ops: int) -> int:
+        # every order encoded for the first time
+        encoder = OrderEncoder(max_size=ops)
+        records = [new_record(i) for i in range(ops)]
+        start = time.perf_counter_ns()
+        for record in records:
+            encoder.order(record)
+        return time.perf_counter_ns() - start
+
+    async def encode_order_cached(self, ops: int) -> int:
+        encoder = OrderEncoder()
+        record = new_record()
+        encoder.order(record)
+        start = time.perf_counter_ns()
+        for _ in range(ops):
+            encoder.order(record)
+        return time.perf_counter_ns() - start
+
+    async def encode_page(self, ops: int) -> int:
+        # a page of 100 orders that aren't cached yet, what a listing costs the first time
+        pages = [[new_record(i) for i in range(100)] for _ in range(ops)]
+        encoder = OrderEncoder(max_size=100 * ops)
+        start = time.perf_counter_ns()
+        for page in pages:
+            encoder.orders(page)
+        return time.perf_counter_ns() - start
+
+
+async def run_benchmark(benchmark: Benchmark, samples: int) -> List[float]:
+    # ns per operation of every sample, the first run only warms up
+    await benchmark.run(benchmark.ops)
+    return [await benchmark.run(benchmark.ops) / benchmark.ops for _ in range(samples)]
+
+
+def summarize(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    return {"min": ordered[0],
+            "median": statistics.median(ordered),
+            "mean": statistics.fmean(ordered),
+            "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+            "max": ordered[-1],
+            "samples": samples}
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + "-dirty" if dirty else commit
+
+
+async def run(names: List[str], samples: int) -> dict:
+    # ASGITransport doesn't run the app's lifespan, so state is opened and closed around the run here
+    results = {}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            suite = Suite(client)
+            for name in names or suite.benchmarks:
+                if name not in suite.benchmarks:
+                    raise SystemExit(f"Unknown benchmark: {name}, pick from {', '.join(suite.benchmarks)}")
+                results[name] = summarize(await run_benchmark(suite.benchmarks[name], samples))
+                print(format_row(name, results[name]), flush=True)
+    return results
+
+
+def format_row(name: str, result: dict, baseline: Optional[dict] = None) -> str:
+    row = f"{name:>20} {result['median']:>12.0f} {result['min']:>12.0f} {result['stdev']:>10.0f}"
+    if baseline is not None:
+        change = result["median"] / baseline["median"] - 1
+        row += f" {baseline['median']:>12.0f} {change:>+8.1%}"
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process microbenchmarks of the trading platform")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all of them by default")
+    parser.add_argument("--samples", type=int, default=SAMPLES, help="timed samples per benchmark")
+    parser.add_argument("--output", help="where results are saved, benchmarks/results/<commit>.json by default")
+    parser.add_argument("--compare", help="saved results to compare the medians with")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    print(f"{'ns/op':>20} {'median':>12} {'min':>12} {'stdev':>10}")
+    results = asyncio.run(run(args.names, args.samples))
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump({"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+                   "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "samples": args.samples,
+                   "results": results}, file, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        print(f"\ncompared with {baseline['commit']}")
+        print(f"{'ns/op':>20} {'median':>12} {'min':>12} {'stdev':>10} {'baseline':>12} {'change':>8}")
+        for name, result in results.items():
+            if name in baseline["results"]:
+                print(format_row(name, result, baseline["results"][name]))
@@ -0,0 +1,50 @@
+# write-ahead log throughput for each durability mode, with concurrent writers awaiting their commit
+# run from the repository root: python -m benchmarks.wal_bench [writers...]
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+
+from order_record import OrderRecord, new_id, now_timestamp, symbols
+from order_store import OrderStore
+from wal import WAL_MODES, WriteAheadLog
+
+DEFAULT_WRITERS = [1, 16, 256]
+# seconds each mode keeps writing, a fixed duration keeps the slow modes from dominating the run
+DURATION = 3.0
+
+
+async def writer(store, deadline):
+    # every writer acknowledges its order only once it is committed, like a request handler
+    written = 0
+    symbol = symbols.intern("EURUSD")
+    while time.perf_counter() < deadline:
+        store.add(OrderRecord(new_id(), symbol, 10, created_at=now_timestamp()))
+        await store.commit()
+        written += 1
+    return written
+
+
+async def run_mode(mode, writers):
+    directory = tempfile.mkdtemp(prefix="wal-bench-")
+    try:
+        wal = WriteAheadLog(directory, mode=mode)
+        store = OrderStore(journal=wal)
+        wal.recover()
+        wal.start()
+        start = time.perf_counter()
+        counts = await asyncio.gather(*(writer(store, start + DURATION) for _ in range(writers)))
+        elapsed = time.perf_counter() - start
+        await wal.close()
+        records = sum(counts)
+        print(f"{mode:>6} {writers:>8} {records:>9} {records / elapsed:>12.0f} {elapsed / records * 1e6:>10.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    print(f"{'mode':>6} {'writers':>8} {'records':>9} {'records/s':>12} {'us/record':>10}")
+    for writers in [int(arg) for arg in sys.argv[1:]] or DEFAULT_WRITERS:
+        for mode in WAL_MODES:
+            asyncio.run(run_mode(mode, writers))
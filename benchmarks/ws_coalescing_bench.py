@@ -0,0 +1,109 @@
+# websocket frames and server CPU per delivered update, with every update in a frame of its own and with
+# coalescing at a few windows. starts its own server for every setting, server CPU is read from /proc (Linux)
+# run from the repository root: python -m benchmarks.ws_coalescing_bench [settings...]
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+from websockets import connect
+
+PORT = 8102
+BASE_URL = f"http://127.0.0.1:{PORT}"
+# every subscriber follows every order, each order is created and then canceled so updates can conflate
+SUBSCRIBERS = 20
+ORDERS = 2000
+CONCURRENCY = 32
+# coalesce value sent with the subscription, None leaves coalescing off
+SETTINGS = {
+    "off": None,
+    "1ms": {"window_ms": 1, "max_messages": 100},
+    "5ms": {"window_ms": 5, "max_messages": 100},
+    "20ms": {"window_ms": 20, "max_messages": 500},
+}
+
+
+def server_cpu(pid: int) -> float:
+    # user + system seconds the process used so far
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def wait_until_up(session, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(BASE_URL + "/"):
+                return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server didn't start")
+
+
+async def subscriber(coalesce, ready, counts):
+    # counts frames and the updates they carry until the load is over and nothing arrived for a while
+    async with connect(f"ws://127.0.0.1:{PORT}/ws", ping_interval=None, max_queue=None) as websocket:
+        message = {"action": "subscribe", "topic": "orders"}
+        if coalesce is not None:
+            message["coalesce"] = coalesce
+        await websocket.send(json.dumps(message))
+        ready.release()
+        while True:
+            try:
+                frame = await asyncio.wait_for(websocket.recv(), timeout=2)
+            except asyncio.TimeoutError:
+                return
+            updates = json.loads(frame)
+            counts[0] += 1
+            counts[1] += len(updates) if isinstance(updates, list) else 1
+
+
+async def client(session, orders):
+    for _ in range(orders):
+        async with session.post(BASE_URL + "/orders", json={"stocks": "EURUSD", "quantity": 10}) as response:
+            order = await response.json()
+        async with session.delete(f"{BASE_URL}/orders/{order['id']}") as response:
+            await response.read()
+
+
+async def measure(pid, coalesce):
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
+        await wait_until_up(session)
+        ready = asyncio.Semaphore(0)
+        counts = [0, 0]
+        subscribers = [asyncio.create_task(subscriber(coalesce, ready, counts)) for _ in range(SUBSCRIBERS)]
+        for _ in range(SUBSCRIBERS):
+            await ready.acquire()
+        await asyncio.sleep(0.5)
+        cpu = server_cpu(pid)
+        start = time.monotonic()
+        await asyncio.gather(*(client(session, ORDERS // CONCURRENCY) for _ in range(CONCURRENCY)))
+        elapsed = time.monotonic() - start
+        await asyncio.gather(*subscribers)
+        return counts[0], counts[1], elapsed, server_cpu(pid) - cpu
+
+
+def run(coalesce):
+    # no simulated latency or executions, and no logs so the server's CPU goes to the websockets
+    env = dict(os.environ, LATENCY_ENABLED="false", EXECUTION_DELAY="3600", LOG_LEVEL="OFF")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--no-access-log"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return asyncio.run(measure(server.pid, coalesce))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    published = ORDERS // CONCURRENCY * CONCURRENCY * 2 * SUBSCRIBERS
+    print(f"{ORDERS} orders created and canceled, {SUBSCRIBERS} subscribers, {published} updates published")
+    print(f"{'coalesce':>8} {'frames':>8} {'frames/s':>9} {'updates':>8} {'per frame':>9} {'CPU us/update':>13}")
+    for name in sys.argv[1:] or SETTINGS:
+        frames, updates, elapsed, cpu = run(SETTINGS[name])
+        print(f"{name:>8} {frames:>8} {frames / elapsed:>9.0f} {updates:>8} {updates / max(1, frames):>9.1f} "
+              f"{cpu / published * 1e6:>13.1f}")
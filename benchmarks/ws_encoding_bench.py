@@ -0,0 +1,97 @@
+# payload size and encode time of websocket order updates, JSON frames against the binary records of the
+# "trading.binary.v2" subprotocol (order_binary.py). updates are encoded at most once per format, binary
+# only once a binary client is sent one, so the encode time is paid once per update and the size once per
+# subscriber. sizes include the sequence number and epoch every update is sent with
+# run from the repository root: python -m benchmarks.ws_encoding_bench
+import json
+import time
+from typing import Callable, List
+
+from order_binary import decode_frame, encode_update, with_seq
+from order_json import OrderEncoder
+from order_record import ORDER_TYPE_CODES, SIDE_CODES, OrderRecord, new_id, now_timestamp, symbols
+
+UPDATES = 20_000
+FRAME_SIZE = 100
+REPEATS = 5
+# a typical epoch, a random 32-bit number
+EPOCH = 3_141_592_653
+
+
+def new_order(i: int) -> dict:
+    record = OrderRecord(new_id(), symbols.intern("EURUSD"), 10.0, created_at=now_timestamp())
+    return {"action": "new_order", "data": record}
+
+
+def partial_fill(i: int) -> dict:
+    record = OrderRecord(new_id(), symbols.intern("GBPUSD"), 10.0, SIDE_CODES["BUY"], ORDER_TYPE_CODES["LIMIT"],
+                         1.2731 + i % 100 / 1e4, created_at=now_timestamp(), filled_quantity=4.0, average_price=1.27305)
+    return {"action": "order_partially_filled", "data": record, "fill": {"price": 1.27305, "quantity": 4.0}}
+
+
+def best_of(run: Callable[[], None]) -> float:
+    # seconds of the fastest of a few runs
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure(kind: str, build: Callable[[int], dict]):
+    messages = [build(i) for i in range(UPDATES)]
+    text = ['{"seq":%d,"epoch":%d,%s' % (seq, EPOCH, OrderEncoder(max_size=UPDATES).message(message)[1:])
+            for seq, message in enumerate(messages, 1_000_000)]
+    binary = [with_seq(encode_update(message), seq, EPOCH) for seq, message in enumerate(messages, 1_000_000)]
+    json_frames = ["[" + ",".join(text[i:i + FRAME_SIZE]) + "]" for i in range(0, UPDATES, FRAME_SIZE)]
+    binary_frames = [b"".join(binary[i:i + FRAME_SIZE]) for i in range(0, UPDATES, FRAME_SIZE)]
+    assert decode_frame(binary[0])[0]["data"]["id"] == json.loads(text[0])["data"]["id"]
+
+    def encode_json():
+        # a fresh encoder, every order is encoded for the first time like it is on an update
+        encoder = OrderEncoder(max_size=UPDATES)
+        for message in messages:
+            encoder.message(message)
+
+    cached = OrderEncoder(max_size=UPDATES)
+
+    def encode_json_cached():
+        # orders already in the cache, e.g. after the REST response to the request encoded them
+        for message in messages:
+            cached.message(message)
+
+    def encode_binary():
+        for message in messages:
+            encode_update(message)
+
+    def decode_json_frames():
+        for frame in json_frames:
+            json.loads(frame)
+
+    def decode_binary_frames():
+        for frame in binary_frames:
+            decode_frame(frame)
+
+    encode_json_cached()
+    per_update = 1e6 / UPDATES
+    # bytes per update sent on its own and within frames of FRAME_SIZE, then encode and decode time per update
+    rows: List[tuple] = [
+        ("json", sum(map(len, map(str.encode, text))), sum(map(len, map(str.encode, json_frames))),
+         best_of(encode_json), best_of(decode_json_frames)),
+        ("json cached", None, None, best_of(encode_json_cached), None),
+        ("binary", sum(map(len, binary)), sum(map(len, binary_frames)), best_of(encode_binary),
+         best_of(decode_binary_frames)),
+    ]
+    print(f"\n{kind}")
+    print(f"{'format':>12} {'B/update':>9} {'B/update x' + str(FRAME_SIZE):>14} {'encode us':>10} {'decode us':>10}")
+    for name, single, framed, encode, decode in rows:
+        print(f"{name:>12} {'' if single is None else f'{single / UPDATES:.1f}':>9} "
+              f"{'' if framed is None else f'{framed / UPDATES:.1f}':>14} {encode * per_update:>10.2f} "
+              f"{'' if decode is None else f'{decode * per_update:.2f}':>10}")
+
+
+if __name__ == "__main__":
+    print(f"{UPDATES} updates, best of {REPEATS} runs, decode is of frames of {FRAME_SIZE} updates")
+    measure("new order", new_order)
+    measure("partial fill of a limit order", partial_fill)
@@ -0,0 +1,121 @@
+# runtime settings, read once from environment variables
+import os
+from typing import Dict
+
+
+def _parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _parse_mapping(value: str) -> Dict[str, float]:
+    # parse "EURUSD=5,GBPUSD=2.5" into {"EURUSD": 5.0, "GBPUSD": 2.5}
+    mapping = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, number = item.partition("=")
+        mapping[key.strip()] = float(number)
+    return mapping
+
+
+# seconds between order creation and automatic execution
+EXECUTION_DELAY = float(os.getenv("EXECUTION_DELAY", "10"))
+# per currency pair overrides of EXECUTION_DELAY, e.g. "EURUSD=5,GBPUSD=2.5"
+SYMBOL_EXECUTION_DELAYS = _parse_mapping(os.getenv("SYMBOL_EXECUTION_DELAYS", ""))
+# max number of due executions handed to the executor in one batch
+EXECUTION_BATCH_SIZE = int(os.getenv("EXECUTION_BATCH_SIZE", "1000"))
+
+# global switch for simulated request latency, turn it off for throughput runs
+LATENCY_ENABLED = _parse_bool(os.getenv("LATENCY_ENABLED", "true"))
+# optional JSON latency profile with per route models, see latency_profile.example.json
+LATENCY_CONFIG = os.getenv("LATENCY_CONFIG", "")
+
+# max queued outbound messages per websocket connection
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "1000"))
+# what happens when a websocket queue is full: drop_oldest, conflate (by order id) or disconnect
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+# defaults for connections that subscribe with "coalesce": true, how long updates are gathered into one
+# frame in milliseconds and how many updates a frame holds at most
+WS_COALESCE_WINDOW_MS = float(os.getenv("WS_COALESCE_WINDOW_MS", "5"))
+WS_COALESCE_MAX_MESSAGES = int(os.getenv("WS_COALESCE_MAX_MESSAGES", "100"))
+# latest order updates kept so reconnecting websocket clients can resume from a sequence number, older
+# gaps are filled with a snapshot instead
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "10000"))
+
+# write-ahead log durability: off, async, group (batched fsyncs acknowledged to the caller) or sync
+WAL_MODE = os.getenv("WAL_MODE", "off")
+# directory holding WAL segments and snapshots
+WAL_DIR = os.getenv("WAL_DIR", "data/wal")
+# how long records wait for others to share their fsync, in milliseconds
+WAL_COMMIT_INTERVAL_MS = float(os.getenv("WAL_COMMIT_INTERVAL_MS", "2"))
+# number of logged changes between two snapshots
+WAL_SNAPSHOT_EVERY = int(os.getenv("WAL_SNAPSHOT_EVERY", "100000"))
+
+# when turned on, finished orders move from memory to compressed segment files in ARCHIVE_DIR once they were
+# created ARCHIVE_AFTER seconds ago, or earlier while more than ARCHIVE_MAX_FINISHED of them are in memory.
+# lookups by id still find archived orders, order listings only cover the ones in memory. off by default like
+# the write-ahead log, nothing is written to disk unless asked for
+ARCHIVE_ENABLED = _parse_bool(os.getenv("ARCHIVE_ENABLED", "false"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+ARCHIVE_AFTER = float(os.getenv("ARCHIVE_AFTER", "300"))
+ARCHIVE_MAX_FINISHED = int(os.getenv("ARCHIVE_MAX_FINISHED", "100000"))
+# how often finished orders are looked for, in milliseconds
+ARCHIVE_INTERVAL_MS = float(os.getenv("ARCHIVE_INTERVAL_MS", "1000"))
+# size segment files are rolled over at, they're deleted as a whole once their last write is ARCHIVE_RETENTION
+# seconds old or while the archive is bigger than ARCHIVE_MAX_BYTES, 0 turns either limit off
+ARCHIVE_SEGMENT_BYTES = int(os.getenv("ARCHIVE_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+ARCHIVE_RETENTION = float(os.getenv("ARCHIVE_RETENTION", "86400"))
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# where orders live: local (in the worker process) or shared (one state server for every worker, see state.py)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local")
+# local socket of the state server and of the broadcast hub next to it
+STATE_ADDRESS = os.getenv("STATE_ADDRESS", "/tmp/trading_platform_state.sock")
+STATE_HUB_ADDRESS = os.getenv("STATE_HUB_ADDRESS", "/tmp/trading_platform_hub.sock")
+# shared secret workers authenticate to the state server with
+STATE_AUTHKEY = os.getenv("STATE_AUTHKEY", "trading-platform-sim")
+
+# max number of orders whose encoded JSON is kept for responses and websocket frames
+ORDER_JSON_CACHE_SIZE = int(os.getenv("ORDER_JSON_CACHE_SIZE", "10000"))
+
+# responses of POST /orders kept by their Idempotency-Key header for retries, at most this many for this
+# many seconds
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+# seconds a request still being handled holds its key, retries after that handle the request again
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "30"))
+
+# how often the order aggregates of GET /stats are pushed to subscribers of the stats websocket topic,
+# in milliseconds
+STATS_INTERVAL_MS = float(os.getenv("STATS_INTERVAL_MS", "1000"))
+
+# JSON list of the tradable currency pairs with their lot size, quantity limits, tick size and reference price
+INSTRUMENTS_FILE = os.getenv("INSTRUMENTS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              "instruments.json"))
+
+# simulated bid/ask quotes of every instrument, published on the quote websocket topics and what orders
+# executed by the timer fill at
+MARKET_DATA_ENABLED = _parse_bool(os.getenv("MARKET_DATA_ENABLED", "true"))
+# ticks per second and currency pair, they are generated in steps of MARKET_DATA_INTERVAL_MS and only
+# the last quote of a step is published
+MARKET_DATA_TICK_RATE = float(os.getenv("MARKET_DATA_TICK_RATE", "1000"))
+MARKET_DATA_INTERVAL_MS = float(os.getenv("MARKET_DATA_INTERVAL_MS", "100"))
+# price process: gbm (geometric brownian motion) or walk (arithmetic random walk), with an annualized volatility
+MARKET_DATA_MODEL = os.getenv("MARKET_DATA_MODEL", "gbm")
+MARKET_DATA_VOLATILITY = float(os.getenv("MARKET_DATA_VOLATILITY", "0.1"))
+# distance between bid and ask, in ticks of the instrument's tick size
+MARKET_DATA_SPREAD_TICKS = float(os.getenv("MARKET_DATA_SPREAD_TICKS", "2"))
+# seed of the random generator for repeatable runs, random when empty
+MARKET_DATA_SEED = int(os.environ["MARKET_DATA_SEED"]) if os.getenv("MARKET_DATA_SEED") else None
+
+# log level of the server's own loggers, OFF turns them off
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# json (one object per line) or text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# share of INFO and DEBUG records kept per logger, e.g. "websocket_manager=0.01,routers.orders=0.1"
+LOG_SAMPLING = _parse_mapping(os.getenv("LOG_SAMPLING", ""))
+# max INFO and DEBUG records per second per logger, e.g. "main=100"
+LOG_RATE_LIMITS = _parse_mapping(os.getenv("LOG_RATE_LIMITS", ""))
+# max records waiting for the log writer thread, records are dropped beyond it
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# how often the event loop lag probe behind /metrics runs, in milliseconds, 0 turns it off
+METRICS_LOOP_LAG_INTERVAL_MS = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_MS", "100"))
@@ -0,0 +1,82 @@
+# order state and books behind one lock so matching and canceling are atomic, even when several
+# workers drive the same exchange through the state server
+import threading
+from typing import Iterable, List, Optional, Tuple
+import logging
+
+from instruments import from_lots, instruments, to_lots
+from matching_engine import MatchingEngine
+from order_record import CANCELED, EXECUTED, PENDING, SIDES, OrderRecord, format_id
+from order_store import OrderStore
+
+logger = logging.getLogger(__name__)
+
+# lot size of orders recovered for a pair that isn't in the instruments file anymore
+UNLISTED_LOT_SIZE = 1e-8
+
+
+class Exchange:
+    def __init__(self, store: OrderStore, engine: MatchingEngine):
+        self.store = store
+        self.engine = engine
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def lot_size(symbol: int) -> float:
+        # books count whole lots of the pair's instrument, fills are converted back to quantities
+        instrument = instruments.by_id(symbol)
+        return instrument.lot_size if instrument is not None else UNLISTED_LOT_SIZE
+
+    def match(self, order: OrderRecord) -> List[Tuple[dict, str]]:
+        # run an order with a side through its book, returns the (message, order id) updates of every order
+        # it touched, each fill is reported on its own for both the resting and the incoming order
+        with self._lock:
+            current = self.store.get(order.id)
+            if current is None or current.status != PENDING:
+                # canceled before it reached the book
+                return []
+            lot_size = self.lot_size(order.symbol)
+            fills, unfilled = self.engine.submit(order.symbol, order.id, SIDES[order.side],
+                                                 to_lots(order.quantity, lot_size), order.price)
+            updates = []
+            for fill in fills:
+                quantity = from_lots(fill.quantity, lot_size)
+                for order_id in (fill.maker_id, fill.taker_id):
+                    filled_order = self.store.apply_fill(order_id, quantity, fill.price, lot_size)
+                    if filled_order is None:
+                        continue
+                    action = "order_executed" if filled_order.status == EXECUTED else "order_partially_filled"
+                    updates.append(({"action": action, "data": filled_order,
+                                     "fill": {"price": fill.price, "quantity": quantity}}, format_id(order_id)))
+            if fills:
+                logger.info("Order %s matched %d time(s) on %s", format_id(order.id), len(fills), order.stocks)
+            if unfilled > 0:
+                # market orders never rest in the book, whatever couldn't be filled is canceled
+                canceled = self.store.transition(order.id, PENDING, CANCELED)
+                logger.info("Market order canceled with %s unfilled: %s", from_lots(unfilled, lot_size),
+                            format_id(order.id))
+                updates.append(({"action": "order_cancelled", "data": canceled}, format_id(order.id)))
+            return updates
+
+    def cancel(self, order_id: int) -> Optional[OrderRecord]:
+        return self.cancel_many([order_id])[0]
+
+    def cancel_many(self, order_ids: List[int]) -> List[Optional[OrderRecord]]:
+        # cancel pending orders and pull the ones with a side out of their book, results line up
+        # with order_ids and are None for orders that aren't pending anymore
+        with self._lock:
+            orders = self.store.transition_many(order_ids, PENDING, CANCELED)
+            for order in orders:
+                if order is not None and order.side:
+                    self.engine.cancel(order.symbol, order.id)
+            return orders
+
+    def restore(self, orders: Iterable[dict]):
+        # load recovered orders and put pending orders with a side back in their book in arrival order. orders
+        # within half a lot of being filled, left by fills that didn't count lots, have nothing left to rest
+        with self._lock:
+            for order in self.store.load(orders):
+                if order.status == PENDING and order.side:
+                    remaining = to_lots(order.quantity - order.filled_quantity, self.lot_size(order.symbol))
+                    if remaining > 0:
+                        self.engine.book(order.symbol).restore(order.id, SIDES[order.side], remaining, order.price)
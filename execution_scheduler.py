@@ -0,0 +1,127 @@
+# single task scheduler for delayed order executions
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionScheduler:
+    def __init__(self, callback: Callable[[List[int]], Awaitable[None]], default_delay: float = 10,
+                 symbol_delays: Optional[Dict[int, float]] = None, batch_size: int = 1000,
+                 retry_delay: float = 1.0):
+        # callback receives the ids of every order that became due, in due time order. a batch it fails on
+        # is scheduled again retry_delay seconds later
+        self._callback = callback
+        self.default_delay = default_delay
+        self.symbol_delays: Dict[int, float] = dict(symbol_delays or {})
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        # min-heap of (due time, tie breaker, order id), canceled entries are left in
+        # place and skipped when popped
+        self._heap = []
+        # live entries only, order id -> due time
+        self._due: Dict[int, float] = {}
+        # orders of the batch the callback is working on, canceling one keeps it from being retried
+        self._in_flight: Set[int] = set()
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        # number of pending executions
+        return len(self._due)
+
+    def delay_for(self, symbol: Optional[int] = None) -> float:
+        return self.symbol_delays.get(symbol, self.default_delay)
+
+    def schedule(self, order_id: int, symbol: Optional[int] = None, delay: Optional[float] = None):
+        # schedule an execution, an explicit delay wins over the per symbol and default delays
+        if delay is None:
+            delay = self.delay_for(symbol)
+        due = time.monotonic() + delay
+        self._due[order_id] = due
+        heapq.heappush(self._heap, (due, next(self._counter), order_id))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        elif self._heap[0][2] == order_id:
+            # new earliest entry, the loop is sleeping for too long
+            self._wakeup.set()
+
+    def schedule_many(self, orders: Iterable[Tuple[int, Optional[int]]]):
+        # schedule (order id, symbol) pairs with their default delays, waking the loop at most once
+        now = time.monotonic()
+        earliest = self._heap[0][0] if self._heap else None
+        for order_id, symbol in orders:
+            due = now + self.delay_for(symbol)
+            self._due[order_id] = due
+            heapq.heappush(self._heap, (due, next(self._counter), order_id))
+        if not self._heap:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        elif earliest is None or self._heap[0][0] < earliest:
+            self._wakeup.set()
+
+    def cancel(self, order_id: int) -> bool:
+        # drop a pending execution, returns False if nothing was scheduled
+        if self._due.pop(order_id, None) is None:
+            if order_id in self._in_flight:
+                self._in_flight.discard(order_id)
+                return True
+            return False
+        # compact once canceled entries dominate the heap so memory follows live entries
+        if len(self._heap) > 1024 and len(self._heap) > 2 * len(self._due):
+            self._heap = [entry for entry in self._heap if self._due.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+        return True
+
+    def _pop_due(self, now: float) -> List[int]:
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            due, _, order_id = heapq.heappop(self._heap)
+            if self._due.get(order_id) == due:
+                del self._due[order_id]
+                batch.append(order_id)
+        return batch
+
+    def _retry(self, batch: List[int]):
+        # orders canceled meanwhile are left out, rescheduled ones keep their new due time
+        due = time.monotonic() + self.retry_delay
+        for order_id in batch:
+            if order_id in self._in_flight and order_id not in self._due:
+                self._due[order_id] = due
+                heapq.heappush(self._heap, (due, next(self._counter), order_id))
+
+    async def _run(self):
+        while True:
+            batch = self._pop_due(time.monotonic())
+            if batch:
+                self._in_flight = set(batch)
+                try:
+                    await self._callback(batch)
+                except Exception:
+                    logger.exception("Failed executing a batch of %d order(s), retrying in %s seconds", len(batch),
+                                     self.retry_delay)
+                    self._retry(batch)
+                self._in_flight = set()
+                continue
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
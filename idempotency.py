@@ -0,0 +1,65 @@
+# responses of recent requests by their Idempotency-Key header, so a client retrying a request it didn't
+# get the response of gets the original response back instead of doing the work again. entries are kept
+# for ttl seconds and the least recently used ones are evicted beyond max_size. the request a key was first
+# used with is kept as a fingerprint, reusing a key for another request is an error. a request in flight only
+# holds its key for lease seconds, after that the key is handed to the next request with it as if it were new,
+# so a worker dying mid-request doesn't block its key until the ttl runs out. with shared state the cache
+# lives in the state server, so a retry that lands on another worker is still recognized
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class IdempotencyCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 3600, lease: float = 30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lease = lease
+        # key -> (expiry on the monotonic clock, request fingerprint, response body or None while the
+        # request is still being handled and the expiry is the end of its lease), least recently used first
+        self._entries: Dict[str, Tuple[float, str, Optional[bytes]]] = {}
+        self.hits = 0
+        self.misses = 0
+        # calls come from the state server's threads when it's shared
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def begin(self, key: str, fingerprint: str) -> Optional[Tuple[str, Optional[bytes]]]:
+        # None when the key is new, the caller handles the request and reports back with finish() or fail().
+        # otherwise the fingerprint the key was first used with and its response, None while in flight
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > now:
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            if len(self._entries) >= self.max_size:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (now + self.lease, fingerprint, None)
+            return None
+
+    def _holds(self, key: str, fingerprint: str) -> bool:
+        # whether the request reporting back still holds the key. once its lease ran out the key may have been
+        # handed to a retry, for another request or answered already, and the retry's entry is left alone
+        entry = self._entries.get(key)
+        return entry is not None and entry[2] is None and entry[1] == fingerprint
+
+    def finish(self, key: str, fingerprint: str, response: bytes):
+        with self._lock:
+            if self._holds(key, fingerprint):
+                del self._entries[key]
+                self._entries[key] = (time.monotonic() + self.ttl, fingerprint, response)
+
+    def fail(self, key: str, fingerprint: str):
+        # nothing is kept for failed requests, a retry handles them again
+        with self._lock:
+            if self._holds(key, fingerprint):
+                del self._entries[key]
+
+    def counts(self) -> Tuple[int, int]:
+        # (hits, misses), what the metrics read through the state server's proxy
+        return self.hits, self.misses
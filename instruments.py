@@ -0,0 +1,100 @@
+# instrument reference data: the currency pairs that can be traded and their quantity and price rules,
+# loaded once from INSTRUMENTS_FILE. every instrument's symbol id is its code in the order symbol table,
+# so lookups by the compact id that records carry are a list index
+import json
+from decimal import Decimal
+from typing import Dict, Iterator, List, NamedTuple, Optional
+import logging
+
+import config
+from order_binary import SYMBOL_SIZE
+from order_record import symbols
+
+logger = logging.getLogger(__name__)
+
+
+class Instrument(NamedTuple):
+    symbol: str
+    symbol_id: int
+    # quantities are multiples of lot_size between min_quantity and max_quantity, prices multiples of tick_size
+    lot_size: float
+    min_quantity: float
+    max_quantity: float
+    tick_size: float
+    # where simulated market data starts, None when the pair has no price of its own
+    reference_price: Optional[float] = None
+
+
+def is_multiple(value: float, step: float) -> bool:
+    # tolerant to the binary representation of decimal steps, 0.605 is a multiple of 0.00001
+    ratio = value / step
+    return abs(ratio - round(ratio)) <= 1e-9 * max(1.0, abs(ratio))
+
+
+def to_lots(quantity: float, lot_size: float) -> int:
+    # the nearest whole number of lots, books and fills count lots so repeated fills can't leave fractions
+    return round(quantity / lot_size)
+
+
+def from_lots(lots: int, lot_size: float) -> float:
+    # the quantity of a number of lots, through decimal so 3 lots of 0.1 are 0.3 and not 0.30000000000000004
+    return float(Decimal(repr(lot_size)) * lots)
+
+
+def format_number(value: float) -> str:
+    # plain decimal notation for error messages, 0.00001 rather than 1e-05
+    return f"{value:.10f}".rstrip("0").rstrip(".")
+
+
+class InstrumentRegistry:
+    def __init__(self):
+        self._by_symbol: Dict[str, Instrument] = {}
+        # symbol id -> instrument, None for symbols that aren't instruments
+        self._by_id: List[Optional[Instrument]] = []
+
+    def __len__(self) -> int:
+        return len(self._by_symbol)
+
+    def __iter__(self) -> Iterator[Instrument]:
+        return iter(self._by_symbol.values())
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._by_symbol
+
+    def add(self, symbol: str, lot_size: float, min_quantity: float, max_quantity: float,
+            tick_size: float, reference_price: Optional[float] = None) -> Instrument:
+        if symbol in self._by_symbol:
+            raise ValueError(f"Duplicate instrument: {symbol}")
+        # binary websocket updates carry the pair in a fixed ASCII field, see order_binary.py
+        if not symbol or len(symbol) > SYMBOL_SIZE or not (symbol.isascii() and symbol.isprintable()):
+            raise ValueError(f"Invalid instrument symbol {symbol!r}, expected 1 to {SYMBOL_SIZE} printable "
+                             f"ASCII characters")
+        if min(lot_size, min_quantity, tick_size) <= 0 or max_quantity < min_quantity:
+            raise ValueError(f"Invalid limits for instrument {symbol}")
+        if reference_price is not None and reference_price <= 0:
+            raise ValueError(f"Invalid reference price for instrument {symbol}")
+        instrument = Instrument(symbol, symbols.intern(symbol), float(lot_size), float(min_quantity),
+                                float(max_quantity), float(tick_size),
+                                None if reference_price is None else float(reference_price))
+        self._by_symbol[symbol] = instrument
+        self._by_id.extend([None] * (instrument.symbol_id + 1 - len(self._by_id)))
+        self._by_id[instrument.symbol_id] = instrument
+        return instrument
+
+    def get(self, symbol: str) -> Optional[Instrument]:
+        return self._by_symbol.get(symbol)
+
+    def by_id(self, symbol_id: int) -> Optional[Instrument]:
+        return self._by_id[symbol_id] if 0 <= symbol_id < len(self._by_id) else None
+
+    @classmethod
+    def from_file(cls, path: str) -> "InstrumentRegistry":
+        registry = cls()
+        with open(path, "r") as file:
+            for spec in json.load(file):
+                registry.add(**spec)
+        logger.info("Loaded %d instrument(s) from %s", len(registry), path)
+        return registry
+
+
+instruments = InstrumentRegistry.from_file(config.INSTRUMENTS_FILE)
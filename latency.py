@@ -0,0 +1,122 @@
+# simulated venue latency, injected per route without blocking the event loop
+import asyncio
+import json
+import math
+import random
+import re
+from typing import Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FixedLatency:
+    def __init__(self, value: float):
+        self.value = value
+
+    def sample(self) -> float:
+        return self.value
+
+
+class UniformLatency:
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def sample(self) -> float:
+        return random.uniform(self.low, self.high)
+
+
+class LognormalLatency:
+    # median of the delay in seconds, sigma of the underlying normal, maximum caps the long tail
+    def __init__(self, median: float, sigma: float, maximum: Optional[float] = None):
+        self.mu = math.log(median)
+        self.sigma = sigma
+        self.maximum = maximum
+
+    def sample(self) -> float:
+        value = random.lognormvariate(self.mu, self.sigma)
+        return min(value, self.maximum) if self.maximum is not None else value
+
+
+class ReplayLatency:
+    # draws from latencies recorded on a real venue, one value in seconds per line of the file
+    def __init__(self, samples: List[float]):
+        if not samples:
+            raise ValueError("Replay latency model needs at least one sample")
+        self.samples = samples
+
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path, "r") as file:
+            return cls([float(line) for line in file if line.strip()])
+
+    def sample(self) -> float:
+        return random.choice(self.samples)
+
+
+def build_model(spec: dict):
+    # build a latency model from its config entry, e.g. {"model": "fixed", "value": 0.05}
+    kind = spec.get("model")
+    if kind == "fixed":
+        return FixedLatency(spec["value"])
+    if kind == "uniform":
+        return UniformLatency(spec["low"], spec["high"])
+    if kind == "lognormal":
+        return LognormalLatency(spec["median"], spec["sigma"], spec.get("maximum"))
+    if kind == "replay":
+        if "samples" in spec:
+            return ReplayLatency(spec["samples"])
+        return ReplayLatency.from_file(spec["file"])
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown latency model: {kind}")
+
+
+def _compile_route(route: str) -> Tuple[str, "re.Pattern", int]:
+    # "GET /orders/{orderId}" -> ("GET", ^/orders/[^/]+$, number of path parameters)
+    method, _, path = route.partition(" ")
+    pattern, parameters = re.subn(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(path))
+    return method.upper(), re.compile(f"^{pattern}$"), parameters
+
+
+class LatencyInjector:
+    def __init__(self, default=None, routes: Optional[dict] = None, enabled: bool = True,
+                 literal_paths: Iterable[str] = ()):
+        self.default = default
+        self.enabled = enabled
+        # the most specific matching route wins: routes with fewer path parameters first, then a method before
+        # "*", in the order they're listed otherwise
+        self.routes = sorted(((*_compile_route(route), model) for route, model in (routes or {}).items()),
+                             key=lambda route: (route[2], route[0] == "*"))
+        # paths of the app's routes without parameters, e.g. /orders/batch, a path parameter never matches them
+        self.literal_paths = frozenset(literal_paths)
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None, enabled: bool = True, literal_paths: Iterable[str] = ()):
+        # without a config file every route keeps the historical 0.1 - 1 s uniform delay
+        if not path:
+            return cls(default=UniformLatency(0.1, 1), enabled=enabled, literal_paths=literal_paths)
+        with open(path, "r") as file:
+            settings = json.load(file)
+        default = build_model(settings["default"]) if "default" in settings else None
+        routes = {route: build_model(spec) for route, spec in settings.get("routes", {}).items()}
+        logger.info("Loaded latency profile from %s with %d route rule(s)", path, len(routes))
+        return cls(default=default, routes=routes, enabled=enabled, literal_paths=literal_paths)
+
+    def model_for(self, method: str, path: str):
+        literal = path in self.literal_paths
+        for route_method, pattern, parameters, model in self.routes:
+            if parameters and literal:
+                continue
+            if route_method in (method, "*") and pattern.match(path):
+                return model
+        return self.default
+
+    async def delay(self, method: str, path: str):
+        # suspends only the calling request, other requests and websockets keep running
+        if not self.enabled:
+            return
+        model = self.model_for(method, path)
+        if model is not None:
+            await asyncio.sleep(model.sample())
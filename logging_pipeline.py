@@ -0,0 +1,143 @@
+# non-blocking logging: every process logs through a bounded queue that a background thread drains,
+# so the event loop only pays for building the record. records are written as one JSON object per line
+# (or the historical text format), messages are only formatted by the writer thread, and hot loggers
+# can be sampled or rate limited so bursts of routine events don't flood the queue.
+# warnings and errors are never sampled or rate limited.
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+LOG_FORMATS = ("json", "text")
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# LOG_LEVEL value that turns logging off
+OFF = "OFF"
+
+# attributes every LogRecord has, anything else on a record came in through extra= and is written out
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        # ISO 8601 in UTC with milliseconds
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+
+
+class SamplingFilter(logging.Filter):
+    # per logger sampling and rate limits, a rule applies to its logger and every logger below it
+    def __init__(self, sampling: Optional[Dict[str, float]] = None, rate_limits: Optional[Dict[str, float]] = None):
+        super().__init__()
+        # logger name -> share of records kept, and logger name -> max records per second
+        self.sampling = dict(sampling or {})
+        self.rate_limits = dict(rate_limits or {})
+        # logger name -> (available tokens, last refill), a bucket holds at most one second worth of records
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        # logger name -> resolved (sample rate, rate limit), so lookups only walk the hierarchy once
+        self._rules: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        self.dropped = 0
+
+    def _rule(self, name: str) -> Tuple[Optional[float], Optional[float]]:
+        rule = self._rules.get(name)
+        if rule is None:
+            rule = self._rules[name] = (self._lookup(self.sampling, name), self._lookup(self.rate_limits, name))
+        return rule
+
+    @staticmethod
+    def _lookup(rules: Dict[str, float], name: str) -> Optional[float]:
+        while True:
+            if name in rules:
+                return rules[name]
+            if "." not in name:
+                return rules.get("")
+            name = name.rpartition(".")[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        sample_rate, rate_limit = self._rule(record.name)
+        if sample_rate is not None and random.random() >= sample_rate:
+            self.dropped += 1
+            return False
+        if rate_limit is not None:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(record.name, (rate_limit, now))
+            tokens = min(rate_limit, tokens + (now - last) * rate_limit)
+            if tokens < 1:
+                self._buckets[record.name] = (tokens, now)
+                self.dropped += 1
+                return False
+            self._buckets[record.name] = (tokens - 1, now)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    # enqueues records without formatting them, and drops them rather than block when the writer falls behind
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the writer thread formats the message, so arguments have to stay as they are until then
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    def __init__(self, handler: DroppingQueueHandler, listener: QueueListener, sampler: SamplingFilter):
+        self.handler = handler
+        self.listener = listener
+        self.sampler = sampler
+
+    @property
+    def dropped(self) -> int:
+        # records lost to sampling, rate limits or a full queue
+        return self.sampler.dropped + self.handler.dropped
+
+    def stop(self):
+        # write out whatever is still queued
+        self.listener.stop()
+
+
+_pipeline: Optional[LoggingPipeline] = None
+
+
+def setup_logging(level: str = "INFO", log_format: str = "json", sampling: Optional[Dict[str, float]] = None,
+                  rate_limits: Optional[Dict[str, float]] = None, queue_size: int = 10000) -> LoggingPipeline:
+    # route every logger of the process through the queue, safe to call more than once
+    global _pipeline
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format: {log_format}")
+    if _pipeline is not None:
+        return _pipeline
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    handler = DroppingQueueHandler(queue.Queue(queue_size))
+    sampler = SamplingFilter(sampling, rate_limits)
+    handler.addFilter(sampler)
+    listener = QueueListener(handler.queue, stream)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    # OFF disables every level, isEnabledFor() turns calls down before a record is even built
+    root.setLevel(logging.CRITICAL + 1 if level.upper() == OFF else level.upper())
+    listener.start()
+    _pipeline = LoggingPipeline(handler, listener, sampler)
+    return _pipeline
@@ -1,23 +1,56 @@
-from fastapi import FastAPI, Request, Response
-from routers import orders
-import time
-import random
+import config
 import logging
+from logging_pipeline import setup_logging
+
+# every logger goes through the non-blocking pipeline, set up before the other modules are imported so
+# their startup records aren't lost, hence the late imports below (noqa: E402)
+logging_pipeline = setup_logging(level=config.LOG_LEVEL, log_format=config.LOG_FORMAT, sampling=config.LOG_SAMPLING,
+                                 rate_limits=config.LOG_RATE_LIMITS, queue_size=config.LOG_QUEUE_SIZE)
+
+from contextlib import asynccontextmanager  # noqa: E402
+from fastapi import FastAPI, Request, Response  # noqa: E402
+from fastapi.exception_handlers import request_validation_exception_handler  # noqa: E402
+from fastapi.exceptions import RequestValidationError  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from models.schemas import ORDER_RULE_ERROR  # noqa: E402
+from routers import orders  # noqa: E402
+from latency import LatencyInjector  # noqa: E402
+from metrics import CONTENT_TYPE, LoopLagMonitor, RequestMetricsMiddleware, registry  # noqa: E402
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+loop_lag_monitor = LoopLagMonitor(interval=config.METRICS_LOOP_LAG_INTERVAL_MS / 1000)
+request_duration = registry.histogram("trading_http_request_duration_seconds",
+                                      "HTTP request latency by method and route, simulated latency included",
+                                      ("method", "route"))
+registry.counter("trading_log_records_dropped_total", "Log records dropped by sampling, rate limits or a full queue",
+                 callback=lambda: logging_pipeline.dropped)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await orders.open_state()
+    loop_lag_monitor.start()
+    yield
+    # stop background tasks and flush the write-ahead log so shutdown doesn't hang or lose orders
+    await loop_lag_monitor.stop()
+    await orders.close_state()
+    logging_pipeline.stop()
+
 
 app = FastAPI(title="Forex Trading Platform API",
               version="1.0.0",
               description="A RESTful API to simulate a Forex trading platform with WebSocket support for real-time "
-                          "order updates.")
+                          "order updates.",
+              lifespan=lifespan)
 
 app.include_router(orders.router)
 
+# a path parameter of a latency profile route never stands for a literal path of the API, e.g. /orders/batch
+latency_injector = LatencyInjector.from_config(config.LATENCY_CONFIG, enabled=config.LATENCY_ENABLED,
+                                               literal_paths=[route.path for route in app.routes
+                                                              if "{" not in route.path])
+
 
 @app.get("/", include_in_schema=False)
 async def read_root():
@@ -26,10 +59,31 @@ async def read_root():
     return "I live!"
 
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # this worker's metrics in the Prometheus text format
+    await orders.refresh_metrics()
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.exception_handler(RequestValidationError)
+async def order_rule_exception_handler(request: Request, exc: RequestValidationError):
+    # orders breaking an order rule get a 400 with the rule's message, requests that don't parse keep the 422
+    for error in exc.errors():
+        if error["type"] == ORDER_RULE_ERROR:
+            logger.error("Order rejected: %s", error["msg"])
+            return JSONResponse(status_code=400, content={"detail": error["msg"]})
+    return await request_validation_exception_handler(request, exc)
+
+
 @app.middleware("http")
 # middleware decorator to simulate response delay
 async def add_delay(request: Request, call_next):
-    time.sleep(random.uniform(0.1, 1))
-    logger.info(f"Processing request: {request.method} {request.url}")
+    await latency_injector.delay(request.method, request.url.path)
+    logger.info("Processing request: %s %s", request.method, request.url)
     response = await call_next(request)
     return response
+
+
+# added last so it wraps every other middleware and times requests the way clients see them
+app.add_middleware(RequestMetricsMiddleware, histogram=request_duration)
@@ -0,0 +1,165 @@
+# simulated market data: bid/ask quotes for every instrument, generated with NumPy in batches. every step
+# draws the ticks of the interval for all pairs at once as a (pairs, ticks) matrix of random increments of
+# the mid price, either geometric brownian motion or an arithmetic random walk, so no Python code runs per
+# tick. only the last tick of a step is kept as the pair's quote, that is what gets published and what
+# executed orders fill at
+import asyncio
+import math
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+import numpy as np
+
+import config
+from instruments import Instrument
+from order_record import format_timestamp, now_timestamp
+
+logger = logging.getLogger(__name__)
+
+MODELS = ("gbm", "walk")
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+
+class QuoteStep(NamedTuple):
+    # quotes at the end of a step, one row per instrument in the engine's order
+    timestamp: int
+    bid: np.ndarray
+    ask: np.ndarray
+    # ticks every pair went through during the step
+    ticks: int
+
+    def to_list(self) -> list:
+        # JSON friendly form, how the state server sends steps to the workers
+        return [self.timestamp, self.bid.tolist(), self.ask.tolist(), self.ticks]
+
+    @classmethod
+    def from_list(cls, values: list) -> "QuoteStep":
+        timestamp, bid, ask, ticks = values
+        return cls(timestamp, np.array(bid), np.array(ask), ticks)
+
+
+class QuoteBook:
+    # the latest quote of every pair, what executions are priced at
+    def __init__(self, instruments: List[Instrument]):
+        self.instruments = instruments
+        self.latest: Optional[QuoteStep] = None
+        self.previous: Optional[QuoteStep] = None
+
+    def update(self, step: QuoteStep):
+        self.previous, self.latest = self.latest, step
+
+    def fill_prices(self) -> Dict[str, Tuple[float, float, float]]:
+        # pair -> fill price by side code: orders without a side fill at the mid, buys lift the ask and
+        # sells hit the bid. keyed by name since symbol ids differ between processes
+        if self.latest is None:
+            return {}
+        prices = {}
+        for instrument, bid, ask in zip(self.instruments, self.latest.bid.tolist(), self.latest.ask.tolist()):
+            tick_size = instrument.tick_size
+            mid = round(round((bid + ask) / 2 / tick_size) * tick_size, decimals(tick_size))
+            prices[instrument.symbol] = (mid, ask, bid)
+        return prices
+
+    def messages(self, changed_only: bool = True) -> List[Tuple[str, str]]:
+        # (pair, encoded quote message) of the pairs whose quote changed with the latest step, or of every
+        # pair, for the websocket quote topics
+        step, previous = self.latest, self.previous
+        if step is None:
+            return []
+        if previous is None or not changed_only:
+            rows = range(len(self.instruments))
+        else:
+            rows = np.flatnonzero((step.bid != previous.bid) | (step.ask != previous.ask)).tolist()
+        time = format_timestamp(step.timestamp)
+        bids, asks = step.bid.tolist(), step.ask.tolist()
+        return [(self.instruments[row].symbol, '{"action":"quote","data":{"stocks":"%s","bid":%r,"ask":%r,'
+                 '"time":"%s"}}' % (self.instruments[row].symbol, bids[row], asks[row], time)) for row in rows]
+
+
+def decimals(tick_size: float) -> int:
+    # decimal places of a tick size, 5 for 0.00001
+    return max(0, -math.floor(math.log10(tick_size) + 1e-9))
+
+
+class MarketDataEngine:
+    def __init__(self, instruments: List[Instrument], tick_rate: float, interval: float, volatility: float,
+                 spread_ticks: float = 2, model: str = "gbm", seed: Optional[int] = None,
+                 on_step: Optional[Callable[[QuoteStep], None]] = None):
+        if model not in MODELS:
+            raise ValueError(f"Unknown market data model: {model}")
+        if tick_rate <= 0 or interval <= 0:
+            raise ValueError("Market data tick rate and interval must be positive")
+        self.instruments = instruments
+        self.interval = interval
+        self.model = model
+        self.on_step = on_step
+        # ticks per pair and step, at least one so slow rates still move
+        self.ticks = max(1, round(tick_rate * interval))
+        self.dt = interval / self.ticks
+        self._rng = np.random.default_rng(seed)
+        self.mid = np.array([instrument.reference_price or 1.0 for instrument in instruments])
+        self.tick_size = np.array([instrument.tick_size for instrument in instruments])
+        self.half_spread = self.tick_size * spread_ticks / 2
+        # annual volatility as the standard deviation of one tick's log return, for the walk in price units
+        self.sigma = volatility * math.sqrt(self.dt / SECONDS_PER_YEAR)
+        self._step_sigma = self.sigma * self.mid
+        self._decimals = [decimals(tick_size) for tick_size in self.tick_size.tolist()]
+        self.steps = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def step(self) -> QuoteStep:
+        # one interval of ticks for every pair, the mid path is the cumulative sum of the increments
+        shocks = self._rng.standard_normal((len(self.instruments), self.ticks))
+        if self.model == "gbm":
+            path = self.mid[:, None] * np.exp(np.cumsum(shocks * self.sigma - self.sigma ** 2 / 2, axis=1))
+        else:
+            # the walk can't go below a tick
+            path = np.maximum(self.mid[:, None] + np.cumsum(shocks * self._step_sigma[:, None], axis=1),
+                              self.tick_size[:, None])
+        self.mid = path[:, -1]
+        # quotes sit on the tick grid around the mid, at least a tick apart
+        bid = np.floor((self.mid - self.half_spread) / self.tick_size) * self.tick_size
+        ask = np.maximum(np.ceil((self.mid + self.half_spread) / self.tick_size) * self.tick_size,
+                         bid + self.tick_size)
+        self.steps += 1
+        return QuoteStep(now_timestamp(), self._round(bid), self._round(ask), self.ticks)
+
+    def _round(self, prices: np.ndarray) -> np.ndarray:
+        # drop the binary noise of the tick multiplication, 1.0842100000000001 -> 1.08421
+        return np.array([round(price, places) for price, places in zip(prices.tolist(), self._decimals)])
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline += self.interval
+            try:
+                step = self.step()
+                if self.on_step is not None:
+                    self.on_step(step)
+            except Exception as e:
+                logger.error("Market data step failed: %s", e)
+            # steps keep to the clock, a late step is followed by the next one right away, but after a
+            # stall the missed steps are skipped rather than caught up on
+            now = loop.time()
+            deadline = max(deadline, now - self.interval)
+            await asyncio.sleep(max(0.0, deadline - now))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def build_engine(instruments: List[Instrument], on_step: Callable[[QuoteStep], None]) -> MarketDataEngine:
+    # the engine per the MARKET_DATA_* settings
+    return MarketDataEngine(instruments, config.MARKET_DATA_TICK_RATE, config.MARKET_DATA_INTERVAL_MS / 1000,
+                            config.MARKET_DATA_VOLATILITY, spread_ticks=config.MARKET_DATA_SPREAD_TICKS,
+                            model=config.MARKET_DATA_MODEL, seed=config.MARKET_DATA_SEED, on_step=on_step)
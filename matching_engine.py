@@ -0,0 +1,172 @@
+# price-time priority limit order books, one per currency pair. quantities are whole lots of the pair's
+# instrument (see exchange.py), so matching never leaves a fraction of a lot resting in the book
+import heapq
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUY = "BUY"
+SELL = "SELL"
+
+
+class Fill(NamedTuple):
+    maker_id: int
+    taker_id: int
+    price: float
+    quantity: int
+
+
+class BookOrder:
+    __slots__ = ("order_id", "side", "price", "remaining")
+
+    def __init__(self, order_id: int, side: str, price: Optional[float], remaining: int):
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+
+
+class PriceLevel:
+    # orders resting at one price in arrival order, canceled orders stay in the deque with
+    # nothing remaining until they reach the front
+    __slots__ = ("orders", "live", "quantity")
+
+    def __init__(self):
+        self.orders = deque()
+        self.live = 0
+        self.quantity = 0
+
+
+class OrderBook:
+    def __init__(self, symbol: int):
+        self.symbol = symbol
+        # price -> level for each side, plus a heap of level prices for best price lookup
+        # (bids are stored negated so both heaps are min-heaps), heap entries of removed
+        # levels are skipped lazily
+        self.bids: Dict[float, PriceLevel] = {}
+        self.asks: Dict[float, PriceLevel] = {}
+        self._bid_prices: List[float] = []
+        self._ask_prices: List[float] = []
+        # resting orders by id for O(1) cancel
+        self._orders: Dict[int, BookOrder] = {}
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
+
+    def _side(self, side: str) -> Tuple[Dict[float, PriceLevel], List[float], int]:
+        if side == BUY:
+            return self.bids, self._bid_prices, -1
+        return self.asks, self._ask_prices, 1
+
+    @staticmethod
+    def _best(levels: Dict[float, PriceLevel], prices: List[float], sign: int) -> Optional[float]:
+        while prices:
+            price = prices[0] * sign
+            if price in levels:
+                return price
+            heapq.heappop(prices)
+        return None
+
+    def best_bid(self) -> Optional[float]:
+        return self._best(self.bids, self._bid_prices, -1)
+
+    def best_ask(self) -> Optional[float]:
+        return self._best(self.asks, self._ask_prices, 1)
+
+    def submit(self, order_id: int, side: str, quantity: int,
+               price: Optional[float] = None) -> Tuple[List[Fill], int]:
+        # match an incoming order against the opposite side, a limit order's remainder rests in
+        # the book, a market order's remainder is returned unfilled
+        taker = BookOrder(order_id, side, price, quantity)
+        fills: List[Fill] = []
+        levels, prices, sign = self._side(SELL if side == BUY else BUY)
+        while taker.remaining > 0:
+            best = self._best(levels, prices, sign)
+            if best is None or (price is not None and (best > price if side == BUY else best < price)):
+                break
+            self._match_level(taker, best, levels[best], fills)
+            if levels[best].live == 0:
+                del levels[best]
+        if price is not None and taker.remaining > 0:
+            self._rest(taker)
+            return fills, 0
+        return fills, taker.remaining
+
+    def _match_level(self, taker: BookOrder, price: float, level: PriceLevel, fills: List[Fill]):
+        orders = level.orders
+        while orders and taker.remaining > 0:
+            maker = orders[0]
+            if maker.remaining <= 0:
+                orders.popleft()
+                continue
+            quantity = min(maker.remaining, taker.remaining)
+            maker.remaining -= quantity
+            taker.remaining -= quantity
+            level.quantity -= quantity
+            fills.append(Fill(maker.order_id, taker.order_id, price, quantity))
+            if maker.remaining <= 0:
+                orders.popleft()
+                level.live -= 1
+                del self._orders[maker.order_id]
+
+    def _rest(self, order: BookOrder):
+        levels, prices, sign = self._side(order.side)
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = PriceLevel()
+            heapq.heappush(prices, order.price * sign)
+            # drop heap entries of removed levels once they dominate the heap
+            if len(prices) > 2 * len(levels) + 64:
+                prices[:] = [entry for entry in prices if entry * sign in levels]
+                heapq.heapify(prices)
+        level.orders.append(order)
+        level.live += 1
+        level.quantity += order.remaining
+        self._orders[order.order_id] = order
+
+    def restore(self, order_id: int, side: str, remaining: int, price: float):
+        # put a resting order back without matching it, used when rebuilding a book
+        self._rest(BookOrder(order_id, side, price, remaining))
+
+    def cancel(self, order_id: int) -> Optional[int]:
+        # remove a resting order, returns its unfilled quantity or None if it isn't in the book
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        levels, _, _ = self._side(order.side)
+        level = levels[order.price]
+        remaining, order.remaining = order.remaining, 0
+        level.live -= 1
+        level.quantity -= remaining
+        if level.live == 0:
+            del levels[order.price]
+        return remaining
+
+    def depth(self, side: str, levels: int = 10) -> List[Tuple[float, int]]:
+        # (price, lots) of the best price levels of one side
+        book, _, sign = self._side(side)
+        return [(price, book[price].quantity) for price in sorted(book, key=lambda p: p * sign)[:levels]]
+
+
+class MatchingEngine:
+    def __init__(self):
+        self.books: Dict[int, OrderBook] = {}
+
+    def book(self, symbol: int) -> OrderBook:
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook(symbol)
+        return book
+
+    def submit(self, symbol: int, order_id: int, side: str, quantity: int,
+               price: Optional[float] = None) -> Tuple[List[Fill], int]:
+        return self.book(symbol).submit(order_id, side, quantity, price)
+
+    def cancel(self, symbol: int, order_id: int) -> Optional[int]:
+        book = self.books.get(symbol)
+        return book.cancel(order_id) if book is not None else None
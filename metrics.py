@@ -0,0 +1,242 @@
+# in-process metrics, served at /metrics in the Prometheus text format. recording is cheap enough to stay on:
+# every counter and histogram bucket is allocated when the metric or label set is first seen, observing a
+# value is a bisect and two additions on the event loop thread with no locks, and values the server already
+# tracks (order counts, queue depths) are read by callbacks when scraped instead of being counted twice
+import asyncio
+import bisect
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# upper bounds in seconds, for request latencies and for short in-process steps like a broadcast fan-out
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+# a callback returns the metric's value, or (label values, value) pairs for a metric with labels
+Callback = Callable[[], object]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 callback: Optional[Callback] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.callback = callback
+        # label values -> child metric holding that label set's value
+        self._children: Dict[Tuple[str, ...], "Metric"] = {}
+
+    def labels(self, *values: str) -> "Metric":
+        # the child for a label set, created once, callers on hot paths should keep it
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+            child = self._children[values] = self._child()
+        return child
+
+    def _child(self) -> "Metric":
+        raise NotImplementedError
+
+    def _samples(self, labels: str) -> List[str]:
+        # lines of a single label set, labels is the formatted label set
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is not None:
+            value = self.callback()
+            pairs = value if self.label_names else [((), value)]
+            for values, sample in pairs:
+                lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(sample)}")
+        elif self.label_names:
+            for values, child in list(self._children.items()):
+                lines.extend(child._samples(_format_labels(self.label_names, values)))
+        else:
+            lines.extend(self._samples(""))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def _samples(self, labels: str) -> List[str]:
+        return [f"{self.name}{labels} {_format_value(self.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+    def _child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket and one for +Inf, not cumulative, they are summed up when rendered
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _samples(self, labels: str) -> List[str]:
+        # label sets are rendered as {a="x"}, the bucket bound goes in as one more label
+        inner = labels[1:-1] + "," if labels else ""
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), list(self.counts)):
+            total += count
+            lines.append(f'{self.name}_bucket{{{inner}le="{_format_value(float(bound))}"}} {total}')
+        lines.append(f"{self.name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                callback: Optional[Callback] = None) -> Counter:
+        return self.register(Counter(name, documentation, label_names, callback))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = (),
+              callback: Optional[Callback] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names, callback))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # a failing callback (e.g. the state server going away) shouldn't take the other metrics down
+                logger.warning("Failed collecting metric %s: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+event_loop_lag = registry.gauge("trading_event_loop_lag_seconds",
+                                "How late the event loop ran the last lag probe")
+event_loop_lag_histogram = registry.histogram("trading_event_loop_lag_probe_seconds",
+                                              "How late the event loop ran lag probes", buckets=FAST_BUCKETS)
+
+
+class RequestMetricsMiddleware:
+    # ASGI middleware timing every HTTP request by method and route template, so /orders/{orderId} is one
+    # series rather than one per order. wraps the app directly instead of going through BaseHTTPMiddleware,
+    # which would add a task and a memory stream to every request
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+        # route template -> method -> child histogram, the router puts the route in the scope once it matched
+        self._children: Dict[str, Dict[str, Histogram]] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = loop.time() - start
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            by_method = self._children.get(path)
+            if by_method is None:
+                by_method = self._children[path] = {}
+            child = by_method.get(scope["method"])
+            if child is None:
+                child = by_method[scope["method"]] = self.histogram.labels(scope["method"], path)
+            child.observe(elapsed)
+
+
+class LoopLagMonitor:
+    # sleeps for a fixed interval over and over, whatever it oversleeps by is time the loop spent busy
+    # with something else, e.g. a long synchronous call holding up every request
+    def __init__(self, interval: float = 0.1, gauge: Gauge = event_loop_lag,
+                 histogram: Histogram = event_loop_lag_histogram):
+        self.interval = interval
+        self.gauge = gauge
+        self.histogram = histogram
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.gauge.set(lag)
+            self.histogram.observe(lag)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,15 +1,109 @@
-from pydantic import BaseModel, Field
+import math
+from datetime import datetime
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, model_validator
+from pydantic_core import PydanticCustomError
+from typing import Dict, Literal, Optional
+from instruments import format_number, instruments, is_multiple
+
+# error type of the order rules checked by OrderInput, answered with a 400 and the rule's message
+ORDER_RULE_ERROR = "order_rule"
+
+
+def order_rule_error(message: str) -> PydanticCustomError:
+    return PydanticCustomError(ORDER_RULE_ERROR, message)
+
+
+def order_rule_message(error: ValidationError) -> Optional[str]:
+    # message of the order rule an input broke, None when it didn't even parse
+    for item in error.errors():
+        if item["type"] == ORDER_RULE_ERROR:
+            return item["msg"]
+    return None
 
 
 class OrderBase(BaseModel):
     stocks: str = Field(None, description="Currency pair symbol (e.g. 'EURUSD'), or any other stuff")
     quantity: float = Field(None, description="Quantity of the currency pair to be traded")
+    side: Optional[Literal["BUY", "SELL"]] = Field(None, description="Side of the order book to trade on, orders "
+                                                                     "without a side are executed automatically "
+                                                                     "after a delay")
+    order_type: Optional[Literal["LIMIT", "MARKET"]] = Field(None, description="LIMIT orders rest in the book at "
+                                                                               "their price, MARKET orders fill "
+                                                                               "against the best prices available. "
+                                                                               "Defaults to LIMIT when a price is set")
+    price: Optional[float] = Field(None, description="Limit price, required for LIMIT orders")
 
 
 class OrderInput(OrderBase):
-    pass
+    # symbol id of the instrument, set once the order passed its rules
+    _symbol_id: int = PrivateAttr(None)
+
+    @property
+    def symbol_id(self) -> int:
+        return self._symbol_id
+
+    @model_validator(mode="after")
+    def check_order_rules(self) -> "OrderInput":
+        # the order rules run while parsing, in the order their errors are reported
+        instrument = instruments.get(self.stocks) if self.stocks is not None else None
+        if instrument is None:
+            raise order_rule_error("Invalid currency pair symbol")
+        if self.quantity is None or self.quantity <= 0:
+            raise order_rule_error("Order quantity must be greater than zero")
+        # json allows Infinity and NaN, neither is a quantity or price and NaN fails every comparison
+        if not math.isfinite(self.quantity):
+            raise order_rule_error("Order quantity must be a finite number")
+        if self.price is not None and not math.isfinite(self.price):
+            raise order_rule_error("Price must be a finite number")
+        if self.side is None:
+            if self.price is not None or self.order_type is not None:
+                raise order_rule_error("Only orders with a side can set a price or order type")
+        elif self.order_type == "MARKET":
+            if self.price is not None:
+                raise order_rule_error("Market orders can't have a price")
+        elif (self.order_type == "LIMIT" and self.price is None) or (self.price is not None and self.price <= 0):
+            raise order_rule_error("Limit orders need a price greater than zero")
+        if self.quantity < instrument.min_quantity:
+            raise order_rule_error(f"Order quantity must be at least {format_number(instrument.min_quantity)}")
+        if self.quantity > instrument.max_quantity:
+            raise order_rule_error(f"Order quantity can't be more than {format_number(instrument.max_quantity)}")
+        if not is_multiple(self.quantity, instrument.lot_size):
+            raise order_rule_error(f"Order quantity must be a multiple of {format_number(instrument.lot_size)}")
+        if self.price is not None and not is_multiple(self.price, instrument.tick_size):
+            raise order_rule_error(f"Price must be a multiple of {format_number(instrument.tick_size)}")
+        self._symbol_id = instrument.symbol_id
+        return self
 
 
 class OrderOutput(OrderBase):
     id: str
     status: str = Field(None, enum=["PENDING", "EXECUTED", "CANCELED"], description="Status of the order")
+    created_at: datetime = Field(None, description="Time the order was created (UTC)")
+    filled_quantity: float = Field(None, description="Quantity filled so far")
+    average_price: Optional[float] = Field(None, description="Average price of the fills so far")
+
+
+class BatchOrderResult(BaseModel):
+    index: int = Field(..., description="Position of the order in the request")
+    success: bool
+    order: Optional[OrderOutput] = Field(None, description="Created order, set when success is true")
+    detail: Optional[str] = Field(None, description="Reason the order was rejected")
+
+
+class BatchCancelResult(BaseModel):
+    order_id: str
+    success: bool
+    detail: Optional[str] = Field(None, description="Reason the order couldn't be canceled")
+
+
+class PairStatsOutput(BaseModel):
+    orders: Dict[str, int] = Field(..., description="Number of orders by status")
+    pending_quantity: float = Field(..., description="Unfilled quantity of the pending orders")
+    executed_quantity: float = Field(..., description="Quantity filled, partial fills of pending orders included")
+
+
+class StatsOutput(BaseModel):
+    orders: Dict[str, int] = Field(..., description="Number of orders by status")
+    pairs: Dict[str, PairStatsOutput] = Field(..., description="Aggregates by currency pair")
+    rates: Dict[str, Dict[str, float]] = Field(..., description="Orders created, executed and canceled per second, "
+                                                                "averaged over the last 10s, 1m and 5m")
@@ -0,0 +1,345 @@
+# cold tier of the order store: finished orders moved out of memory into compressed, append-only segment
+# files on local disk, where lookups by id still find them. a segment is a run of blocks of up to
+# BLOCK_ORDERS orders each, written once and never changed:
+#   header      magic, order count u32, payload length u32, crc32 of keys and payload u32
+#   keys        u64 per order, the low 64 bits of its id
+#   payload     zlib compressed columns: id 16 B, pair 6 B ASCII, side, order type and status u8, quantity
+#               and price f64, created_at i64, filled quantity and average price f64, missing prices NaN
+# the keys sit outside the payload so opening a segment rebuilds the index without decompressing it. the
+# index is all that stays in memory per archived order, 12 bytes: its key and the number of its block, kept
+# in buckets by key whose packed keys are searched with bytes.find. segments go away as a whole once they're older
+# than the retention or the archive is over its size limit
+import asyncio
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from order_record import OrderRecord, now_timestamp, symbols
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "orders-"
+SEGMENT_SUFFIX = ".seg"
+BLOCK_MAGIC = b"OBK1"
+BLOCK_HEADER = struct.Struct("<4sIII")
+# a lookup decompresses a whole block, smaller blocks compress worse
+BLOCK_ORDERS = 128
+KEY_MASK = (1 << 64) - 1
+# power of two, the low bits of a key pick its bucket
+INDEX_BUCKETS = 4096
+# bytes per order of every column of the payload, in the order they're written
+COLUMN_SIZES = (16, 6, 1, 1, 1, 8, 8, 8, 8, 8)
+MISSING = math.nan
+
+
+def _encode_block(orders: List[OrderRecord]) -> bytes:
+    count = len(orders)
+    keys = struct.pack(f"<{count}Q", *[order.id & KEY_MASK for order in orders])
+    payload = zlib.compress(b"".join((
+        b"".join(order.id.to_bytes(16, "big") for order in orders),
+        b"".join(symbols.names[order.symbol].encode("ascii").ljust(6, b"\0") for order in orders),
+        bytes(order.side for order in orders),
+        bytes(order.order_type for order in orders),
+        bytes(order.status for order in orders),
+        struct.pack(f"<{count}d", *[order.quantity for order in orders]),
+        struct.pack(f"<{count}d", *[MISSING if order.price is None else order.price for order in orders]),
+        struct.pack(f"<{count}q", *[order.created_at for order in orders]),
+        struct.pack(f"<{count}d", *[order.filled_quantity for order in orders]),
+        struct.pack(f"<{count}d", *[MISSING if order.average_price is None else order.average_price
+                                    for order in orders]))), 1)
+    return BLOCK_HEADER.pack(BLOCK_MAGIC, count, len(payload), zlib.crc32(payload, zlib.crc32(keys))) + keys + payload
+
+
+def _decode_order(columns: bytes, count: int, order_id: int) -> Optional[OrderRecord]:
+    # the order with order_id out of a block's decompressed columns, None if it isn't in there
+    wanted = order_id.to_bytes(16, "big")
+    index = columns.find(wanted, 0, 16 * count)
+    while index % 16:
+        index = columns.find(wanted, index + 1, 16 * count)
+    if index < 0:
+        return None
+    row = index // 16
+    offsets = []
+    offset = 0
+    for size in COLUMN_SIZES:
+        offsets.append(offset + row * size)
+        offset += size * count
+    _, pair, side, order_type, status, quantity, price, created_at, filled, average = offsets
+    price = struct.unpack_from("<d", columns, price)[0]
+    average = struct.unpack_from("<d", columns, average)[0]
+    return OrderRecord(order_id, symbols.intern(columns[pair:pair + 6].rstrip(b"\0").decode("ascii")),
+                       struct.unpack_from("<d", columns, quantity)[0], columns[side], columns[order_type],
+                       None if price != price else price, columns[status],
+                       struct.unpack_from("<q", columns, created_at)[0], struct.unpack_from("<d", columns, filled)[0],
+                       None if average != average else average)
+
+
+class Segment:
+    __slots__ = ("number", "path", "size", "orders", "written_at")
+
+    def __init__(self, number: int, path: str, size: int = 0, written_at: float = 0.0):
+        self.number = number
+        self.path = path
+        self.size = size
+        self.orders = 0
+        # time of the last write, what the retention goes by
+        self.written_at = written_at
+
+
+class OrderArchive:
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, retention: float = 0,
+                 max_bytes: int = 0, durable: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        # seconds segments are kept after their last write and size of the whole archive, 0 for no limit
+        self.retention = retention
+        self.max_bytes = max_bytes
+        # fsync every append, so the write-ahead log never records an archived order that isn't on disk
+        self.durable = durable
+        self.segments: Dict[int, Segment] = {}
+        self._file = None
+        self._current: Optional[Segment] = None
+        # block number -> segment number and offset of the block in it
+        self._block_segment = array("I")
+        self._block_offset = array("Q")
+        # key -> block number index, entries of deleted segments are only dropped once they're the majority
+        self._keys = [bytearray() for _ in range(INDEX_BUCKETS)]
+        self._blocks = [array("I") for _ in range(INDEX_BUCKETS)]
+        self._entries = 0
+        self._dead_entries = 0
+        # the last block read, lookups of orders archived together often come together
+        self._cached: Tuple[int, Tuple[int, bytes]] = (-1, (0, b""))
+        # guards the index and the segments, only held for memory operations so lookups never wait on the disk.
+        # appends, rolls and expiry also take the write lock first, for the files
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._entries - self._dead_entries
+
+    def __contains__(self, order_id: int) -> bool:
+        return self.get(order_id) is not None
+
+    @property
+    def size(self) -> int:
+        return sum(segment.size for segment in list(self.segments.values()))
+
+    def open(self, keep: bool = True):
+        # index the segments already on disk, or delete them when the orders they belong to are gone (no
+        # write-ahead log to recover those from)
+        os.makedirs(self.directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            number = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            if not number.isdigit():
+                continue
+            path = os.path.join(self.directory, name)
+            if not keep:
+                os.remove(path)
+                continue
+            with self._lock:
+                self._load(Segment(int(number), path, written_at=os.path.getmtime(path)))
+        if self.segments:
+            logger.info("Opened %d archive segment(s) holding %d order(s)", len(self.segments), len(self))
+
+    def _load(self, segment: Segment):
+        with open(segment.path, "rb") as file:
+            data = file.read()
+        offset = 0
+        while offset + BLOCK_HEADER.size <= len(data):
+            magic, count, length, checksum = BLOCK_HEADER.unpack_from(data, offset)
+            keys_end = offset + BLOCK_HEADER.size + 8 * count
+            end = keys_end + length
+            if magic != BLOCK_MAGIC or end > len(data) or \
+                    zlib.crc32(data[keys_end:end], zlib.crc32(data[offset + BLOCK_HEADER.size:keys_end])) != checksum:
+                break
+            self._index(segment, offset, struct.unpack_from(f"<{count}Q", data, offset + BLOCK_HEADER.size))
+            offset = end
+        if offset < len(data):
+            # torn write at the tail of the segment, nothing after it was archived
+            logger.warning("Truncating archive segment %s after %d byte(s)", segment.path, offset)
+            os.truncate(segment.path, offset)
+        segment.size = offset
+        self.segments[segment.number] = segment
+
+    def _index(self, segment: Segment, offset: int, keys):
+        block = len(self._block_offset)
+        self._block_segment.append(segment.number)
+        self._block_offset.append(offset)
+        for key in keys:
+            bucket = key & (INDEX_BUCKETS - 1)
+            self._keys[bucket] += key.to_bytes(8, "little")
+            self._blocks[bucket].append(block)
+        segment.orders += len(keys)
+        self._entries += len(keys)
+
+    def append(self, orders: List[OrderRecord]):
+        # archive finished orders, they're compressed before the lock is taken
+        blocks = [(orders[i:i + BLOCK_ORDERS], _encode_block(orders[i:i + BLOCK_ORDERS]))
+                  for i in range(0, len(orders), BLOCK_ORDERS)]
+        with self._write_lock:
+            written = []
+            for block_orders, block in blocks:
+                if self._current is None or self._current.size >= self.segment_bytes:
+                    self._roll()
+                segment = self._current
+                self._file.write(block)
+                written.append((segment, segment.size, [order.id & KEY_MASK for order in block_orders]))
+                segment.size += len(block)
+            if blocks:
+                self._file.flush()
+                if self.durable:
+                    os.fsync(self._file.fileno())
+                self._current.written_at = time.time()
+            # indexed once they're on disk, lookups find them from then on
+            with self._lock:
+                for segment, offset, keys in written:
+                    self._index(segment, offset, keys)
+
+    def _roll(self):
+        # start a new segment, numbered after the last one
+        if self._file is not None:
+            self._file.close()
+        number = max(self.segments, default=0) + 1
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._current = Segment(number, path, written_at=time.time())
+        with self._lock:
+            self.segments[number] = self._current
+
+    def get(self, order_id: int) -> Optional[OrderRecord]:
+        key = order_id & KEY_MASK
+        bucket = key & (INDEX_BUCKETS - 1)
+        wanted = key.to_bytes(8, "little")
+        # the blocks that may hold the order are looked up under the lock, they're read without it
+        candidates = []
+        with self._lock:
+            keys = self._keys[bucket]
+            index = keys.find(wanted)
+            while index >= 0:
+                if index % 8 == 0:
+                    block = self._blocks[bucket][index // 8]
+                    segment = self.segments.get(self._block_segment[block])
+                    if segment is not None:
+                        candidates.append((block, segment.path, self._block_offset[block]))
+                index = keys.find(wanted, index + 1)
+        for block, path, offset in candidates:
+            try:
+                count, columns = self._read(block, path, offset)
+            except FileNotFoundError:
+                # the segment expired since
+                continue
+            order = _decode_order(columns, count, order_id)
+            if order is not None:
+                return order
+        return None
+
+    def _read(self, block: int, path: str, offset: int) -> Tuple[int, bytes]:
+        # the order count and decompressed columns of a block
+        cached_block, cached = self._cached
+        if cached_block == block:
+            return cached
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            _, count, length, _ = BLOCK_HEADER.unpack(os.pread(fd, BLOCK_HEADER.size, offset))
+            payload = os.pread(fd, length, offset + BLOCK_HEADER.size + 8 * count)
+        finally:
+            os.close(fd)
+        result = count, zlib.decompress(payload)
+        self._cached = block, result
+        return result
+
+    def expire(self, now: Optional[float] = None) -> int:
+        # delete the segments past the retention, then the oldest ones while the archive is over its size
+        # limit, returns the number of orders deleted with them
+        now = time.time() if now is None else now
+        deleted = 0
+        with self._write_lock:
+            for number in sorted(self.segments):
+                segment = self.segments[number]
+                expired = self.retention and segment.written_at < now - self.retention
+                if not expired and not (self.max_bytes and self.size > self.max_bytes):
+                    break
+                deleted += self._delete(segment)
+            if self._dead_entries > self._entries - self._dead_entries:
+                with self._lock:
+                    self._compact_index()
+        if deleted:
+            logger.info("Deleted %d archived order(s)", deleted)
+        return deleted
+
+    def _delete(self, segment: Segment) -> int:
+        if segment is self._current:
+            self._file.close()
+            self._file = self._current = None
+        with self._lock:
+            del self.segments[segment.number]
+            self._dead_entries += segment.orders
+        os.remove(segment.path)
+        return segment.orders
+
+    def _compact_index(self):
+        # drop the index entries of deleted segments, a bucket at a time with NumPy
+        live = np.isin(np.frombuffer(self._block_segment.tobytes(), np.uint32),
+                       np.array(list(self.segments), dtype=np.uint32))
+        for bucket in range(INDEX_BUCKETS):
+            blocks = np.frombuffer(self._blocks[bucket].tobytes(), np.uint32)
+            kept = live[blocks]
+            self._keys[bucket] = bytearray(np.frombuffer(bytes(self._keys[bucket]), np.uint64)[kept].tobytes())
+            self._blocks[bucket] = array("I", blocks[kept].tobytes())
+        self._entries -= self._dead_entries
+        self._dead_entries = 0
+
+    def close(self):
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = self._current = None
+
+
+class Archiver:
+    # moves finished orders of a store to its archive every interval, see OrderStore.archive
+    def __init__(self, store, interval: float, after: float, max_finished: int = 0):
+        self.store = store
+        self.interval = interval
+        self.after = after
+        self.max_finished = max_finished
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # compressing and writing take a while, they run off the event loop
+                archived = await loop.run_in_executor(None, self.sweep)
+                if archived:
+                    logger.info("Archived %d finished order(s)", archived)
+            except Exception as e:
+                logger.error("Archiving orders failed: %s", e)
+
+    def sweep(self) -> int:
+        archived = self.store.archive(now_timestamp() - int(self.after * 1_000_000), self.max_finished)
+        self.store.cold.expire()
+        return archived
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,87 @@
+# compact binary encoding of websocket order updates, for clients that connect with the "trading.binary.v2"
+# subprotocol. every update is one fixed-layout little-endian record of UPDATE.size bytes, a frame carrying
+# several updates holds their records back to back:
+#   seq         u64   sequence number of the update, see websocket_manager.py
+#   epoch       u32   the sequence numbers' epoch, it changes when the server restarts
+#   action      u8    index into ACTIONS
+#   id          16 B  the order's uuid, big-endian like uuid.UUID.bytes
+#   stocks      6 B   currency pair, ASCII padded with NUL bytes, instruments.py only takes pairs that fit
+#   side        u8    0 none, 1 BUY, 2 SELL
+#   order_type  u8    0 none, 1 LIMIT, 2 MARKET
+#   status      u8    0 PENDING, 1 EXECUTED, 2 CANCELED
+#   quantity, price                   f64, price NaN when not set
+#   created_at                        i64, microseconds since the epoch
+#   filled_quantity, average_price    f64, average price NaN when nothing was filled
+#   fill price, fill quantity         f64, the fill an update reports, NaN for updates that aren't fills
+import json
+import math
+import struct
+import uuid
+from datetime import datetime
+from typing import List
+
+from order_record import (ORDER_TYPE_CODES, ORDER_TYPES, SIDE_CODES, SIDES, STATUS_CODES, STATUSES, OrderRecord,
+                          format_timestamp, symbols, to_timestamp)
+
+BINARY_SUBPROTOCOL = "trading.binary.v2"
+ACTIONS = ("new_order", "order_executed", "order_cancelled", "order_partially_filled")
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+# longest currency pair a record holds
+SYMBOL_SIZE = 6
+# records are encoded without their sequence number and epoch, they're prefixed once the update is numbered
+SEQUENCE = struct.Struct("<QI")
+RECORD = struct.Struct(f"<B16s{SYMBOL_SIZE}sBBBddqdddd")
+UPDATE = struct.Struct(f"<QIB16s{SYMBOL_SIZE}sBBBddqdddd")
+
+NAN = math.nan
+
+
+def _optional(value: float) -> float:
+    return NAN if value is None else value
+
+
+def encode_update(message: dict) -> bytes:
+    # message is an order update as published, {"action": ..., "data": OrderRecord, "fill": {...}}
+    order = message["data"]
+    fill = message.get("fill")
+    return RECORD.pack(ACTION_CODES[message["action"]], order.id.to_bytes(16, "big"),
+                       symbols.names[order.symbol].encode("ascii"), order.side, order.order_type, order.status,
+                       order.quantity, _optional(order.price), order.created_at, order.filled_quantity,
+                       _optional(order.average_price), fill["price"] if fill else NAN,
+                       fill["quantity"] if fill else NAN)
+
+
+def from_json(text: str) -> dict:
+    # an update as published from its JSON message, for updates another worker published
+    message = json.loads(text)
+    data = message["data"]
+    message["data"] = OrderRecord(uuid.UUID(data["id"]).int, symbols.intern(data["stocks"]), data["quantity"],
+                                  SIDE_CODES[data["side"]], ORDER_TYPE_CODES[data["order_type"]], data["price"],
+                                  STATUS_CODES[data["status"]], to_timestamp(datetime.fromisoformat(data["created_at"])),
+                                  data["filled_quantity"], data["average_price"])
+    return message
+
+
+def with_seq(record: bytes, seq: int, epoch: int) -> bytes:
+    return SEQUENCE.pack(seq, epoch) + record
+
+
+def _number(value: float):
+    return None if math.isnan(value) else value
+
+
+def decode_frame(frame: bytes) -> List[dict]:
+    # the updates of a binary frame in the shape of the JSON messages, for clients written in Python
+    messages = []
+    for (seq, epoch, action, order_id, stocks, side, order_type, status, quantity, price, created_at, filled_quantity,
+         average_price, fill_price, fill_quantity) in UPDATE.iter_unpack(frame):
+        message = {"seq": seq, "epoch": epoch, "action": ACTIONS[action],
+                   "data": {"stocks": stocks.rstrip(b"\0").decode("ascii"), "quantity": quantity,
+                            "side": SIDES[side], "order_type": ORDER_TYPES[order_type], "price": _number(price),
+                            "id": str(uuid.UUID(bytes=order_id)), "status": STATUSES[status],
+                            "created_at": format_timestamp(created_at), "filled_quantity": filled_quantity,
+                            "average_price": _number(average_price)}}
+        if not math.isnan(fill_price):
+            message["fill"] = {"price": fill_price, "quantity": fill_quantity}
+        messages.append(message)
+    return messages
@@ -0,0 +1,84 @@
+# JSON encoding of orders for REST responses and websocket frames. orders are validated once when they
+# come in, so on the way out their encoded bytes are cached and spliced into responses and frames as is,
+# instead of building a pydantic model per order and encoding it again for every response and broadcast.
+# the output matches what FastAPI produced from the response models: same keys, order and compact separators
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Response
+
+from order_record import ORDER_TYPES, SIDES, STATUSES, OrderRecord, format_id, format_timestamp, symbols
+
+
+# encoded enum values, indexed by their codes
+SIDES_JSON = [json.dumps(side) for side in SIDES]
+ORDER_TYPES_JSON = [json.dumps(order_type) for order_type in ORDER_TYPES]
+STATUSES_JSON = [json.dumps(status) for status in STATUSES]
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _number(value: Optional[float]) -> str:
+    # what json.dumps writes for a float or None
+    return "null" if value is None else float.__repr__(value)
+
+
+class OrderEncoder:
+    def __init__(self, max_size: int = 10000):
+        # order id -> (status, filled quantity, encoded order), the state an entry was encoded in is kept
+        # with it so it is only served until the order changes. once full the oldest entries are evicted
+        self.max_size = max_size
+        self._cache: Dict[int, Tuple[int, float, bytes]] = {}
+        # encoded currency pair names, indexed by symbol code
+        self._symbols: List[str] = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def order(self, order: OrderRecord) -> bytes:
+        entry = self._cache.get(order.id)
+        if entry is not None and entry[0] == order.status and entry[1] == order.filled_quantity:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        encoded = self._encode(order)
+        if entry is None and len(self._cache) >= self.max_size:
+            del self._cache[next(iter(self._cache))]
+        self._cache[order.id] = (order.status, order.filled_quantity, encoded)
+        return encoded
+
+    def _encode(self, order: OrderRecord) -> bytes:
+        if len(self._symbols) < len(symbols.names):
+            self._symbols.extend(json.dumps(name) for name in symbols.names[len(self._symbols):])
+        return (f'{{"stocks":{self._symbols[order.symbol]},"quantity":{_number(order.quantity)},'
+                f'"side":{SIDES_JSON[order.side]},"order_type":{ORDER_TYPES_JSON[order.order_type]},'
+                f'"price":{_number(order.price)},"id":"{format_id(order.id)}",'
+                f'"status":{STATUSES_JSON[order.status]},"created_at":"{format_timestamp(order.created_at)}",'
+                f'"filled_quantity":{_number(order.filled_quantity)},"average_price":{_number(order.average_price)}}}'
+                ).encode()
+
+    def orders(self, orders: Iterable[OrderRecord]) -> bytes:
+        return b"[" + b",".join(self.order(order) for order in orders) + b"]"
+
+    def message(self, message: dict) -> str:
+        # websocket frame of an order update, the order under "data" is spliced in from the cache
+        parts = []
+        for key, value in message.items():
+            encoded = self.order(value).decode() if key == "data" else _dumps(value)
+            parts.append(f'"{key}":{encoded}')
+        return "{" + ",".join(parts) + "}"
+
+    def batch_result(self, index: int, order: Optional[OrderRecord] = None, detail: Optional[str] = None) -> bytes:
+        # one item of a batch order response, the encoded BatchOrderResult
+        if order is not None:
+            return b'{"index":%d,"success":true,"order":%s,"detail":null}' % (index, self.order(order))
+        return b'{"index":%d,"success":false,"order":null,"detail":%s}' % (index, _dumps(detail).encode())
+
+
+class OrderJSONResponse(Response):
+    # a response whose body is already encoded JSON, skips response_model validation and serialization
+    media_type = "application/json"
@@ -0,0 +1,116 @@
+# compact order representation: 128-bit integer ids, interned currency pair codes, small int enums and
+# integer timestamps. the order store keeps them column-wise and hands out OrderRecords, which are
+# only encoded to the API's JSON at the boundary (see order_json.py)
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+PENDING, EXECUTED, CANCELED = 0, 1, 2
+STATUSES = ("PENDING", "EXECUTED", "CANCELED")
+STATUS_CODES = {name: code for code, name in enumerate(STATUSES)}
+# index 0 stands for "not set"
+SIDES = (None, "BUY", "SELL")
+SIDE_CODES = {name: code for code, name in enumerate(SIDES)}
+ORDER_TYPES = (None, "LIMIT", "MARKET")
+ORDER_TYPE_CODES = {name: code for code, name in enumerate(ORDER_TYPES)}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class SymbolTable:
+    # currency pair <-> small int code, codes are only meaningful inside one process
+    def __init__(self):
+        self.names: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+symbols = SymbolTable()
+
+
+def new_id() -> int:
+    return uuid.uuid4().int
+
+
+def parse_id(order_id: str) -> Optional[int]:
+    # the integer id of a uuid string, None when it isn't one
+    try:
+        return uuid.UUID(order_id).int
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def format_id(order_id: int) -> str:
+    # same as str(uuid.UUID(int=order_id)) without building the UUID
+    digits = f"{order_id:032x}"
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+
+def now_timestamp() -> int:
+    # microseconds since the epoch
+    return time.time_ns() // 1000
+
+
+def to_timestamp(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // MICROSECOND
+
+
+def format_timestamp(value: int) -> str:
+    # ISO string in UTC, the way pydantic writes datetimes (no fraction when there are no microseconds)
+    return (EPOCH + value * MICROSECOND).isoformat().replace("+00:00", "Z")
+
+
+class OrderRecord:
+    __slots__ = ("id", "symbol", "quantity", "side", "order_type", "price", "status", "created_at",
+                 "filled_quantity", "average_price")
+
+    def __init__(self, order_id: int, symbol: int, quantity: float, side: int = 0, order_type: int = 0,
+                 price: Optional[float] = None, status: int = PENDING, created_at: int = 0,
+                 filled_quantity: float = 0.0, average_price: Optional[float] = None):
+        self.id = order_id
+        self.symbol = symbol
+        self.quantity = quantity
+        self.side = side
+        self.order_type = order_type
+        self.price = price
+        self.status = status
+        self.created_at = created_at
+        self.filled_quantity = filled_quantity
+        self.average_price = average_price
+
+    @property
+    def stocks(self) -> str:
+        return symbols.names[self.symbol]
+
+    def to_state(self) -> dict:
+        # persisted shape used by the write-ahead log, codes stay codes except for the currency pair
+        # since symbol codes aren't stable between runs
+        return {"id": self.id, "symbol": symbols.names[self.symbol], "quantity": self.quantity, "side": self.side,
+                "order_type": self.order_type, "price": self.price, "status": self.status,
+                "created_at": self.created_at, "filled_quantity": self.filled_quantity,
+                "average_price": self.average_price}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "OrderRecord":
+        return cls(state["id"], symbols.intern(state["symbol"]), state["quantity"], state["side"], state["order_type"],
+                   state["price"], state["status"], state["created_at"], state["filled_quantity"],
+                   state["average_price"])
+
+    def __reduce__(self):
+        # symbol codes differ between processes, so records cross them by currency pair name
+        return _unpickle, (self.id, symbols.names[self.symbol], self.quantity, self.side, self.order_type, self.price,
+                           self.status, self.created_at, self.filled_quantity, self.average_price)
+
+
+def _unpickle(order_id, stocks, *fields) -> OrderRecord:
+    return OrderRecord(order_id, symbols.intern(stocks), *fields)
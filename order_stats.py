@@ -0,0 +1,125 @@
+# order aggregates kept up to date by the order store on every change, so dashboards read counts,
+# quantities and rates in constant time instead of scanning the orders. per currency pair: orders by
+# status, the unfilled quantity of pending orders and the filled quantity (partial fills included), and
+# rolling rates of created, executed and canceled orders
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from order_record import CANCELED, EXECUTED, PENDING, STATUSES, OrderRecord, symbols
+
+# rolling rate windows in seconds, by the name they're reported under
+RATE_WINDOWS = {"10s": 10, "1m": 60, "5m": 300}
+# what rates are kept for, by the status an order arrives in
+RATE_EVENTS = {PENDING: "created", EXECUTED: "executed", CANCELED: "canceled"}
+# decimal places quantities are reported with, sums of adds and subtracts leave float noise behind
+QUANTITY_DECIMALS = 8
+
+
+def totals(orders: Iterable[OrderRecord]) -> Dict[str, List[float]]:
+    # per currency pair name the order counts by status code followed by the filled quantity, what the
+    # aggregates of orders that left the store for the archive are logged as
+    result = {}
+    for order in orders:
+        total = result.setdefault(symbols.names[order.symbol], [0] * len(STATUSES) + [0.0])
+        total[order.status] += 1
+        total[-1] += order.filled_quantity
+    return result
+
+
+def merge_totals(into: Dict[str, List[float]], other: Dict[str, List[float]]):
+    for name, total in other.items():
+        current = into.setdefault(name, [0] * len(STATUSES) + [0.0])
+        for index, value in enumerate(total):
+            current[index] += value
+
+
+class RollingCounter:
+    # events per second over the last span seconds, counted in one bucket per second that is reset
+    # when the ring comes back around to it
+    def __init__(self, span: int = max(RATE_WINDOWS.values())):
+        self.span = span
+        self.counts = [0] * span
+        self.seconds = [-1] * span
+
+    def add(self, count: int = 1, now: Optional[float] = None):
+        second = int(time.time() if now is None else now)
+        index = second % self.span
+        if self.seconds[index] != second:
+            self.seconds[index] = second
+            self.counts[index] = 0
+        self.counts[index] += count
+
+    def rate(self, window: int, now: Optional[float] = None) -> float:
+        second = int(time.time() if now is None else now)
+        return sum(count for count, at in zip(self.counts, self.seconds) if second - window < at <= second) / window
+
+
+class PairStats:
+    __slots__ = ("orders", "pending_quantity", "executed_quantity")
+
+    def __init__(self):
+        # order count by status code
+        self.orders = [0] * len(STATUSES)
+        self.pending_quantity = 0.0
+        self.executed_quantity = 0.0
+
+
+class OrderStats:
+    def __init__(self):
+        # symbol code -> aggregates of the pair
+        self.pairs: Dict[int, PairStats] = defaultdict(PairStats)
+        self.rates = {event: RollingCounter() for event in RATE_EVENTS.values()}
+
+    def added(self, order: OrderRecord, recovered: bool = False):
+        # recovered orders count towards the totals but weren't just created
+        pair = self.pairs[order.symbol]
+        pair.orders[order.status] += 1
+        if order.status == PENDING:
+            pair.pending_quantity += order.quantity - order.filled_quantity
+        pair.executed_quantity += order.filled_quantity
+        if not recovered:
+            self.rates["created"].add()
+
+    def restore(self, archived: Dict[str, List[float]]):
+        # count the archived orders of totals() back in after a restart, only loaded orders are added()
+        for name, total in archived.items():
+            pair = self.pairs[symbols.intern(name)]
+            for status in range(len(STATUSES)):
+                pair.orders[status] += int(total[status])
+            pair.executed_quantity += total[-1]
+
+    def filled(self, symbol: int, quantity: float):
+        # part of a pending order filled
+        pair = self.pairs[symbol]
+        pair.pending_quantity -= quantity
+        pair.executed_quantity += quantity
+
+    def transitioned(self, symbol: int, from_status: int, to_status: int, remaining: float):
+        # an order left from_status with remaining quantity unfilled, which an execution fills
+        pair = self.pairs[symbol]
+        pair.orders[from_status] -= 1
+        pair.orders[to_status] += 1
+        if from_status == PENDING:
+            pair.pending_quantity -= remaining
+        if to_status == EXECUTED:
+            pair.executed_quantity += remaining
+        event = RATE_EVENTS.get(to_status)
+        if event is not None:
+            self.rates[event].add()
+
+    def snapshot(self) -> dict:
+        # plain data keyed by names, it crosses processes when workers share state
+        now = time.time()
+        orders = [0] * len(STATUSES)
+        pairs = {}
+        for symbol, pair in self.pairs.items():
+            orders = [total + count for total, count in zip(orders, pair.orders)]
+            pairs[symbols.names[symbol]] = {
+                "orders": dict(zip(STATUSES, pair.orders)),
+                "pending_quantity": round(pair.pending_quantity, QUANTITY_DECIMALS),
+                "executed_quantity": round(pair.executed_quantity, QUANTITY_DECIMALS)}
+        return {"orders": dict(zip(STATUSES, orders)),
+                "pairs": dict(sorted(pairs.items())),
+                "rates": {name: {event: round(counter.rate(window, now), 3) for event, counter in self.rates.items()}
+                          for name, window in RATE_WINDOWS.items()}}
@@ -0,0 +1,406 @@
+# in-memory order storage indexed by id, status and currency pair.
+# orders are kept column-wise in typed arrays indexed by position, and the indexes only map integer ids
+# to positions, so millions of orders cost no per-order Python object besides the id and nothing the
+# garbage collector has to traverse. OrderRecord is only materialized for callers.
+# with an archive (order_archive.py) this is the hot tier: finished orders move to the archive once old
+# enough, their rows are skipped from then on and dropped when the columns are compacted, so memory
+# follows the number of live orders instead of every order of the day
+import bisect
+import math
+import threading
+from array import array
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from instruments import from_lots, to_lots
+from order_archive import OrderArchive
+from order_record import EXECUTED, PENDING, OrderRecord, format_id, symbols
+from order_stats import OrderStats, merge_totals, totals
+
+logger = logging.getLogger(__name__)
+
+# stands in for a missing price in the float columns
+MISSING = math.nan
+# the typed columns besides the ids, compaction copies them the same way
+COLUMNS = ("number", "symbol", "quantity", "side", "order_type", "price", "status", "created_at", "filled_quantity",
+           "average_price")
+# a status filter seeks through the status index when fewer than one in this many of the scanned orders have
+# that status, sorting the index costs more than a scan that finds a page of matches quickly
+STATUS_SEEK_RATIO = 8
+# archived rows stay in the columns until they outnumber the others and there are at least this many
+COMPACT_MIN_ROWS = 10_000
+
+
+def _stored(value: Optional[float]) -> float:
+    return MISSING if value is None else value
+
+
+def _loaded(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+class OrderColumns:
+    # the orders in memory with their indexes, one row per order in creation order. compaction builds a new
+    # set and the store swaps it in with one assignment, so reads that don't take the lock work on one
+    # consistent set
+    def __init__(self):
+        # primary index, integer id -> position
+        self.positions: Dict[int, int] = {}
+        # one column per order field, indexed by position. number counts orders in creation order and
+        # doubles as pagination cursor, unlike positions it survives compaction
+        self.ids: List[int] = []
+        self.number = array("q")
+        self.symbol = array("H")
+        self.quantity = array("d")
+        self.side = array("b")
+        self.order_type = array("b")
+        self.price = array("d")
+        self.status = array("b")
+        self.created_at = array("q")
+        self.filled_quantity = array("d")
+        self.average_price = array("d")
+        # 1 for rows whose order was archived, they're out of the indexes and skipped by scans
+        self.archived = bytearray()
+        self.archived_rows = 0
+        # secondary indexes, status code -> insertion ordered id -> position mapping and
+        # currency pair code -> ascending positions
+        self.by_status: Dict[int, Dict[int, int]] = defaultdict(dict)
+        self.by_pair: Dict[int, array] = defaultdict(lambda: array("q"))
+
+    def record(self, position: int) -> OrderRecord:
+        return OrderRecord(self.ids[position], self.symbol[position], self.quantity[position],
+                           self.side[position], self.order_type[position], _loaded(self.price[position]),
+                           self.status[position], self.created_at[position], self.filled_quantity[position],
+                           _loaded(self.average_price[position]))
+
+    def copy(self) -> "OrderColumns":
+        # the columns as they are now without the indexes, enough to build the records from
+        copied = OrderColumns()
+        for name in COLUMNS:
+            setattr(copied, name, getattr(self, name)[:])
+        copied.ids = self.ids[:]
+        copied.archived = self.archived[:]
+        return copied
+
+    def states(self) -> List[dict]:
+        # every order that isn't archived in its persisted shape
+        return [self.record(position).to_state() for position in range(len(self.ids)) if not self.archived[position]]
+
+    def compacted(self) -> "OrderColumns":
+        # a copy without the archived rows, the indexes keep their order
+        kept = np.flatnonzero(np.frombuffer(bytes(self.archived), np.uint8) == 0)
+        compacted = OrderColumns()
+        for name in COLUMNS:
+            column = getattr(self, name)
+            setattr(compacted, name, array(column.typecode, np.array(column)[kept].tobytes()))
+        compacted.ids = [self.ids[position] for position in kept.tolist()]
+        compacted.archived = bytearray(len(compacted.ids))
+        compacted.positions = dict(zip(compacted.ids, range(len(compacted.ids))))
+        # old position -> new position, -1 for the archived rows
+        moved = np.full(len(self.ids), -1, dtype=np.int64)
+        moved[kept] = np.arange(len(kept))
+        new_positions = moved.tolist()
+        for status, orders in self.by_status.items():
+            compacted.by_status[status] = {order_id: new_positions[position] for order_id, position in orders.items()}
+        for symbol, positions in self.by_pair.items():
+            remaining = moved[np.array(positions)]
+            compacted.by_pair[symbol] = array("q", remaining[remaining >= 0].tobytes())
+        return compacted
+
+
+class OrderStore:
+    def __init__(self, journal=None, cold: Optional[OrderArchive] = None):
+        # optional write-ahead log, every change is appended to it under the store lock
+        self.journal = journal
+        if journal is not None:
+            journal.snapshot_source = self.snapshot_state
+        # optional cold tier finished orders are archived to, see archive()
+        self.cold = cold
+        self._columns = OrderColumns()
+        self._next_number = 0
+        # aggregates by currency pair, updated with every change under the lock
+        self._stats = OrderStats()
+        # aggregates of the archived orders by currency pair, see order_stats.totals. archived orders aren't in
+        # the journal's snapshots, their aggregates go in there instead so the stats survive a restart
+        self._archived_totals: Dict[str, List[float]] = {}
+        # guards every mutation so status transitions are check-and-set
+        self._lock = threading.Lock()
+        # one archive pass at a time
+        self._archiving = threading.Lock()
+        # whether claim_pending() handed the pending orders out already
+        self._pending_claimed = False
+
+    def __len__(self) -> int:
+        # orders in memory, archived ones aren't counted
+        return len(self._columns.positions)
+
+    def __iter__(self) -> Iterator[OrderRecord]:
+        columns = self._columns
+        return (columns.record(position) for position in range(len(columns.ids)) if not columns.archived[position])
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._columns.positions or (self.cold is not None and order_id in self.cold)
+
+    def add(self, order: OrderRecord):
+        # insert a new order and register it in the secondary indexes
+        self.add_many([order])
+
+    def add_many(self, orders: List[OrderRecord]):
+        # insert several orders under a single lock acquisition, nothing is inserted on duplicates
+        with self._lock:
+            seen = set()
+            for order in orders:
+                if order.id in self._columns.positions or order.id in seen:
+                    raise KeyError(f"Duplicate order id: {format_id(order.id)}")
+                seen.add(order.id)
+            for order in orders:
+                self._insert(order)
+
+    def load(self, orders: Iterable[dict]) -> List[OrderRecord]:
+        # bulk insert recovered orders (in their persisted shape) in creation order, without logging them again
+        with self._lock:
+            records = [OrderRecord.from_state(order) for order in orders]
+            for record in records:
+                self._insert(record, journal=False)
+            return records
+
+    def _insert(self, order: OrderRecord, journal: bool = True):
+        if journal and self.journal is not None:
+            self.journal.append("add", order=order.to_state())
+        columns = self._columns
+        position = len(columns.ids)
+        # the id column and the indexes go last, lookups and scans don't take the lock and only
+        # reach positions whose columns are complete
+        columns.number.append(self._next_number)
+        columns.symbol.append(order.symbol)
+        columns.quantity.append(order.quantity)
+        columns.side.append(order.side)
+        columns.order_type.append(order.order_type)
+        columns.price.append(_stored(order.price))
+        columns.status.append(order.status)
+        columns.created_at.append(order.created_at)
+        columns.filled_quantity.append(order.filled_quantity)
+        columns.average_price.append(_stored(order.average_price))
+        columns.archived.append(0)
+        columns.ids.append(order.id)
+        columns.positions[order.id] = position
+        columns.by_status[order.status][order.id] = position
+        columns.by_pair[order.symbol].append(position)
+        self._next_number += 1
+        self._stats.added(order, recovered=not journal)
+
+    def get(self, order_id: int, cold: bool = True) -> Optional[OrderRecord]:
+        # the order from memory, or from the archive once it was moved there. archive lookups read the disk,
+        # cold=False skips them for callers that only want orders that can still change
+        columns = self._columns
+        position = columns.positions.get(order_id)
+        if position is not None:
+            return columns.record(position)
+        return self.cold.get(order_id) if cold and self.cold is not None else None
+
+    def transition(self, order_id: int, from_status: int, to_status: int) -> Optional[OrderRecord]:
+        # atomically move an order between statuses, returns None if the order
+        # doesn't exist or is no longer in from_status
+        with self._lock:
+            return self._transition(order_id, from_status, to_status)
+
+    def transition_many(self, order_ids: List[int], from_status: int, to_status: int,
+                        fill_prices: Optional[Dict[str, Tuple[float, ...]]] = None) -> List[Optional[OrderRecord]]:
+        # transition several orders under a single lock acquisition, results line up with order_ids.
+        # fill_prices (pair -> price by side code) prices what executing an order fills
+        with self._lock:
+            return [self._transition(order_id, from_status, to_status, fill_prices) for order_id in order_ids]
+
+    def _transition(self, order_id: int, from_status: int, to_status: int,
+                    fill_prices: Optional[Dict[str, Tuple[float, ...]]] = None) -> Optional[OrderRecord]:
+        columns = self._columns
+        position = columns.positions.get(order_id)
+        if position is None or columns.status[position] != from_status:
+            return None
+        del columns.by_status[from_status][order_id]
+        columns.status[position] = to_status
+        fields = {"status": to_status}
+        filled = columns.filled_quantity[position]
+        quantity = columns.quantity[position]
+        self._stats.transitioned(columns.symbol[position], from_status, to_status, quantity - filled)
+        if to_status == EXECUTED:
+            # an executed order is always fully filled, what was left fills at the given price if there is one
+            prices = fill_prices.get(symbols.names[columns.symbol[position]]) if fill_prices else None
+            if prices is not None and quantity > filled:
+                price = prices[columns.side[position]]
+                if filled:
+                    price = (_loaded(columns.average_price[position]) * filled + price * (quantity - filled)) / quantity
+                columns.average_price[position] = fields["average_price"] = price
+            columns.filled_quantity[position] = quantity
+        fields["filled_quantity"] = columns.filled_quantity[position]
+        if self.journal is not None:
+            self.journal.append("update", id=order_id, fields=fields)
+        columns.by_status[to_status][order_id] = position
+        return columns.record(position)
+
+    def apply_fill(self, order_id: int, quantity: float, price: float,
+                   lot_size: Optional[float] = None) -> Optional[OrderRecord]:
+        # record a fill on a pending order and execute it once fully filled, returns None if
+        # the order doesn't exist or isn't pending anymore. with the pair's lot_size the filled quantity is kept on
+        # the lot grid, and an order within half a lot of its quantity is fully filled
+        with self._lock:
+            columns = self._columns
+            position = columns.positions.get(order_id)
+            if position is None or columns.status[position] != PENDING:
+                return None
+            previous = columns.filled_quantity[position]
+            filled = previous + quantity
+            if lot_size is not None:
+                filled = from_lots(to_lots(filled, lot_size), lot_size)
+            notional = (_loaded(columns.average_price[position]) or 0) * previous + price * quantity
+            columns.average_price[position] = notional / filled
+            columns.filled_quantity[position] = filled
+            self._stats.filled(columns.symbol[position], quantity)
+            if self.journal is not None:
+                self.journal.append("update", id=order_id,
+                                    fields={"filled_quantity": filled, "average_price": notional / filled})
+            if filled >= columns.quantity[position] - (lot_size / 2 if lot_size is not None else 0):
+                return self._transition(order_id, PENDING, EXECUTED)
+            return columns.record(position)
+
+    def archive(self, created_before: int, max_finished: int = 0) -> int:
+        # move the finished orders created before created_before to the cold tier, and the oldest of the
+        # others while more than max_finished finished orders stay in memory (0 for no limit). returns how
+        # many orders were archived
+        if self.cold is None:
+            return 0
+        with self._archiving:
+            with self._lock:
+                columns = self._columns
+                status = np.array(columns.status)
+                finished = (status != PENDING) & (np.frombuffer(bytes(columns.archived), np.uint8) == 0)
+                old = finished & (np.array(columns.created_at) < created_before)
+                selected = np.flatnonzero(old)
+                excess = np.count_nonzero(finished) - len(selected) - max_finished
+                if max_finished and excess > 0:
+                    selected = np.sort(np.concatenate((selected, np.flatnonzero(finished & ~old)[:excess])))
+                positions = selected.tolist()
+            if not positions:
+                return 0
+            # finished orders don't change anymore, they're written out without holding the lock and stay
+            # readable from memory until they're on disk
+            records = [columns.record(position) for position in positions]
+            self.cold.append(records)
+            archived = totals(records)
+            with self._lock:
+                order_ids = [columns.ids[position] for position in positions]
+                for order_id, position in zip(order_ids, positions):
+                    del columns.positions[order_id]
+                    del columns.by_status[columns.status[position]][order_id]
+                    columns.archived[position] = 1
+                columns.archived_rows += len(positions)
+                merge_totals(self._archived_totals, archived)
+                if self.journal is not None:
+                    self.journal.append("archive", ids=order_ids, totals=archived)
+                if columns.archived_rows >= max(len(columns.positions), COMPACT_MIN_ROWS):
+                    self._columns = columns.compacted()
+            return len(positions)
+
+    def archive_usage(self) -> Tuple[int, int]:
+        # orders in the cold tier and the bytes they take on disk
+        if self.cold is None:
+            return 0, 0
+        return len(self.cold), self.cold.size
+
+    def restore_archived(self, archived: Iterable[Dict[str, List[float]]]):
+        # count orders archived before a restart back into the stats, from the totals the journal recovered
+        with self._lock:
+            for archived_totals in archived:
+                merge_totals(self._archived_totals, archived_totals)
+                self._stats.restore(archived_totals)
+
+    def snapshot_state(self) -> Tuple[int, Callable[[], List[dict]], Dict[str, List[float]]]:
+        # the journal position, a function listing every order in memory in its persisted shape as of
+        # that position and the aggregates of the archived orders, which are on disk already. only the
+        # columns are copied under the lock, the journal builds the orders off the event loop
+        with self._lock:
+            lsn = self.journal.lsn if self.journal is not None else 0
+            columns = self._columns.copy()
+            archived = {name: total[:] for name, total in self._archived_totals.items()}
+        return lsn, columns.states, archived
+
+    async def commit(self):
+        # wait until every change made so far is durable, per the journal's mode
+        if self.journal is not None:
+            await self.journal.commit()
+
+    def by_status(self, status: int) -> List[OrderRecord]:
+        columns = self._columns
+        return [columns.record(position) for position in list(columns.by_status.get(status, {}).values())]
+
+    def claim_pending(self) -> List[OrderRecord]:
+        # the pending orders for the first caller only. with shared state every worker asks when it starts, the
+        # first one arms the execution timers of the orders recovered from the log and the others get nothing
+        with self._lock:
+            if self._pending_claimed:
+                return []
+            self._pending_claimed = True
+        return self.by_status(PENDING)
+
+    def by_pair(self, stocks: str) -> List[OrderRecord]:
+        columns = self._columns
+        code = symbols.codes.get(stocks)
+        return [columns.record(position) for position in columns.by_pair.get(code, ())
+                if not columns.archived[position]]
+
+    def count_by_status(self, status: int) -> int:
+        return len(self._columns.by_status.get(status, ()))
+
+    def stats(self) -> dict:
+        # order counts, quantities and rates by currency pair, see order_stats.py
+        with self._lock:
+            return self._stats.snapshot()
+
+    def scan(self, start: int = 0, status: Optional[int] = None, stocks: Optional[str] = None,
+             created_after: Optional[int] = None,
+             created_before: Optional[int] = None) -> Iterator[Tuple[int, OrderRecord]]:
+        # lazily yield (number, order) of the orders in memory in creation order from number start on. the
+        # pair index, or the status index for a status few orders have, is used to seek so orders filtered out
+        # aren't visited. created_at is checked on every order, it isn't ordered when several workers add orders
+        # or the clock steps back
+        columns = self._columns
+        created_at = columns.created_at
+        first = bisect.bisect_left(columns.number, start)
+        code = symbols.codes.get(stocks) if stocks is not None else None
+        pair_positions = columns.by_pair.get(code, array("q")) if stocks is not None else None
+        status_index = columns.by_status.get(status, {}) if status is not None else None
+        scanned = len(columns.ids) - first if pair_positions is None else len(pair_positions)
+        if status_index is not None and len(status_index) * STATUS_SEEK_RATIO < scanned:
+            # the status index is in the order orders got their status, it's sorted here. copied at once since
+            # writers change it
+            positions = np.array(list(status_index.values()), dtype=np.int64)
+            candidates = iter(np.sort(positions[positions >= first]).tolist())
+        elif pair_positions is not None:
+            candidates = (pair_positions[i] for i in range(bisect.bisect_left(pair_positions, first),
+                                                           len(pair_positions)))
+        else:
+            candidates = iter(range(first, len(columns.ids)))
+        for position in candidates:
+            if columns.archived[position]:
+                continue
+            if stocks is not None and columns.symbol[position] != code:
+                continue
+            if created_after is not None and created_at[position] <= created_after:
+                continue
+            if created_before is not None and created_at[position] >= created_before:
+                continue
+            if status is None or columns.status[position] == status:
+                yield columns.number[position], columns.record(position)
+
+    def page(self, cursor: int = 0, limit: Optional[int] = None,
+             **filters) -> Tuple[List[OrderRecord], Optional[int]]:
+        # one page of matching orders and the cursor of the next page, None when there are no more
+        orders = []
+        for number, order in self.scan(cursor, **filters):
+            if limit is not None and len(orders) == limit:
+                return orders, number
+            orders.append(order)
+        return orders, None
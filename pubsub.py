@@ -0,0 +1,178 @@
+# cross-worker broadcast channel: a hub on a local socket relays every published batch of order
+# updates to all connected workers, the publisher included, so each one can fan them out to its own
+# websocket subscribers. The hub numbers the updates as it relays them, so every worker sees the same
+# sequence numbers in the same order, and tells every worker the numbers' epoch when it connects.
+# The same connection carries group commit requests to the state server.
+import asyncio
+import itertools
+import json
+import os
+import secrets
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+# one message per line, the first byte tells what it is. a published line is P<count> <updates>, the hub
+# relays it as P<sequence number of the first update> <updates>
+PUBLISH = b"P"
+COMMIT = b"C"
+COMMITTED = b"K"
+# the commit failed, the write-ahead log can't make changes durable anymore
+COMMIT_FAILED = b"F"
+# market data the state server generates, relayed to every worker
+QUOTES = b"Q"
+# first line the hub sends a worker, E<epoch of the sequence numbers>
+EPOCH = b"E"
+# batch endpoints publish up to a thousand updates in a single line
+LINE_LIMIT = 64 * 1024 * 1024
+
+
+class BroadcastHub:
+    def __init__(self, path: str, commit: Optional[Callable[[], Awaitable[None]]] = None):
+        self.path = path
+        # waits until every change made so far is durable, None when there is nothing to wait for
+        self.commit = commit
+        self.writers: Set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        # commits in flight, kept referenced until they are done
+        self._commits: Set[asyncio.Task] = set()
+        # sequence number of the last relayed update, numbers start over with every hub
+        self.last_seq = 0
+        self.epoch = secrets.randbits(32)
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=LINE_LIMIT)
+        logger.info("Broadcast hub listening on %s", self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"%s%d\n" % (EPOCH, self.epoch))
+        self.writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                kind = line[:1]
+                if kind == PUBLISH:
+                    # relayed as is but for the header, the hub never decodes the updates
+                    count, _, updates = line[1:].partition(b" ")
+                    line = b"%s%d %s" % (PUBLISH, self.last_seq + 1, updates)
+                    self.last_seq += int(count)
+                    for worker in list(self.writers):
+                        worker.write(line)
+                elif kind == COMMIT:
+                    # every request waits on the same group commit instead of queueing behind each other
+                    task = asyncio.create_task(self._commit(writer, line[1:]))
+                    self._commits.add(task)
+                    task.add_done_callback(self._commits.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def publish_quotes(self, quotes: list):
+        line = QUOTES + json.dumps(quotes).encode() + b"\n"
+        for worker in list(self.writers):
+            worker.write(line)
+
+    async def _commit(self, writer: asyncio.StreamWriter, request_id: bytes):
+        reply = COMMITTED
+        if self.commit is not None:
+            try:
+                await self.commit()
+            except Exception as e:
+                logger.error("Group commit failed: %s", e)
+                reply = COMMIT_FAILED
+        if writer in self.writers:
+            writer.write(reply + request_id)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in list(self.writers):
+            writer.close()
+
+
+class HubChannel:
+    # a worker's connection to the hub
+    def __init__(self, path: str, deliver: Callable[[List[tuple], bool, int], Awaitable[None]],
+                 quotes: Optional[Callable[[list], None]] = None):
+        self.path = path
+        # hands (frame, order id, done, topics) updates published by any worker to this worker's websocket
+        # subscribers, with the sequence number of the first one
+        self.deliver = deliver
+        # takes the state server's market data
+        self.quotes = quotes
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._commit_ids = itertools.count()
+        self._commits: Dict[bytes, asyncio.Future] = {}
+        # epoch of the hub's sequence numbers
+        self.epoch: Optional[int] = None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+        line = await self._reader.readline()
+        if line[:1] != EPOCH:
+            raise ConnectionError("Broadcast hub didn't send its epoch")
+        self.epoch = int(line[1:])
+        self._task = asyncio.create_task(self._receive())
+
+    async def publish(self, updates: List[tuple], aggregate: bool = False):
+        self._writer.write(b"%s%d %s\n" % (PUBLISH, len(updates), json.dumps([aggregate, updates]).encode()))
+        await self._writer.drain()
+
+    async def commit(self):
+        # wait until the state server made every change so far durable
+        request_id = str(next(self._commit_ids)).encode() + b"\n"
+        future = self._commits[request_id] = asyncio.get_running_loop().create_future()
+        self._writer.write(COMMIT + request_id)
+        await future
+
+    async def _receive(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                logger.error("Broadcast hub connection lost")
+                break
+            kind = line[:1]
+            if kind == PUBLISH:
+                first_seq, _, body = line[1:].partition(b" ")
+                aggregate, updates = json.loads(body)
+                try:
+                    await self.deliver([tuple(update) for update in updates], aggregate, int(first_seq))
+                except Exception as e:
+                    logger.error("Failed delivering broadcast from hub: %s", e)
+            elif kind == QUOTES:
+                if self.quotes is not None:
+                    try:
+                        self.quotes(json.loads(line[1:]))
+                    except Exception as e:
+                        logger.error("Failed handling quotes from hub: %s", e)
+            elif kind == COMMITTED or kind == COMMIT_FAILED:
+                future = self._commits.pop(line[1:], None)
+                if future is not None and not future.done():
+                    if kind == COMMITTED:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(OSError("State server couldn't make the changes durable"))
+        for future in self._commits.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Broadcast hub connection lost"))
+        self._commits.clear()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._writer is not None:
+            self._writer.close()
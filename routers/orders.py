@@ -1,67 +1,533 @@
 import asyncio
+import functools
 import json
-import uuid
-import re
 import logging
-from fastapi import APIRouter, HTTPException, status, WebSocketDisconnect, WebSocket
-from models.schemas import OrderOutput, OrderInput
-from typing import List
-from websocket_manager import ConnectionManager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, WebSocketDisconnect, WebSocket, Query, Request, Body, Header
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from models.schemas import (OrderOutput, OrderInput, BatchOrderResult, BatchCancelResult, StatsOutput,
+                            order_rule_message)
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+import config
+from execution_scheduler import ExecutionScheduler
+from idempotency import IdempotencyCache
+from metrics import registry
+from order_json import OrderEncoder, OrderJSONResponse
+from order_record import (EXECUTED, ORDER_TYPE_CODES, PENDING, SIDE_CODES, STATUS_CODES, STATUSES, OrderRecord,
+                          format_id, new_id, now_timestamp, parse_id, symbols, to_timestamp)
+from pubsub import HubChannel
+from order_archive import Archiver
+from state import build_archiver, build_state, connect_state, recover_state
+from instruments import instruments
+from market_data import MarketDataEngine, QuoteBook, QuoteStep, build_engine
+from websocket_manager import (ALL_ORDERS_TOPIC, ALL_QUOTES_TOPIC, QUOTE_TOPIC_PREFIX, STATS_TOPIC, STATUS_TOPIC_PREFIX,
+                               SYMBOL_TOPIC_PREFIX, ConnectionManager)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-orders_db = []
-websocket_manager = ConnectionManager()
+# orders and books, in process until open_state() swaps in proxies of the state server when workers
+# share state, orders only live in memory unless the write-ahead log is turned on
+order_store, exchange, write_ahead_log = build_state()
+# connection to the state server's broadcast hub, only set when workers share state
+hub_channel: Optional[HubChannel] = None
+# latest simulated quotes, from this process's market data engine or from the state server's when workers
+# share state
+quote_book = QuoteBook(list(instruments))
+market_data: Optional[MarketDataEngine] = None
+# moves finished orders to the archive on disk, in the state server instead when workers share state
+archiver: Optional[Archiver] = None
+# pushes the order stats to the "stats" topic every STATS_INTERVAL_MS
+stats_task: Optional[asyncio.Task] = None
+# responses of order requests by Idempotency-Key, the state server's when workers share state
+idempotency_cache = IdempotencyCache(config.IDEMPOTENCY_CACHE_SIZE, config.IDEMPOTENCY_TTL, config.IDEMPOTENCY_LEASE)
+# Idempotency-Key -> (request fingerprint, task creating the order) of the requests being handled by this
+# worker, retries arriving meanwhile wait for the same task
+idempotent_requests: Dict[str, Tuple[str, asyncio.Task]] = {}
+merged_requests = 0
+# encoded JSON of recently served orders, shared by REST responses and websocket frames
+order_encoder = OrderEncoder(max_size=config.ORDER_JSON_CACHE_SIZE)
+websocket_manager = ConnectionManager(queue_size=config.WS_QUEUE_SIZE,
+                                      slow_consumer_policy=config.WS_SLOW_CONSUMER_POLICY,
+                                      encoder=order_encoder, replay_size=config.WS_REPLAY_BUFFER_SIZE)
 
+# largest page a client can ask for with the limit query parameter
+MAX_PAGE_SIZE = 1000
+# page size of requests without a limit, only streamed responses go over every matching order
+DEFAULT_PAGE_SIZE = 100
+# orders serialized per chunk of a streamed response
+STREAM_CHUNK_SIZE = 500
+# max number of orders or order ids in one batch request
+MAX_BATCH_SIZE = 1000
+# longest window a client can have its websocket updates gathered for
+MAX_COALESCE_WINDOW_MS = 1000
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# how often a request checks for the response of the same key being handled by another worker, in seconds,
+# the interval doubles up to the max, and how long it waits for it before giving up with a 409
+IDEMPOTENCY_POLL_INTERVAL = 0.01
+IDEMPOTENCY_MAX_POLL_INTERVAL = 0.2
+IDEMPOTENCY_MAX_WAIT = 5.0
+# threads making the blocking round trips to the state server when workers share state
+STATE_CALL_THREADS = 16
 
-def validate_order(order_input: OrderInput):
-    if not re.match("^[A-Z]{3}[A-Z]{3}$", order_input.stocks):
-        logger.error(f"Invalid currency pair symbol: {order_input.stocks}")
-        raise HTTPException(status_code=400, detail="Invalid currency pair symbol")
-    if order_input.quantity <= 0:
-        logger.error(f"Order quantity must be greater than zero: {order_input.quantity}")
-        raise HTTPException(status_code=400, detail="Order quantity must be greater than zero")
+state_calls = ThreadPoolExecutor(max_workers=STATE_CALL_THREADS, thread_name_prefix="state-call")
 
 
-# auto executes pending orders after a delay
-async def execute_order(order_id: str, delay: int = 10):
-    await asyncio.sleep(delay)
-    for order in orders_db:
-        if order["id"] == order_id and order["status"] == "PENDING":
-            order["status"] = "EXECUTED"
-            logger.info(f"Order executed: {order_id}")
-            await websocket_manager.broadcast({"action": "order_executed", "data": order}, order_id=order_id)
+async def call(method: Callable, *args, **kwargs):
+    # call a method of the order store, exchange or idempotency cache. in process it runs right away, when
+    # workers share state every call is a round trip to the state server, made on a thread of state_calls
+    # so the event loop keeps serving other requests meanwhile
+    if hub_channel is None:
+        return method(*args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(state_calls, functools.partial(method, *args, **kwargs))
 
 
-@router.get("/orders", response_model=List[OrderOutput], status_code=status.HTTP_200_OK)
-async def retrieve_all_orders():
+def parse_cursor(cursor: Optional[str]) -> int:
+    if cursor is None:
+        return 0
+    if not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int(cursor)
+
+
+async def stream_orders(cursor: int, limit: Optional[int], filters: dict):
+    # fetch and serialize page by page so memory and time to first byte don't grow with the book
+    remaining = limit
+    while cursor is not None and (remaining is None or remaining > 0):
+        size = STREAM_CHUNK_SIZE if remaining is None else min(STREAM_CHUNK_SIZE, remaining)
+        orders, cursor = await call(order_store.page, cursor, size, **filters)
+        if orders:
+            yield b"\n".join(order_encoder.order(order) for order in orders) + b"\n"
+        if remaining is not None:
+            remaining -= len(orders)
+
+
+def new_pending_order(order_input: OrderInput, created_at: int) -> OrderRecord:
+    order_type = order_input.order_type
+    if order_input.side is not None and order_type is None:
+        order_type = "LIMIT" if order_input.price is not None else "MARKET"
+    return OrderRecord(new_id(), order_input.symbol_id, order_input.quantity,
+                       SIDE_CODES[order_input.side], ORDER_TYPE_CODES[order_type], order_input.price,
+                       PENDING, created_at)
+
+
+def latest_states(updates: list) -> dict:
+    # order id -> the order as of its last update, the records a handler created are only copies
+    # when the state server holds them
+    return {message["data"].id: message["data"] for message, _ in updates}
+
+
+async def commit():
+    # wait until the changes made so far are durable, per WAL_MODE, before acknowledging them. once the
+    # write-ahead log failed they stay in memory but requests get a 503 instead of an acknowledgement
+    try:
+        if hub_channel is None:
+            await order_store.commit()
+        elif config.WAL_MODE == "group":
+            await hub_channel.commit()
+    except OSError as e:
+        logger.error("Changes couldn't be made durable: %s", e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Changes couldn't be made durable")
+
+
+def valid_topic(topic: str) -> bool:
+    # every order, a tradable currency pair or an order status, the quotes of a pair or of all of them, or
+    # the order stats
+    if topic.startswith(SYMBOL_TOPIC_PREFIX):
+        return topic[len(SYMBOL_TOPIC_PREFIX):] in instruments
+    if topic.startswith(STATUS_TOPIC_PREFIX):
+        return topic[len(STATUS_TOPIC_PREFIX):] in STATUS_CODES
+    if topic.startswith(QUOTE_TOPIC_PREFIX):
+        return topic[len(QUOTE_TOPIC_PREFIX):] in instruments
+    return topic in (ALL_ORDERS_TOPIC, ALL_QUOTES_TOPIC, STATS_TOPIC)
+
+
+def coalesce_settings(value: Any) -> Optional[Tuple[float, int]]:
+    # (window in seconds, max messages per frame) asked for by a subscribe message: true for the defaults,
+    # false to turn coalescing off or {"window_ms": 5, "max_messages": 100}, None when it makes no sense
+    if value is True:
+        return config.WS_COALESCE_WINDOW_MS / 1000, config.WS_COALESCE_MAX_MESSAGES
+    if value is False:
+        return 0.0, 1
+    if not isinstance(value, dict):
+        return None
+    window_ms = value.get("window_ms", config.WS_COALESCE_WINDOW_MS)
+    max_messages = value.get("max_messages", config.WS_COALESCE_MAX_MESSAGES)
+    if isinstance(window_ms, bool) or not isinstance(window_ms, (int, float)):
+        return None
+    if isinstance(max_messages, bool) or not isinstance(max_messages, int) or max_messages < 1:
+        return None
+    if not 0 <= window_ms <= MAX_COALESCE_WINDOW_MS:
+        return None
+    return window_ms / 1000, max_messages
+
+
+def validate_batch_size(items: list):
+    if len(items) > MAX_BATCH_SIZE:
+        logger.error("Batch too large: %d items", len(items))
+        raise HTTPException(status_code=400, detail=f"Batch can't hold more than {MAX_BATCH_SIZE} items")
+
+
+# auto executes pending orders once their scheduled delay is over, at the current quote when there is one
+async def execute_orders(order_ids: List[int]):
+    executed = []
+    fill_prices = quote_book.fill_prices()
+    for order in await call(order_store.transition_many, order_ids, PENDING, EXECUTED, fill_prices or None):
+        if order is not None:
+            order_id = format_id(order.id)
+            logger.info("Order executed: %s", order_id)
+            message = {"action": "order_executed", "data": order}
+            prices = fill_prices.get(order.stocks)
+            if prices is not None:
+                # timer executions are of orders without a side, which never have earlier fills
+                message["fill"] = {"price": prices[order.side], "quantity": order.quantity}
+            executed.append((message, order_id))
+    # executions of unrelated orders keep going out as one frame per order
+    await websocket_manager.publish(executed)
+
+
+execution_scheduler = ExecutionScheduler(execute_orders,
+                                         default_delay=config.EXECUTION_DELAY,
+                                         symbol_delays={symbols.intern(symbol): delay for symbol, delay
+                                                        in config.SYMBOL_EXECUTION_DELAYS.items()},
+                                         batch_size=config.EXECUTION_BATCH_SIZE)
+
+
+def read_state_metrics() -> dict:
+    # order counts by status, (archived orders, archive bytes) and (idempotency hits, misses)
+    return {"orders": [order_store.count_by_status(code) for code in range(len(STATUSES))],
+            "archive": order_store.archive_usage(), "idempotency": idempotency_cache.counts()}
+
+
+# readings of the order store and idempotency cache, refreshed by refresh_metrics() before /metrics is
+# rendered so the gauges below don't reach the state server from the event loop
+state_metrics = {"orders": [0] * len(STATUSES), "archive": (0, 0), "idempotency": (0, 0)}
+
+
+async def refresh_metrics():
+    state_metrics.update(await call(read_state_metrics))
+
+
+# state of this worker read when /metrics is scraped, order counts come from the state server when it's shared
+registry.gauge("trading_orders", "Orders in memory by status", ("status",),
+               callback=lambda: [((name,), count) for name, count in zip(STATUSES, state_metrics["orders"])])
+registry.gauge("trading_archived_orders", "Finished orders moved from memory to the archive on disk",
+               callback=lambda: state_metrics["archive"][0])
+registry.gauge("trading_archive_bytes", "Size of the archive's segment files",
+               callback=lambda: state_metrics["archive"][1])
+registry.counter("trading_idempotency_hits_total", "Order requests whose Idempotency-Key was seen before",
+                 callback=lambda: state_metrics["idempotency"][0])
+registry.counter("trading_idempotency_misses_total", "Order requests with a new Idempotency-Key",
+                 callback=lambda: state_metrics["idempotency"][1])
+registry.counter("trading_idempotency_merged_total", "Retries that waited for the request in flight with their "
+                 "Idempotency-Key on this worker", callback=lambda: merged_requests)
+registry.gauge("trading_scheduled_executions", "Pending orders waiting for their execution timer",
+               callback=lambda: execution_scheduler.depth)
+registry.gauge("trading_ws_connections", "Active WebSocket connections",
+               callback=lambda: len(websocket_manager.active_connections))
+registry.gauge("trading_ws_subscriptions", "Order subscriptions of the active WebSocket connections",
+               callback=websocket_manager.subscription_count)
+registry.gauge("trading_ws_topic_subscriptions", "Topic subscriptions of the active WebSocket connections",
+               callback=websocket_manager.topic_subscription_count)
+registry.gauge("trading_ws_queued_messages", "Messages waiting in the outbound WebSocket queues",
+               callback=lambda: sum(websocket_manager.queued_messages()))
+registry.gauge("trading_ws_max_queue_depth", "Longest outbound WebSocket queue",
+               callback=lambda: max(websocket_manager.queued_messages(), default=0))
+registry.counter("trading_order_json_cache_hits_total", "Orders served from the encoded JSON cache",
+                 callback=lambda: order_encoder.hits)
+registry.counter("trading_order_json_cache_misses_total", "Orders encoded because they weren't cached or had changed",
+                 callback=lambda: order_encoder.misses)
+
+
+def update_quotes(step: QuoteStep):
+    quote_book.update(step)
+    if websocket_manager.has_quote_subscribers():
+        websocket_manager.publish_quotes(quote_book.messages())
+
+
+async def stats_message() -> str:
+    return json.dumps({"action": "stats", "data": await call(order_store.stats)}, separators=(",", ":"))
+
+
+async def publish_stats():
+    # the stats are only read from the store while someone is subscribed to them
+    while True:
+        await asyncio.sleep(config.STATS_INTERVAL_MS / 1000)
+        try:
+            if websocket_manager.topic_subscribers.get(STATS_TOPIC):
+                websocket_manager.publish_latest(STATS_TOPIC, await stats_message())
+        except Exception as e:
+            logger.error("Publishing order stats failed: %s", e)
+
+
+async def open_state():
+    # connect to the state server when workers share state, otherwise recover the local state from
+    # the write-ahead log and start generating market data and archiving finished orders, then put pending
+    # orders back on their execution timer
+    global order_store, exchange, idempotency_cache, hub_channel, market_data, archiver, stats_task
+    if config.STATE_BACKEND == "shared":
+        order_store, exchange, idempotency_cache = connect_state()
+        hub_channel = HubChannel(config.STATE_HUB_ADDRESS, websocket_manager.receive,
+                                 quotes=lambda values: update_quotes(QuoteStep.from_list(values)))
+        await hub_channel.connect()
+        websocket_manager.channel = hub_channel
+        websocket_manager.epoch = hub_channel.epoch
+    else:
+        recovered = recover_state(exchange, write_ahead_log)
+        if recovered:
+            logger.info("Recovered %d order(s) from the write-ahead log", recovered)
+        archiver = build_archiver(order_store)
+        if archiver is not None:
+            archiver.start()
+        if config.MARKET_DATA_ENABLED:
+            market_data = build_engine(list(instruments), update_quotes)
+            market_data.start()
+    # with shared state only the first worker to start gets the pending orders to arm their timers
+    now = now_timestamp()
+    for order in await call(order_store.claim_pending):
+        if not order.side:
+            elapsed = (now - order.created_at) / 1_000_000
+            delay = max(0.0, execution_scheduler.delay_for(order.symbol) - elapsed)
+            execution_scheduler.schedule(order.id, symbol=order.symbol, delay=delay)
+    stats_task = asyncio.create_task(publish_stats())
+
+
+async def close_state():
+    await execution_scheduler.stop()
+    if stats_task is not None:
+        stats_task.cancel()
+    if market_data is not None:
+        await market_data.stop()
+    if archiver is not None:
+        await archiver.stop()
+        order_store.cold.close()
+    if hub_channel is not None:
+        await hub_channel.close()
+    elif write_ahead_log is not None:
+        await write_ahead_log.close()
+
+
+@router.get("/orders", response_model=List[OrderOutput], status_code=status.HTTP_200_OK,
+            responses={200: {"headers": {"X-Next-Cursor": {"description": "Cursor of the next page, only set "
+                                                                          "when more orders match",
+                                                           "schema": {"type": "string"}}},
+                             "content": {"application/x-ndjson": {
+                                 "schema": {"$ref": "#/components/schemas/OrderOutput"}}}},
+                       400: {"description": "Invalid cursor"}})
+async def retrieve_all_orders(request: Request,
+                              status_filter: Optional[Literal["PENDING", "EXECUTED", "CANCELED"]] = Query(
+                                  None, alias="status", description="Only return orders with this status"),
+                              stocks: Optional[str] = Query(None,
+                                                            description="Only return orders for this currency pair"),
+                              created_after: Optional[datetime] = Query(
+                                  None, description="Only return orders created after this time"),
+                              created_before: Optional[datetime] = Query(
+                                  None, description="Only return orders created before this time"),
+                              limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE,
+                                                           description="Max number of orders in the page, "
+                                                                       f"{DEFAULT_PAGE_SIZE} when not streaming"),
+                              cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+                              stream: bool = Query(False, description="Stream the orders as NDJSON")):
     logger.info("Retrieving all orders")
-    return orders_db
+    filters = {
+        "status": STATUS_CODES[status_filter] if status_filter else None,
+        "stocks": stocks,
+        "created_after": to_timestamp(created_after) if created_after else None,
+        "created_before": to_timestamp(created_before) if created_before else None,
+    }
+    start = parse_cursor(cursor)
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(stream_orders(start, limit, filters), media_type="application/x-ndjson")
+    orders, next_cursor = await call(order_store.page, start, limit or DEFAULT_PAGE_SIZE, **filters)
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+    return OrderJSONResponse(order_encoder.orders(orders), headers=headers)
+
+
+async def idempotent(key: str, fingerprint: str, handle: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, bool]:
+    # (response body, whether it is the response of an earlier request with the key). the first request with a
+    # key runs handle, as a task of its own so the client going away doesn't cut it short, retries get its
+    # response or wait for it while it's in flight
+    global merged_requests
+    interval = IDEMPOTENCY_POLL_INTERVAL
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_MAX_WAIT
+    while True:
+        running = idempotent_requests.get(key)
+        if running is not None:
+            if running[0] != fingerprint:
+                raise idempotency_key_reused()
+            merged_requests += 1
+            return await asyncio.shield(running[1]), True
+        stored = await call(idempotency_cache.begin, key, fingerprint)
+        if stored is None:
+            break
+        if stored[0] != fingerprint:
+            raise idempotency_key_reused()
+        if stored[1] is not None:
+            return stored[1], True
+        # in flight on another worker, until it answers or its lease runs out
+        if asyncio.get_running_loop().time() + interval > deadline:
+            logger.warning("Gave up waiting for the request in flight with Idempotency-Key: %s", key)
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="A request with this Idempotency-Key is still being handled, retry later")
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, IDEMPOTENCY_MAX_POLL_INTERVAL)
+
+    async def run() -> bytes:
+        # the cache has the outcome before retries on this worker stop waiting for the task
+        try:
+            try:
+                body = await handle()
+            except BaseException:
+                await call(idempotency_cache.fail, key, fingerprint)
+                raise
+            await call(idempotency_cache.finish, key, fingerprint, body)
+            return body
+        finally:
+            del idempotent_requests[key]
+
+    task = asyncio.ensure_future(run())
+    idempotent_requests[key] = (fingerprint, task)
+    return await asyncio.shield(task), False
+
+
+def idempotency_key_reused() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                         detail="Idempotency-Key was already used for a different request")
+
+
+@router.post("/orders", response_model=OrderOutput, status_code=status.HTTP_201_CREATED,
+             responses={201: {"headers": {"Idempotent-Replayed": {
+                 "description": "Set to true when the response is the one of an earlier request with the same "
+                                "Idempotency-Key", "schema": {"type": "string"}}}},
+                        409: {"description": "A request with the same Idempotency-Key is still being handled"}})
+async def post_order(order_input: OrderInput,
+                     idempotency_key: Optional[str] = Header(
+                         None, alias="Idempotency-Key", max_length=MAX_IDEMPOTENCY_KEY_LENGTH,
+                         description="Unique key of the order, retries with the same key get the response of the "
+                                     "first request instead of creating another order")):
+    if idempotency_key is None:
+        return OrderJSONResponse(await create_order(order_input), status_code=status.HTTP_201_CREATED)
+    body, replayed = await idempotent(idempotency_key, order_input.model_dump_json(),
+                                      lambda: create_order(order_input))
+    if replayed:
+        logger.info("Order request replayed for Idempotency-Key: %s", idempotency_key)
+    return OrderJSONResponse(body, status_code=status.HTTP_201_CREATED,
+                             headers={"Idempotent-Replayed": "true"} if replayed else None)
+
+
+async def create_order(order_input: OrderInput) -> bytes:
+    # order rules were checked while parsing the body, see OrderInput
+    new_order = new_pending_order(order_input, now_timestamp())
+    await call(order_store.add, new_order)
+    order_id = format_id(new_order.id)
+    logger.info("New order created: %s", order_id)
+    await websocket_manager.publish([({"action": "new_order", "data": new_order}, order_id)])
 
+    if not new_order.side:
+        execution_scheduler.schedule(new_order.id, symbol=new_order.symbol)
+    else:
+        updates = await call(exchange.match, new_order)
+        await websocket_manager.publish(updates)
+        new_order = latest_states(updates).get(new_order.id, new_order)
 
-@router.post("/orders", response_model=OrderOutput, status_code=status.HTTP_201_CREATED)
-async def post_order(order_input: OrderInput):
-    validate_order(order_input)
-    new_order = order_input.dict()
-    new_order["id"] = str(uuid.uuid4())
-    new_order["status"] = "PENDING"
-    orders_db.append(new_order)
-    logger.info(f"New order created: {new_order['id']}")
-    await websocket_manager.broadcast({"action": "new_order", "data": new_order}, order_id=new_order["id"])
+    # only acknowledge the order once it is durable
+    await commit()
+    return order_encoder.order(new_order)
 
-    asyncio.create_task(execute_order(new_order["id"]))
 
-    return OrderOutput(**new_order)
+def match_all(orders: List[OrderRecord]) -> list:
+    # the updates of matching the orders one after the other, a single job for a whole batch
+    updates = []
+    for order in orders:
+        updates.extend(exchange.match(order))
+    return updates
+
+
+@router.post("/orders/batch", response_model=List[BatchOrderResult], status_code=status.HTTP_200_OK,
+             responses={400: {"description": "Batch too large"}},
+             # items are parsed one by one below, the documented body is still a list of OrderInput
+             openapi_extra={"requestBody": {"content": {"application/json": {"schema": {
+                 "items": {"$ref": "#/components/schemas/OrderInput"}}}}}})
+async def post_orders_batch(order_inputs: List[Any] = Body(..., title="Order Inputs")):
+    # create many orders at once, items breaking an order rule are reported without failing the rest,
+    # an item that doesn't parse fails the whole request like any malformed body
+    validate_batch_size(order_inputs)
+    created_at = now_timestamp()
+    # index -> new order, or the reason the order was rejected
+    outcomes = []
+    new_orders = []
+    for index, item in enumerate(order_inputs):
+        try:
+            order_input = OrderInput.model_validate(item)
+        except ValidationError as e:
+            message = order_rule_message(e)
+            if message is None:
+                raise RequestValidationError([{**error, "loc": ("body", index, *error["loc"])}
+                                              for error in e.errors(include_url=False)])
+            outcomes.append(message)
+            continue
+        new_orders.append(new_pending_order(order_input, created_at))
+        outcomes.append(new_orders[-1])
+
+    await call(order_store.add_many, new_orders)
+    logger.info("Batch of %d new order(s) created, %d rejected", len(new_orders), len(outcomes) - len(new_orders))
+    await websocket_manager.publish([({"action": "new_order", "data": order}, format_id(order.id))
+                                     for order in new_orders], aggregate=True)
+    execution_scheduler.schedule_many((order.id, order.symbol) for order in new_orders if not order.side)
+    updates = await call(match_all, [order for order in new_orders if order.side])
+    await websocket_manager.publish(updates, aggregate=True)
+
+    await commit()
+    latest = latest_states(updates)
+    results = []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, OrderRecord):
+            results.append(order_encoder.batch_result(index, order=latest.get(outcome.id, outcome)))
+        else:
+            results.append(order_encoder.batch_result(index, detail=outcome))
+    return OrderJSONResponse(b"[" + b",".join(results) + b"]")
+
+
+@router.delete("/orders/batch", response_model=List[BatchCancelResult], status_code=status.HTTP_200_OK,
+               responses={400: {"description": "Batch too large"}})
+async def cancel_orders_batch(order_ids: List[str] = Body(...)):
+    # cancel many orders at once, unknown or finished orders are reported per item
+    validate_batch_size(order_ids)
+    results = []
+    canceled = []
+    orders = await call(exchange.cancel_many, [parse_id(order_id) for order_id in order_ids])
+    for order_id, order in zip(order_ids, orders):
+        if order is None:
+            results.append(BatchCancelResult(order_id=order_id, success=False,
+                                             detail="Order not found or already executed"))
+            continue
+        if not order.side:
+            execution_scheduler.cancel(order.id)
+        canceled.append(({"action": "order_cancelled", "data": order}, format_id(order.id)))
+        results.append(BatchCancelResult(order_id=order_id, success=True))
+
+    logger.info("Batch of %d order(s) canceled, %d not found", len(canceled), len(results) - len(canceled))
+    await websocket_manager.publish(canceled, aggregate=True)
+
+    await commit()
+    return results
 
 
 @router.get("/orders/{orderId}", response_model=OrderOutput, status_code=status.HTTP_200_OK)
 async def get_order_by_id(orderId: str):
-    for order in orders_db:
-        if order["id"] == orderId:
-            logger.info(f"Retrieving order by ID: {orderId}")
-            return OrderOutput(**order)
-    logger.error(f"Order not found: {orderId}")
+    order_id = parse_id(orderId)
+    order = await call(order_store.get, order_id, cold=False) if order_id is not None else None
+    if order is None and order_id is not None and config.ARCHIVE_ENABLED:
+        # finished orders may be archived, they're read from disk off the event loop
+        order = await asyncio.get_running_loop().run_in_executor(state_calls, order_store.get, order_id)
+    if order is not None:
+        logger.info("Retrieving order by ID: %s", orderId)
+        return OrderJSONResponse(order_encoder.order(order))
+    logger.error("Order not found: %s", orderId)
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Order not found"
@@ -70,29 +536,144 @@ async def get_order_by_id(orderId: str):
 
 @router.delete("/orders/{orderId}", status_code=status.HTTP_204_NO_CONTENT)
 async def cancel_an_order(orderId: str):
-    for order in orders_db:
-        if order["id"] == orderId and order["status"] == "PENDING":
-            order["status"] = "CANCELED"
-            logger.info(f"Order canceled: {orderId}")
-            await websocket_manager.broadcast({"action": "order_cancelled", "data": order}, order_id=orderId)
-            return
+    order_id = parse_id(orderId)
+    order = await call(exchange.cancel, order_id) if order_id is not None else None
+    if order is not None:
+        if not order.side:
+            execution_scheduler.cancel(order_id)
+        logger.info("Order canceled: %s", orderId)
+        await websocket_manager.publish([({"action": "order_cancelled", "data": order}, format_id(order_id))])
+        await commit()
+        return
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Order not found or already executed"
     )
 
 
+@router.get("/stats", response_model=StatsOutput, status_code=status.HTTP_200_OK)
+async def get_stats():
+    # kept up to date by the order store, reading them doesn't go over the orders
+    return await call(order_store.stats)
+
+
+def snapshot_orders(order_ids: List[int], topics: List[str]) -> List[OrderRecord]:
+    # what a resuming client starts over from: the pending orders of its topics and the orders it names,
+    # whatever their status
+    orders = {}
+    for order_id in order_ids:
+        order = order_store.get(order_id)
+        if order is not None:
+            orders[order.id] = order
+    if topics:
+        everything = ALL_ORDERS_TOPIC in topics or STATUS_TOPIC_PREFIX + STATUSES[PENDING] in topics
+        for order in order_store.by_status(PENDING):
+            if everything or SYMBOL_TOPIC_PREFIX + order.stocks in topics:
+                orders[order.id] = order
+    return list(orders.values())
+
+
+def pending_ids(order_ids: List[int]) -> List[int]:
+    # the orders that are still pending, pending orders are never archived
+    pending = []
+    for order_id in order_ids:
+        order = order_store.get(order_id, cold=False)
+        if order is not None and order.status == PENDING:
+            pending.append(order_id)
+    return pending
+
+
+async def resume(websocket: WebSocket, message: dict):
+    # {"action": "resume", "seq": 41, "epoch": 7, "order_ids": [...], "topics": [...]} subscribes to the orders
+    # that are still pending and to the topics, then sends what came after seq. without the epoch of this
+    # server's numbers the client gets a snapshot. the state is read first, nothing is awaited between
+    # subscribing and catching up
+    seq = message.get("seq")
+    epoch = message.get("epoch")
+    if not isinstance(epoch, int) or isinstance(epoch, bool):
+        epoch = None
+    order_ids = message.get("order_ids") or []
+    topics = message.get("topics") or []
+    if (not isinstance(seq, int) or isinstance(seq, bool) or seq < 0 or not isinstance(order_ids, list)
+            or not isinstance(topics, list)):
+        logger.warning("WebSocket resume ignored, invalid request: %s", message)
+        return
+    parsed_ids = [parsed_id for parsed_id in (parse_id(order_id) for order_id in order_ids) if parsed_id is not None]
+    topics = [topic for topic in topics if isinstance(topic, str) and valid_topic(topic)]
+    pending = await call(pending_ids, parsed_ids)
+    snapshot = None
+    if not websocket_manager.replayable(seq, epoch):
+        # the updates after the sequence number the snapshot is read at are sent after it
+        snapshot_seq = websocket_manager.last_seq
+        snapshot = snapshot_seq, await call(snapshot_orders, parsed_ids, topics)
+    for topic in topics:
+        websocket_manager.subscribe_topic(websocket, topic)
+    for parsed_id in pending:
+        websocket_manager.subscribe(websocket, format_id(parsed_id))
+    websocket_manager.resume(websocket, seq, epoch, {format_id(parsed_id) for parsed_id in parsed_ids},
+                             set(topics), snapshot)
+
+
 @router.websocket("/ws")
 async def websocket_connection(websocket: WebSocket):
     await websocket_manager.connect(websocket)
     try:
         while True:
             data = await websocket.receive_text()
-            message = json.loads(data)
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                logger.warning("WebSocket message ignored, not a JSON object: %.200s", data)
+                continue
             action = message.get("action")
             order_id = message.get("order_id")
+            topic = message.get("topic")
+            if action == "resume":
+                await resume(websocket, message)
+                continue
+            if action == "subscribe" and "coalesce" in message:
+                # opting in (or out) of coalesced frames goes with a subscription and holds for the connection
+                settings = coalesce_settings(message["coalesce"])
+                if settings is None:
+                    logger.warning("WebSocket coalescing ignored, invalid settings: %s", message["coalesce"])
+                else:
+                    websocket_manager.coalesce(websocket, *settings)
+            if isinstance(topic, str):
+                # topic subscriptions, e.g. {"action": "subscribe", "topic": "symbol:EURUSD"}
+                if action == "subscribe":
+                    if not valid_topic(topic):
+                        logger.warning("WebSocket subscription ignored, unknown topic: %s", topic)
+                        continue
+                    websocket_manager.subscribe_topic(websocket, topic)
+                    logger.info("WebSocket subscribed to topic: %s", topic)
+                    if topic == ALL_QUOTES_TOPIC or topic.startswith(QUOTE_TOPIC_PREFIX):
+                        # quotes only go out when they change, new subscribers start from the current ones
+                        for pair, payload in quote_book.messages(changed_only=False):
+                            if topic in (ALL_QUOTES_TOPIC, QUOTE_TOPIC_PREFIX + pair):
+                                websocket_manager.send_latest(websocket, QUOTE_TOPIC_PREFIX + pair, payload)
+                    elif topic == STATS_TOPIC:
+                        websocket_manager.send_latest(websocket, STATS_TOPIC, await stats_message())
+                elif action == "unsubscribe":
+                    if websocket_manager.unsubscribe_topic(websocket, topic):
+                        logger.info("WebSocket unsubscribed from topic: %s", topic)
+                continue
+            # subscriptions are kept by the canonical form of the id, the one updates carry
+            parsed_id = parse_id(order_id) if order_id else None
             if action == "subscribe" and order_id:
-                websocket_manager.order_subscribers[order_id].add(websocket)
-                logger.info(f"WebSocket subscribed to order ID: {order_id}")
+                order = await call(order_store.get, parsed_id, cold=False) if parsed_id is not None else None
+                # finished orders never send updates, so only live ones can be subscribed to, they're never archived
+                if order is None or order.status != PENDING:
+                    logger.warning("WebSocket subscription ignored, order not pending: %s", order_id)
+                    continue
+                websocket_manager.subscribe(websocket, format_id(parsed_id))
+                logger.info("WebSocket subscribed to order ID: %s", order_id)
+            elif action == "unsubscribe" and parsed_id is not None:
+                if websocket_manager.unsubscribe(websocket, format_id(parsed_id)):
+                    logger.info("WebSocket unsubscribed from order ID: %s", order_id)
     except WebSocketDisconnect:
+        pass
+    finally:
+        # whatever ended the connection, its subscriptions and writer task go with it
         websocket_manager.disconnect(websocket)
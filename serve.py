@@ -0,0 +1,45 @@
+# run the API on several worker processes that share one state server
+# usage: python serve.py [--workers N] [--host HOST] [--port PORT]
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+import config
+
+# how long to wait for the state server to open its sockets
+STARTUP_TIMEOUT = 10
+
+
+def start_state_server() -> subprocess.Popen:
+    for path in (config.STATE_ADDRESS, config.STATE_HUB_ADDRESS):
+        if os.path.exists(path):
+            os.remove(path)
+    process = subprocess.Popen([sys.executable, "-m", "state"])
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while not (os.path.exists(config.STATE_ADDRESS) and os.path.exists(config.STATE_HUB_ADDRESS)):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("State server failed to start")
+        time.sleep(0.05)
+    return process
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the trading platform on several workers with shared state")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # workers are spawned with this environment, so they all pick the shared backend up
+    os.environ["STATE_BACKEND"] = "shared"
+    state_server = start_state_server()
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        state_server.terminate()
+        state_server.wait()
@@ -0,0 +1,150 @@
+# order state backends: local keeps the orders, books, write-ahead log and order archive in the worker process,
+# shared moves them to one state server process that every worker reaches over a local socket, with
+# a broadcast hub next to it so updates reach websocket subscribers on every worker, together with the
+# market data every worker prices executions at.
+# run the state server with: python -m state (serve.py starts it together with the workers)
+import asyncio
+import os
+import signal
+import threading
+from multiprocessing.managers import BaseManager
+from typing import Optional, Tuple
+import logging
+
+import config
+from exchange import Exchange
+from idempotency import IdempotencyCache
+from instruments import instruments
+from logging_pipeline import setup_logging
+from market_data import build_engine
+from matching_engine import MatchingEngine
+from order_archive import Archiver, OrderArchive
+from order_store import OrderStore
+from pubsub import BroadcastHub
+from wal import WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKENDS = ("local", "shared")
+
+# what workers can call on the shared objects, every call is one round trip to the state server
+STORE_METHODS = ("add", "add_many", "get", "transition", "transition_many", "page", "by_status", "claim_pending",
+                 "count_by_status", "stats", "archive_usage", "__len__", "__contains__")
+EXCHANGE_METHODS = ("match", "cancel", "cancel_many")
+IDEMPOTENCY_METHODS = ("begin", "finish", "fail", "counts")
+
+
+def build_state() -> Tuple[OrderStore, Exchange, Optional[WriteAheadLog]]:
+    wal = None
+    if config.WAL_MODE != "off":
+        wal = WriteAheadLog(config.WAL_DIR, mode=config.WAL_MODE, commit_interval=config.WAL_COMMIT_INTERVAL_MS / 1000,
+                            snapshot_every=config.WAL_SNAPSHOT_EVERY)
+    archive = None
+    if config.ARCHIVE_ENABLED:
+        # nothing on disk is touched until recover_state() opens it
+        archive = OrderArchive(config.ARCHIVE_DIR, segment_bytes=config.ARCHIVE_SEGMENT_BYTES,
+                               retention=config.ARCHIVE_RETENTION, max_bytes=config.ARCHIVE_MAX_BYTES,
+                               durable=wal is not None)
+    store = OrderStore(journal=wal, cold=archive)
+    return store, Exchange(store, MatchingEngine()), wal
+
+
+def build_archiver(store: OrderStore) -> Optional[Archiver]:
+    # the task archiving the store's finished orders, per the ARCHIVE_* settings
+    if store.cold is None:
+        return None
+    return Archiver(store, config.ARCHIVE_INTERVAL_MS / 1000, config.ARCHIVE_AFTER,
+                    max_finished=config.ARCHIVE_MAX_FINISHED)
+
+
+def recover_state(exchange: Exchange, wal: Optional[WriteAheadLog]) -> int:
+    # rebuild the orders and books from the write-ahead log, returns the number of recovered orders.
+    # archived orders only outlive the process together with the log
+    if exchange.store.cold is not None:
+        exchange.store.cold.open(keep=wal is not None)
+    if wal is None:
+        return 0
+    recovered = wal.recover()
+    exchange.restore(recovered.values())
+    # archived orders aren't recovered, only their aggregates are
+    exchange.store.restore_archived(wal.archived)
+    wal.start()
+    return len(recovered)
+
+
+class StateManager(BaseManager):
+    pass
+
+
+StateManager.register("order_store", exposed=STORE_METHODS)
+StateManager.register("exchange", exposed=EXCHANGE_METHODS)
+StateManager.register("idempotency_cache", exposed=IDEMPOTENCY_METHODS)
+
+
+def connect_state():
+    # proxies of the state server's order store, exchange and idempotency cache
+    manager = StateManager(address=config.STATE_ADDRESS, authkey=config.STATE_AUTHKEY.encode())
+    manager.connect()
+    return manager.order_store(), manager.exchange(), manager.idempotency_cache()
+
+
+async def serve():
+    store, exchange, wal = build_state()
+    recovered = recover_state(exchange, wal)
+    logger.info("Recovered %d order(s)", recovered)
+    archiver = build_archiver(store)
+    if archiver is not None:
+        archiver.start()
+
+    class ServerManager(StateManager):
+        pass
+
+    ServerManager.register("order_store", callable=lambda: store, exposed=STORE_METHODS)
+    ServerManager.register("exchange", callable=lambda: exchange, exposed=EXCHANGE_METHODS)
+    # retries of a request are recognized whichever worker they land on
+    idempotency_cache = IdempotencyCache(config.IDEMPOTENCY_CACHE_SIZE, config.IDEMPOTENCY_TTL,
+                                         config.IDEMPOTENCY_LEASE)
+    ServerManager.register("idempotency_cache", callable=lambda: idempotency_cache, exposed=IDEMPOTENCY_METHODS)
+    if os.path.exists(config.STATE_ADDRESS):
+        os.remove(config.STATE_ADDRESS)
+    server = ServerManager(address=config.STATE_ADDRESS, authkey=config.STATE_AUTHKEY.encode()).get_server()
+    # proxied calls are served on their own threads, the store and exchange locks keep them consistent
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    hub = BroadcastHub(config.STATE_HUB_ADDRESS, commit=wal.commit if wal is not None else None)
+    await hub.start()
+    logger.info("State server listening on %s", config.STATE_ADDRESS)
+    # one market data engine for every worker, its quotes go out through the hub
+    market_data = None
+    if config.MARKET_DATA_ENABLED:
+        market_data = build_engine(list(instruments), lambda step: hub.publish_quotes(step.to_list()))
+        market_data.start()
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    await stopped.wait()
+
+    if market_data is not None:
+        await market_data.stop()
+    await hub.stop()
+    if archiver is not None:
+        await archiver.stop()
+        store.cold.close()
+    if wal is not None:
+        await wal.close()
+    # the manager's listener removes its own socket on exit
+    if os.path.exists(config.STATE_HUB_ADDRESS):
+        os.remove(config.STATE_HUB_ADDRESS)
+    logger.info("State server stopped")
+
+
+if __name__ == "__main__":
+    logging_pipeline = setup_logging(level=config.LOG_LEVEL, log_format=config.LOG_FORMAT,
+                                     sampling=config.LOG_SAMPLING, rate_limits=config.LOG_RATE_LIMITS,
+                                     queue_size=config.LOG_QUEUE_SIZE)
+    try:
+        asyncio.run(serve())
+    finally:
+        logging_pipeline.stop()
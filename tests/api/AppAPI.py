@@ -7,14 +7,32 @@ class ForexAPI:
         self.session = requests.Session()
         self.session.headers.update({'Content-Type': 'application/json'})
 
-    def get_orders(self):
+    def get_orders(self, params=None, headers=None):
         endpoint = f"{self.base_url}/orders"
-        r = self.session.get(endpoint)
+        r = self.session.get(endpoint, params=params, headers=headers)
+        return r
+
+    def get_all_orders(self, params=None):
+        # every matching order, page by page
+        params = dict(params or {})
+        orders = []
+        while True:
+            r = self.get_orders(params=params)
+            r.raise_for_status()
+            orders.extend(r.json())
+            if "X-Next-Cursor" not in r.headers:
+                return orders
+            params["cursor"] = r.headers["X-Next-Cursor"]
+
+    def post_orders(self, order_request, headers=None):
+        endpoint = f"{self.base_url}/orders"
+        r = self.session.post(endpoint, json=order_request, headers=headers)
         return r
 
-    def post_orders(self, order_request):
+    def post_orders_raw(self, body):
+        # sends the body as it is, for JSON that requests won't encode such as NaN and Infinity
         endpoint = f"{self.base_url}/orders"
-        r = self.session.post(endpoint, json=order_request)
+        r = self.session.post(endpoint, data=body)
         return r
 
     def get_order_by_id(self, order_id):
@@ -26,3 +44,23 @@ class ForexAPI:
         endpoint = f"{self.base_url}/orders/{order_id}"
         r = self.session.delete(endpoint)
         return r
+
+    def post_orders_batch(self, order_requests):
+        endpoint = f"{self.base_url}/orders/batch"
+        r = self.session.post(endpoint, json=order_requests)
+        return r
+
+    def delete_orders_batch(self, order_ids):
+        endpoint = f"{self.base_url}/orders/batch"
+        r = self.session.delete(endpoint, json=order_ids)
+        return r
+
+    def get_stats(self):
+        endpoint = f"{self.base_url}/stats"
+        r = self.session.get(endpoint)
+        return r
+
+    def get_metrics(self):
+        endpoint = f"{self.base_url}/metrics"
+        r = self.session.get(endpoint)
+        return r
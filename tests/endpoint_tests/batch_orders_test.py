@@ -0,0 +1,88 @@
+import pytest
+import uuid
+
+
+@pytest.mark.smoke
+def test_post_orders_batch(forex_api_session):
+    order_requests = [
+        {"stocks": "EURUSD", "quantity": 10},
+        {"stocks": "GBPUSD", "quantity": 2.5},
+        {"stocks": "USDJPY", "quantity": 1},
+    ]
+    print(f"Sending batch order request with body: {order_requests}")
+    batch_response = forex_api_session.post_orders_batch(order_requests)
+    assert batch_response.status_code == 200, (f"Failed sending batch order request: "
+                                               f"{batch_response.status_code, batch_response.content}")
+
+    results = batch_response.json()
+    assert len(results) == len(order_requests)
+
+    errors = []
+    # iterate through response elements and store all errors instead of failing at first assert
+    for order_request, result in zip(order_requests, results):
+        if not result["success"]:
+            errors.append(f"Order {result['index']} rejected: {result['detail']}")
+            continue
+        if result["order"]["stocks"] != order_request["stocks"]:
+            errors.append(f"Stock mismatch. Expected {order_request['stocks']} but got {result['order']['stocks']}")
+        if result["order"]["quantity"] != order_request["quantity"]:
+            errors.append(f"Quantity mismatch. Expected {order_request['quantity']} "
+                          f"but got {result['order']['quantity']}")
+        if result["order"]["status"] != "PENDING":
+            errors.append(f"Status mismatch. Expected PENDING but got {result['order']['status']}")
+
+    # check no errors encountered
+    assert len(errors) == 0, f"Found errors: {errors}"
+
+    # every created order can be retrieved on its own
+    for result in results:
+        get_response = forex_api_session.get_order_by_id(result["order"]["id"])
+        assert get_response.status_code == 200
+
+
+@pytest.mark.negative
+def test_post_orders_batch_partial_failure(forex_api_session):
+    order_requests = [
+        {"stocks": "EURUSD", "quantity": 10},
+        {"stocks": "EURUSDFFA", "quantity": 1},
+        {"stocks": "EURUSD", "quantity": -10},
+    ]
+    batch_response = forex_api_session.post_orders_batch(order_requests)
+    assert batch_response.status_code == 200, f"Expected 200, got {batch_response.status_code}"
+
+    results = batch_response.json()
+    assert [result["success"] for result in results] == [True, False, False]
+    assert results[1]["detail"] == "Invalid currency pair symbol"
+    assert results[2]["detail"] == "Order quantity must be greater than zero"
+    assert results[1]["order"] is None
+
+
+@pytest.mark.smoke
+def test_cancel_orders_batch(forex_api_session):
+    batch_response = forex_api_session.post_orders_batch([{"stocks": "EURUSD", "quantity": 10}] * 2)
+    assert batch_response.status_code == 200
+    order_ids = [result["order"]["id"] for result in batch_response.json()]
+    nonexistent_order_id = str(uuid.uuid4())
+
+    delete_response = forex_api_session.delete_orders_batch(order_ids + [nonexistent_order_id])
+    assert delete_response.status_code == 200, f"Expected 200, got {delete_response.status_code}"
+
+    results = delete_response.json()
+    assert [result["order_id"] for result in results] == order_ids + [nonexistent_order_id]
+    assert [result["success"] for result in results] == [True, True, False]
+    assert results[2]["detail"] == "Order not found or already executed"
+
+    for order_id in order_ids:
+        get_response = forex_api_session.get_order_by_id(order_id)
+        assert get_response.json()["status"] == "CANCELED"
+
+    # canceling the same orders again fails for every item
+    delete_response = forex_api_session.delete_orders_batch(order_ids)
+    assert [result["success"] for result in delete_response.json()] == [False, False]
+
+
+@pytest.mark.negative
+def test_post_orders_batch_too_large(forex_api_session):
+    batch_response = forex_api_session.post_orders_batch([{"stocks": "EURUSD", "quantity": 1}] * 1001)
+    assert batch_response.status_code == 400, f"Expected 400, got {batch_response.status_code}"
+    assert batch_response.json()["detail"] == "Batch can't hold more than 1000 items"
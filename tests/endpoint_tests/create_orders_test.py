@@ -38,6 +38,7 @@ def test_post_new_order(forex_api_session, load_sample_order, quantity):
 @pytest.mark.parametrize("invalid_stocks, expected_detail", [
     ("", "Invalid currency pair symbol"),
     ("EURUSDFFA", "Invalid currency pair symbol"),
+    ("ABCXYZ", "Invalid currency pair symbol"),
 ])
 def test_post_new_order_invalid_symbol(forex_api_session, invalid_stocks, expected_detail):
     # create an invalid order request
@@ -60,6 +61,8 @@ def test_post_new_order_invalid_symbol(forex_api_session, invalid_stocks, expect
 @pytest.mark.parametrize("invalid_quantity, expected_detail", [
     (0, "Order quantity must be greater than zero"),
     (-10, "Order quantity must be greater than zero"),
+    (0.001, "Order quantity must be at least 0.01"),
+    (1.005, "Order quantity must be a multiple of 0.01"),
     ("eurusd", "Order quantity must be an integer"),
 ])
 def test_post_new_order_invalid_quantity(forex_api_session, invalid_quantity, expected_detail):
@@ -78,3 +81,17 @@ def test_post_new_order_invalid_quantity(forex_api_session, invalid_quantity, ex
 
     error_response = new_order_request.json()
     assert error_response["detail"] == expected_detail
+
+
+@pytest.mark.negative
+@pytest.mark.parametrize("invalid_quantity", ["Infinity", "-Infinity", "NaN"])
+def test_post_new_order_non_finite_quantity(forex_api_session, invalid_quantity):
+    body = f'{{"stocks": "EURUSD", "quantity": {invalid_quantity}}}'
+    print(f"Sending order with non finite quantity {body}")
+
+    new_order_request = forex_api_session.post_orders_raw(body)
+    assert new_order_request.status_code == 400, (f"Expected status code 400 for invalid data, got: "
+                                                  f"{new_order_request.status_code}")
+    expected_detail = ("Order quantity must be greater than zero" if invalid_quantity == "-Infinity"
+                       else "Order quantity must be a finite number")
+    assert new_order_request.json()["detail"] == expected_detail
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 
@@ -25,17 +27,14 @@ def setup_new_order(forex_api_session, load_sample_order):
 @pytest.mark.smoke
 def test_get_all_orders(forex_api_session, setup_new_order):
     order_stock, order_quantity, order_id, order_status = setup_new_order
-    api_response = forex_api_session.get_orders()
-    assert api_response.status_code == 200, (f"Failed to retrieve orders: "
-                                             f"{api_response.status_code, api_response.content}")
+    orders = forex_api_session.get_all_orders()
 
-    print(f"Get all orders response: {api_response.json()}")
+    print(f"Got {len(orders)} orders")
 
-    assert order_id in [item["id"] for item in api_response.json()], (f"New order with id {order_id} "
-                                                                      f"missing from api response")
+    assert order_id in [item["id"] for item in orders], f"New order with id {order_id} missing from api response"
     errors = []
     # iterate through response elements and store all errors instead of failing at first assert
-    for item in api_response.json():
+    for item in orders:
         if item["id"] == order_id:
             if item["stocks"] != order_stock:
                 errors.append(f"Wrong stock in api response. Expected {order_stock} but got {item['stocks']}")
@@ -50,6 +49,26 @@ def test_get_all_orders(forex_api_session, setup_new_order):
     assert len(errors) == 0, f"Found errors: {errors}"
 
 
+@pytest.mark.smoke
+def test_get_orders_default_page_size(forex_api_session, load_sample_order):
+    new_order = load_sample_order
+    new_order["stocks"] = "GBPUSD"
+    new_order["quantity"] = 5
+    first = forex_api_session.post_orders(order_request=new_order).json()
+    batch_response = forex_api_session.post_orders_batch([new_order] * 101)
+    assert batch_response.status_code == 200
+
+    # without a limit the response is a page of 100 orders, streaming still goes over all of them
+    params = {"stocks": "GBPUSD", "created_after": first["created_at"]}
+    api_response = forex_api_session.get_orders(params=params)
+    assert api_response.status_code == 200
+    assert len(api_response.json()) == 100
+    assert "X-Next-Cursor" in api_response.headers
+    assert len(forex_api_session.get_all_orders(params)) >= 101
+    stream_response = forex_api_session.get_orders(params={**params, "stream": "true"})
+    assert len(stream_response.text.splitlines()) >= 101
+
+
 @pytest.mark.smoke
 def test_get_order_by_id(forex_api_session, setup_new_order):
     order_stock, order_quantity, order_id, order_status = setup_new_order
@@ -82,3 +101,63 @@ def test_get_order_bad_id(forex_api_session, setup_new_order):
     api_response = forex_api_session.get_order_by_id(bad_uuid)
     assert api_response.status_code == 404, f"Got api response: {api_response.status_code} for order id: {bad_uuid}"
     assert api_response.json()["detail"] == "Order not found"
+
+
+@pytest.mark.smoke
+def test_get_orders_paginated(forex_api_session, load_sample_order):
+    new_order = load_sample_order
+    new_order["stocks"] = "GBPUSD"
+    new_order["quantity"] = 5
+    created_ids = []
+    for _ in range(3):
+        new_order_request = forex_api_session.post_orders(order_request=new_order)
+        assert new_order_request.status_code == 201
+        created_ids.append(new_order_request.json()["id"])
+    created_after = forex_api_session.get_order_by_id(created_ids[0]).json()["created_at"]
+
+    # walk the pages after the first order one by one
+    params = {"stocks": "GBPUSD", "created_after": created_after, "limit": 1}
+    page_ids = []
+    while True:
+        api_response = forex_api_session.get_orders(params=params)
+        assert api_response.status_code == 200, (f"Failed to retrieve orders page: "
+                                                 f"{api_response.status_code, api_response.content}")
+        assert len(api_response.json()) <= 1
+        page_ids.extend(item["id"] for item in api_response.json())
+        if "X-Next-Cursor" not in api_response.headers:
+            break
+        params["cursor"] = api_response.headers["X-Next-Cursor"]
+
+    assert page_ids[:2] == created_ids[1:], f"Expected orders {created_ids[1:]} in pages, got {page_ids}"
+
+
+@pytest.mark.smoke
+def test_get_orders_filtered_by_status(forex_api_session, setup_new_order):
+    order_stock, order_quantity, order_id, order_status = setup_new_order
+    delete_response = forex_api_session.delete_order_by_id(order_id=order_id)
+    assert delete_response.status_code == 204
+
+    orders = forex_api_session.get_all_orders(params={"status": "CANCELED"})
+    assert order_id in [item["id"] for item in orders]
+    assert all(item["status"] == "CANCELED" for item in orders)
+
+    orders = forex_api_session.get_all_orders(params={"status": "PENDING"})
+    assert order_id not in [item["id"] for item in orders]
+
+
+@pytest.mark.smoke
+def test_get_orders_stream(forex_api_session, setup_new_order):
+    order_stock, order_quantity, order_id, order_status = setup_new_order
+    api_response = forex_api_session.get_orders(headers={"Accept": "application/x-ndjson"})
+    assert api_response.status_code == 200
+    assert api_response.headers["content-type"].startswith("application/x-ndjson")
+
+    orders = [json.loads(line) for line in api_response.text.splitlines()]
+    assert order_id in [item["id"] for item in orders], f"New order with id {order_id} missing from stream"
+
+
+@pytest.mark.negative
+def test_get_orders_bad_cursor(forex_api_session):
+    api_response = forex_api_session.get_orders(params={"cursor": "not-a-cursor"})
+    assert api_response.status_code == 400, f"Got api response: {api_response.status_code}"
+    assert api_response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,60 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.AppAPI import ForexAPI
+
+
+@pytest.mark.smoke
+def test_retry_with_idempotency_key_returns_first_order(forex_api_session, load_sample_order):
+    new_order = load_sample_order
+    new_order["stocks"] = "GBPUSD"
+    new_order["quantity"] = 2
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    response = forex_api_session.post_orders(order_request=new_order, headers=headers)
+    assert response.status_code == 201, f"Failed sending new order request: {response.status_code}"
+    assert "Idempotent-Replayed" not in response.headers
+    order = response.json()
+
+    retry_response = forex_api_session.post_orders(order_request=new_order, headers=headers)
+    assert retry_response.status_code == 201, f"Expected 201, got {retry_response.status_code}"
+    assert retry_response.headers["Idempotent-Replayed"] == "true"
+    assert retry_response.json() == order
+
+    # without the key the same body is a new order
+    other_response = forex_api_session.post_orders(order_request=new_order)
+    assert other_response.status_code == 201, f"Expected 201, got {other_response.status_code}"
+    assert other_response.json()["id"] != order["id"]
+
+
+def test_idempotency_key_reused_for_another_order(forex_api_session, load_sample_order):
+    new_order = load_sample_order
+    new_order["stocks"] = "GBPUSD"
+    new_order["quantity"] = 2
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    response = forex_api_session.post_orders(order_request=new_order, headers=headers)
+    assert response.status_code == 201, f"Failed sending new order request: {response.status_code}"
+
+    new_order["quantity"] = new_order["quantity"] + 1
+    reused_response = forex_api_session.post_orders(order_request=new_order, headers=headers)
+    assert reused_response.status_code == 422, f"Expected 422, got {reused_response.status_code}"
+
+
+def test_concurrent_requests_with_idempotency_key_create_one_order(forex_api_session, load_sample_order):
+    new_order = load_sample_order
+    new_order["stocks"] = "GBPUSD"
+    new_order["quantity"] = 2
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    # one session per request, they're sent at the same time
+    def post(_):
+        return ForexAPI(base_url=forex_api_session.base_url).post_orders(order_request=new_order, headers=headers)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(post, range(8)))
+
+    assert all(response.status_code == 201 for response in responses), [r.status_code for r in responses]
+    assert len({response.json()["id"] for response in responses}) == 1
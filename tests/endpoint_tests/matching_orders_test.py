@@ -0,0 +1,145 @@
+import pytest
+
+PAIR = "NZDUSD"
+
+
+@pytest.fixture(scope='function')
+def empty_book(forex_api_session):
+    # cancel whatever earlier runs left resting in the book so fills are predictable
+    def clear():
+        pending = forex_api_session.get_all_orders(params={"status": "PENDING", "stocks": PAIR})
+        if pending:
+            forex_api_session.delete_orders_batch([order["id"] for order in pending])
+
+    clear()
+    yield
+    clear()
+
+
+@pytest.mark.smoke
+def test_limit_orders_match(forex_api_session, empty_book):
+    sell_response = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 10, "side": "SELL", "price": 0.61})
+    assert sell_response.status_code == 201, f"Failed sending sell order: {sell_response.content}"
+    sell_order = sell_response.json()
+    assert sell_order["status"] == "PENDING"
+    assert sell_order["order_type"] == "LIMIT"
+    assert sell_order["filled_quantity"] == 0
+
+    # buy less than the resting sell at a better price, the buy fills at the resting price
+    buy_response = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 4, "side": "BUY", "price": 0.62})
+    assert buy_response.status_code == 201, f"Failed sending buy order: {buy_response.content}"
+    buy_order = buy_response.json()
+
+    errors = []
+    # iterate through response elements and store all errors instead of failing at first assert
+    if buy_order["status"] != "EXECUTED":
+        errors.append(f"Buy status mismatch. Expected EXECUTED but got {buy_order['status']}")
+    if buy_order["average_price"] != 0.61:
+        errors.append(f"Buy price mismatch. Expected 0.61 but got {buy_order['average_price']}")
+    sell_order = forex_api_session.get_order_by_id(sell_order["id"]).json()
+    if sell_order["status"] != "PENDING":
+        errors.append(f"Sell status mismatch. Expected PENDING but got {sell_order['status']}")
+    if sell_order["filled_quantity"] != 4:
+        errors.append(f"Sell filled quantity mismatch. Expected 4 but got {sell_order['filled_quantity']}")
+
+    # check no errors encountered
+    assert len(errors) == 0, f"Found errors: {errors}"
+
+
+@pytest.mark.smoke
+def test_price_time_priority(forex_api_session, empty_book):
+    first = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 5, "side": "BUY", "price": 0.60}).json()
+    second = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 5, "side": "BUY", "price": 0.60}).json()
+    better = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 5, "side": "BUY", "price": 0.605}).json()
+
+    # a market sell takes the best price first, then the oldest order at the next price
+    sell_response = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 8, "side": "SELL", "order_type": "MARKET"})
+    assert sell_response.status_code == 201
+    assert sell_response.json()["status"] == "EXECUTED"
+    assert sell_response.json()["average_price"] == pytest.approx((5 * 0.605 + 3 * 0.60) / 8)
+
+    assert forex_api_session.get_order_by_id(better["id"]).json()["status"] == "EXECUTED"
+    assert forex_api_session.get_order_by_id(first["id"]).json()["filled_quantity"] == 3
+    assert forex_api_session.get_order_by_id(second["id"]).json()["filled_quantity"] == 0
+
+
+@pytest.mark.smoke
+def test_market_order_remainder_canceled(forex_api_session, empty_book):
+    forex_api_session.post_orders(order_request={"stocks": PAIR, "quantity": 2, "side": "SELL", "price": 0.63})
+
+    buy_response = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 5, "side": "BUY", "order_type": "MARKET"})
+    assert buy_response.status_code == 201
+    buy_order = buy_response.json()
+    assert buy_order["status"] == "CANCELED"
+    assert buy_order["filled_quantity"] == 2
+
+
+@pytest.mark.smoke
+def test_cancel_resting_order(forex_api_session, empty_book):
+    sell_order = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 3, "side": "SELL", "price": 0.64}).json()
+    delete_response = forex_api_session.delete_order_by_id(order_id=sell_order["id"])
+    assert delete_response.status_code == 204
+
+    # the canceled order left the book, so nothing is there to match
+    buy_order = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 3, "side": "BUY", "order_type": "MARKET"}).json()
+    assert buy_order["status"] == "CANCELED"
+    assert buy_order["filled_quantity"] == 0
+
+
+@pytest.mark.negative
+@pytest.mark.parametrize("invalid_order, expected_detail", [
+    ({"stocks": PAIR, "quantity": 1, "price": 0.6}, "Only orders with a side can set a price or order type"),
+    ({"stocks": PAIR, "quantity": 1, "side": "BUY", "order_type": "MARKET", "price": 0.6},
+     "Market orders can't have a price"),
+    ({"stocks": PAIR, "quantity": 1, "side": "BUY", "order_type": "LIMIT"},
+     "Limit orders need a price greater than zero"),
+    ({"stocks": PAIR, "quantity": 1, "side": "SELL", "price": -1}, "Limit orders need a price greater than zero"),
+    ({"stocks": PAIR, "quantity": 1, "side": "BUY", "price": 0.600001}, "Price must be a multiple of 0.00001"),
+])
+def test_post_invalid_book_order(forex_api_session, invalid_order, expected_detail):
+    print(f"Sending invalid book order {invalid_order}")
+    new_order_request = forex_api_session.post_orders(order_request=invalid_order)
+    assert new_order_request.status_code == 400, (f"Expected status code 400 for invalid data, got: "
+                                                  f"{new_order_request.status_code}")
+    assert new_order_request.json()["detail"] == expected_detail
+
+
+@pytest.mark.negative
+@pytest.mark.parametrize("invalid_price", ["Infinity", "NaN"])
+def test_post_book_order_non_finite_price(forex_api_session, invalid_price):
+    body = f'{{"stocks": "{PAIR}", "quantity": 1, "side": "BUY", "price": {invalid_price}}}'
+    print(f"Sending book order with non finite price {body}")
+    new_order_request = forex_api_session.post_orders_raw(body)
+    assert new_order_request.status_code == 400, (f"Expected status code 400 for invalid data, got: "
+                                                  f"{new_order_request.status_code}")
+    assert new_order_request.json()["detail"] == "Price must be a finite number"
+
+
+@pytest.mark.smoke
+def test_fractional_fills_leave_nothing_behind(forex_api_session, empty_book):
+    # 0.1 + 0.2 isn't 0.3 in floating point, fills count whole lots so both buys fill the sell completely
+    sell = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 0.3, "side": "SELL", "price": 1.1}).json()
+    first_buy = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 0.1, "side": "BUY", "price": 1.1}).json()
+    second_buy = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 0.2, "side": "BUY", "price": 1.1}).json()
+
+    for order, quantity in ((sell, 0.3), (first_buy, 0.1), (second_buy, 0.2)):
+        order = forex_api_session.get_order_by_id(order["id"]).json()
+        assert order["status"] == "EXECUTED", f"{order['side']} {quantity} is {order['status']}"
+        assert order["filled_quantity"] == quantity
+    # nothing rests in the book, a new sell doesn't match a leftover of the buys
+    next_sell = forex_api_session.post_orders(
+        order_request={"stocks": PAIR, "quantity": 0.1, "side": "SELL", "price": 1.1}).json()
+    assert next_sell["status"] == "PENDING"
+    assert next_sell["filled_quantity"] == 0
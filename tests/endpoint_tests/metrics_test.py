@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+
+def scrape(forex_api_session):
+    # sample name with its labels -> value
+    response = forex_api_session.get_metrics()
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    assert response.headers["Content-Type"].startswith("text/plain")
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+@pytest.mark.smoke
+def test_metrics_follow_requests(forex_api_session, load_sample_order):
+    order_series = 'trading_http_request_duration_seconds_count{method="GET",route="/orders/{orderId}"}'
+    before = scrape(forex_api_session).get(order_series, 0)
+
+    new_order = load_sample_order
+    new_order["stocks"] = "EURUSD"
+    new_order["quantity"] = 10
+    response = forex_api_session.post_orders(order_request=new_order)
+    assert response.status_code == 201, f"Failed sending new order request: {response.status_code}"
+    order_id = response.json()["id"]
+    response = forex_api_session.get_order_by_id(order_id=order_id)
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+
+    samples = scrape(forex_api_session)
+    # requests are counted by route template, not by the order id in their path
+    assert samples[order_series] == before + 1
+    assert not any(order_id in name for name in samples)
+    assert any(re.match(r'trading_http_request_duration_seconds_bucket\{method="GET",route="/orders/\{orderId}",le=',
+                        name) for name in samples)
+
+    # the gauges are read when scraped. orders may execute in between, but their total is the same as in the
+    # stats, the order just created included. websocket connections are followed in the ws tests
+    stats = forex_api_session.get_stats().json()
+    assert sum(samples[f'trading_orders{{status="{status}"}}'] for status in stats["orders"]) == \
+        sum(stats["orders"].values())
+    assert samples['trading_orders{status="PENDING"}'] + samples['trading_orders{status="EXECUTED"}'] >= 1
+    assert samples["trading_ws_connections"] >= 0
@@ -0,0 +1,39 @@
+import pytest
+
+
+def pair_stats(forex_api_session, pair):
+    response = forex_api_session.get_stats()
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    stats = response.json()
+    empty = {"orders": {"PENDING": 0, "EXECUTED": 0, "CANCELED": 0}, "pending_quantity": 0, "executed_quantity": 0}
+    return stats, stats["pairs"].get(pair, empty)
+
+
+@pytest.mark.smoke
+def test_stats_follow_order_changes(forex_api_session, load_sample_order):
+    _, before = pair_stats(forex_api_session, "AUDUSD")
+
+    new_order = load_sample_order
+    new_order["stocks"] = "AUDUSD"
+    new_order["quantity"] = 3
+    response = forex_api_session.post_orders(order_request=new_order)
+    assert response.status_code == 201, f"Failed sending new order request: {response.status_code}"
+    order_id = response.json()["id"]
+
+    # the new order counts as pending right away
+    stats, pending = pair_stats(forex_api_session, "AUDUSD")
+    assert pending["orders"]["PENDING"] == before["orders"]["PENDING"] + 1
+    assert pending["pending_quantity"] == pytest.approx(before["pending_quantity"] + 3)
+    assert stats["rates"]["10s"]["created"] > 0
+    assert stats["orders"]["PENDING"] >= pending["orders"]["PENDING"]
+
+    delete_response = forex_api_session.delete_order_by_id(order_id=order_id)
+    assert delete_response.status_code == 204, f"Expected 204, got {delete_response.status_code}"
+
+    # canceling moves it over without filling anything
+    stats, canceled = pair_stats(forex_api_session, "AUDUSD")
+    assert canceled["orders"]["PENDING"] == before["orders"]["PENDING"]
+    assert canceled["orders"]["CANCELED"] == before["orders"]["CANCELED"] + 1
+    assert canceled["pending_quantity"] == pytest.approx(before["pending_quantity"])
+    assert canceled["executed_quantity"] == pytest.approx(before["executed_quantity"])
+    assert stats["rates"]["10s"]["canceled"] > 0
@@ -0,0 +1,74 @@
+# HdrHistogram style latency recording: values in microseconds go into log-linear buckets that keep
+# `significant_digits` digits of precision at any magnitude, so p99.9 of a run spanning microseconds to
+# minutes costs a few hundred counters instead of every sample
+import math
+from typing import Dict
+
+
+class LatencyHistogram:
+    def __init__(self, significant_digits: int = 2):
+        # every power of two range is split into sub buckets fine enough for the requested precision
+        self.sub_bucket_bits = (2 * 10 ** significant_digits - 1).bit_length()
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count // 2
+        # bucket index -> count, sparse since latencies cluster in a few ranges
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.sub_bucket_half + (value >> shift) - self.sub_bucket_half
+
+    def _highest_equivalent(self, index: int) -> int:
+        # largest value that lands in a bucket, what percentiles report like HdrHistogram does
+        if index < self.sub_bucket_count:
+            return index
+        shift, offset = divmod(index - self.sub_bucket_count, self.sub_bucket_half)
+        shift += 1
+        return ((offset + self.sub_bucket_half) << shift) + (1 << shift) - 1
+
+    def record(self, microseconds: float):
+        value = max(0, int(microseconds))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> int:
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(percent / 100 * self.total))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                # never above the exact max, the last bucket can reach past it
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        # milliseconds, the unit of the JSON report
+        return {"count": self.total,
+                "mean": round(self.sum / self.total / 1000, 3) if self.total else 0.0,
+                "min": round((self.min or 0) / 1000, 3),
+                "p50": round(self.percentile(50) / 1000, 3),
+                "p90": round(self.percentile(90) / 1000, 3),
+                "p99": round(self.percentile(99) / 1000, 3),
+                "p999": round(self.percentile(99.9) / 1000, 3),
+                "max": round(self.max / 1000, 3)}
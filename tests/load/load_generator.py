@@ -0,0 +1,304 @@
+# open-loop load generator: requests go out at Poisson arrival times for a target rate whether or not the
+# earlier ones came back, and every latency is measured from when its request was due rather than when it
+# was sent, so a stalling server shows up in the tail instead of quietly slowing the generator down
+# (coordinated omission). created orders are subscribed to over WebSocket to time them until executed.
+# run from the tests directory against a running server:
+#   python -m load.load_generator --rate 200 --duration 30 --subscribers 4
+#   python -m load.load_generator --baseline load_baseline.json --save-baseline
+#   python -m load.load_generator --baseline load_baseline.json --threshold 0.2
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+from websockets import ConnectionClosed, connect
+
+from load.latency_histogram import LatencyHistogram
+
+OPERATIONS = ("create", "get", "cancel")
+# latency percentiles compared against a baseline
+REGRESSION_PERCENTILES = ("p50", "p99", "p999")
+
+
+class LoadConfig(NamedTuple):
+    base_url: str = "http://localhost:8000"
+    # mean requests per second and seconds of load
+    rate: float = 100.0
+    duration: float = 10.0
+    # WebSocket connections the created orders' subscriptions are spread over, 0 skips execution timing
+    subscribers: int = 2
+    # share of each operation, gets and cancels fall back to creates until there are orders to pick from
+    mix: Dict[str, float] = {"create": 0.6, "get": 0.3, "cancel": 0.1}
+    symbols: Tuple[str, ...] = ("EURUSD", "GBPUSD", "USDJPY")
+    quantity: float = 10
+    # max open HTTP connections, requests beyond it queue in the client and that wait counts as latency
+    connections: int = 256
+    # how long to wait after the load for the executions of orders still pending
+    execution_timeout: float = 20.0
+    seed: Optional[int] = None
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    # "create=0.6,get=0.3,cancel=0.1" -> {"create": 0.6, "get": 0.3, "cancel": 0.1}
+    mix = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        operation, _, share = item.partition("=")
+        if operation.strip() not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        mix[operation.strip()] = float(share)
+    return mix
+
+
+class LoadRun:
+    def __init__(self, config: LoadConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.operations = [operation for operation in OPERATIONS if config.mix.get(operation, 0) > 0]
+        self.weights = [config.mix[operation] for operation in self.operations]
+        self.latencies = {operation: LatencyHistogram() for operation in OPERATIONS}
+        # operation -> response status (or "error" when there was no response) -> count
+        self.statuses: Dict[str, Dict[str, int]] = {operation: {} for operation in OPERATIONS}
+        # how late requests went out compared to their arrival time, high values mean the generator
+        # itself couldn't keep up
+        self.send_lag = LatencyHistogram()
+        self.execution_latency = LatencyHistogram()
+        # order id -> loop time its create was due, for orders waiting for their execution update
+        self.awaiting_execution: Dict[str, float] = {}
+        # created orders that weren't canceled, what gets and cancels pick from
+        self.live_orders: List[str] = []
+        self.subscribers = []
+        self._next_subscriber = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.load_done = False
+        self.executions_done = asyncio.Event()
+
+    def _pick(self) -> str:
+        operation = self.random.choices(self.operations, self.weights)[0]
+        return operation if operation == "create" or self.live_orders else "create"
+
+    async def _subscribe(self, order_id: str, due: float):
+        if not self.subscribers:
+            return
+        websocket = self.subscribers[self._next_subscriber % len(self.subscribers)]
+        self._next_subscriber += 1
+        self.awaiting_execution[order_id] = due
+        await websocket.send(json.dumps({"action": "subscribe", "order_id": order_id}))
+
+    async def _request(self, session: aiohttp.ClientSession, operation: str, due: float):
+        loop = asyncio.get_running_loop()
+        self.send_lag.record((loop.time() - due) * 1e6)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        url = f"{self.config.base_url}/orders"
+        status = "error"
+        try:
+            if operation == "create":
+                order = {"stocks": self.random.choice(self.config.symbols), "quantity": self.config.quantity}
+                async with session.post(url, json=order) as response:
+                    body = await response.read()
+                    status = response.status
+                if status == 201:
+                    order_id = json.loads(body)["id"]
+                    self.live_orders.append(order_id)
+                    await self._subscribe(order_id, due)
+            elif operation == "get":
+                async with session.get(f"{url}/{self.random.choice(self.live_orders)}") as response:
+                    await response.read()
+                    status = response.status
+            else:
+                # swap remove a random live order, it won't be picked again whatever the outcome
+                index = self.random.randrange(len(self.live_orders))
+                self.live_orders[index], self.live_orders[-1] = self.live_orders[-1], self.live_orders[index]
+                order_id = self.live_orders.pop()
+                async with session.delete(f"{url}/{order_id}") as response:
+                    await response.read()
+                    status = response.status
+                if status == 204:
+                    self.awaiting_execution.pop(order_id, None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.in_flight -= 1
+            self.latencies[operation].record((loop.time() - due) * 1e6)
+            statuses = self.statuses[operation]
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    async def _read(self, websocket):
+        loop = asyncio.get_running_loop()
+        try:
+            async for frame in websocket:
+                message = json.loads(frame)
+                # aggregated updates come in as an array
+                for update in message if isinstance(message, list) else [message]:
+                    if update.get("action") == "order_executed":
+                        due = self.awaiting_execution.pop(update["data"]["id"], None)
+                        if due is not None:
+                            self.execution_latency.record((loop.time() - due) * 1e6)
+                if self.load_done and not self.awaiting_execution:
+                    self.executions_done.set()
+        except ConnectionClosed:
+            # orders it was subscribed to stay missing in the report
+            pass
+
+    async def run(self) -> dict:
+        loop = asyncio.get_running_loop()
+        ws_url = "ws" + self.config.base_url[len("http"):] + "/ws"
+        connector = aiohttp.TCPConnector(limit=self.config.connections)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            self.subscribers = [await connect(ws_url, ping_interval=None) for _ in range(self.config.subscribers)]
+            readers = [asyncio.create_task(self._read(websocket)) for websocket in self.subscribers]
+            try:
+                start = due = loop.time()
+                end = start + self.config.duration
+                tasks = set()
+                while True:
+                    due += self.random.expovariate(self.config.rate)
+                    if due >= end:
+                        break
+                    # arrivals that are already due go out right away, never later ones early
+                    if due > loop.time():
+                        await asyncio.sleep(due - loop.time())
+                    task = asyncio.create_task(self._request(session, self._pick(), due))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    self.requests += 1
+                if tasks:
+                    await asyncio.wait(tasks)
+                elapsed = loop.time() - start
+                self.load_done = True
+                if self.awaiting_execution:
+                    try:
+                        await asyncio.wait_for(self.executions_done.wait(), self.config.execution_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                for reader in readers:
+                    reader.cancel()
+                for websocket in self.subscribers:
+                    await websocket.close()
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        for operation in OPERATIONS:
+            statuses = self.statuses[operation]
+            # transport failures and server errors, 404s of gets and cancels racing an execution are expected
+            errors = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 500)
+            operations[operation] = {"latency_ms": self.latencies[operation].summary(), "statuses": statuses,
+                                     "errors": errors}
+        return {"config": self.config._asdict(),
+                "requests": self.requests,
+                "duration": round(elapsed, 3),
+                "achieved_rate": round(self.requests / elapsed, 1) if elapsed else 0.0,
+                "max_in_flight": self.max_in_flight,
+                "send_lag_ms": self.send_lag.summary(),
+                "operations": operations,
+                "executions": {"latency_ms": self.execution_latency.summary(),
+                               "missing": len(self.awaiting_execution)}}
+
+
+async def run_load(config: LoadConfig) -> dict:
+    return await LoadRun(config).run()
+
+
+def compare(report: dict, baseline: dict, threshold: float = 0.2, min_delta_ms: float = 1.0) -> List[str]:
+    # regressions of a report against a baseline: a latency percentile more than threshold (a share) and
+    # min_delta_ms above it, a higher error rate or a lower achieved rate
+    regressions = []
+    sections = [(operation, report["operations"][operation]["latency_ms"],
+                 baseline["operations"].get(operation, {}).get("latency_ms")) for operation in OPERATIONS]
+    sections.append(("execution", report["executions"]["latency_ms"], baseline["executions"]["latency_ms"]))
+    for name, current, previous in sections:
+        if not previous or not previous["count"] or not current["count"]:
+            continue
+        for percentile in REGRESSION_PERCENTILES:
+            limit = max(previous[percentile] * (1 + threshold), previous[percentile] + min_delta_ms)
+            if current[percentile] > limit:
+                regressions.append(f"{name} {percentile} latency {previous[percentile]} ms -> {current[percentile]} ms")
+    error_rate = sum(op["errors"] for op in report["operations"].values()) / max(1, report["requests"])
+    baseline_error_rate = sum(op["errors"] for op in baseline["operations"].values()) / max(1, baseline["requests"])
+    if error_rate > baseline_error_rate * (1 + threshold) and error_rate > 0:
+        regressions.append(f"error rate {baseline_error_rate:.2%} -> {error_rate:.2%}")
+    if report["achieved_rate"] < baseline["achieved_rate"] * (1 - threshold):
+        regressions.append(f"achieved rate {baseline['achieved_rate']} -> {report['achieved_rate']} requests/s")
+    return regressions
+
+
+def same_load(report: dict, baseline: dict) -> bool:
+    # whether two reports ran the same load, the server and seed may differ
+    ignored = {"base_url": None, "seed": None}
+    return json.loads(json.dumps({**report["config"], **ignored})) == {**baseline["config"], **ignored}
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{report['requests']} requests in {report['duration']} s ({report['achieved_rate']} requests/s), "
+             f"max {report['max_in_flight']} in flight",
+             f"{'ms':>10} {'count':>7} {'p50':>9} {'p99':>9} {'p999':>9} {'max':>9}"]
+    rows = [(operation, report["operations"][operation]["latency_ms"]) for operation in OPERATIONS]
+    rows += [("execution", report["executions"]["latency_ms"]), ("send lag", report["send_lag_ms"])]
+    for name, latency in rows:
+        lines.append(f"{name:>10} {latency['count']:>7} {latency['p50']:>9} {latency['p99']:>9} "
+                     f"{latency['p999']:>9} {latency['max']:>9}")
+    for operation in OPERATIONS:
+        lines.append(f"{operation} statuses: {report['operations'][operation]['statuses']}")
+    lines.append(f"executions missing: {report['executions']['missing']}")
+    return "\n".join(lines)
+
+
+def write_report(report: dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def read_report(path: str) -> dict:
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+if __name__ == "__main__":
+    defaults = LoadConfig()
+    parser = argparse.ArgumentParser(description="Open-loop load against the trading platform with a latency report")
+    parser.add_argument("--base-url", default=os.getenv("BASE_URL", defaults.base_url))
+    parser.add_argument("--rate", type=float, default=defaults.rate, help="mean requests per second")
+    parser.add_argument("--duration", type=float, default=defaults.duration, help="seconds of load")
+    parser.add_argument("--subscribers", type=int, default=defaults.subscribers)
+    parser.add_argument("--mix", type=parse_mix, default=defaults.mix, help="e.g. create=0.6,get=0.3,cancel=0.1")
+    parser.add_argument("--symbols", default=",".join(defaults.symbols))
+    parser.add_argument("--connections", type=int, default=defaults.connections)
+    parser.add_argument("--execution-timeout", type=float, default=defaults.execution_timeout)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--report", default="test_results/load_report.json", help="where the JSON report goes")
+    parser.add_argument("--baseline", help="saved report to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="save this run as the baseline instead")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression, 0.2 is 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="latency changes below it never fail")
+    args = parser.parse_args()
+
+    config = LoadConfig(base_url=args.base_url, rate=args.rate, duration=args.duration, subscribers=args.subscribers,
+                        mix=args.mix, symbols=tuple(args.symbols.split(",")), connections=args.connections,
+                        execution_timeout=args.execution_timeout, seed=args.seed)
+    report = asyncio.run(run_load(config))
+    print(format_report(report))
+    write_report(report, args.report)
+    if args.baseline and args.save_baseline:
+        write_report(report, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        baseline = read_report(args.baseline)
+        if not same_load(report, baseline):
+            print("Warning: the baseline was recorded with a different load configuration")
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
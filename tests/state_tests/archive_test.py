@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import pytest
+
+from exchange import Exchange
+from matching_engine import MatchingEngine
+from order_archive import OrderArchive
+from order_record import CANCELED, EXECUTED, PENDING, OrderRecord, new_id, now_timestamp, symbols
+from order_store import OrderStore
+from state import recover_state
+from wal import WriteAheadLog
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    import config
+    # the app reads its settings when it's imported: every finished order is archived right away, no
+    # simulated latency, no market data and nothing else written to disk
+    settings = dict(ARCHIVE_ENABLED=True, ARCHIVE_DIR=str(tmp_path_factory.mktemp("archive")), ARCHIVE_AFTER=0,
+                    ARCHIVE_INTERVAL_MS=10, LATENCY_ENABLED=False, LOG_LEVEL="OFF", MARKET_DATA_ENABLED=False,
+                    WAL_MODE="off", STATE_BACKEND="local")
+    for name, value in settings.items():
+        setattr(config, name, value)
+    import main
+    return main
+
+
+def open_state(directory):
+    wal = WriteAheadLog(str(directory / "wal"), mode="async", commit_interval=0.001)
+    store = OrderStore(journal=wal, cold=OrderArchive(str(directory / "archive"), durable=True))
+    recover_state(Exchange(store, MatchingEngine()), wal)
+    return store, wal
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_archived_order_found_by_id(app):
+    # ASGITransport doesn't run the app's lifespan, so state is opened and closed around the requests here
+    async with app.lifespan(app.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://app") as client:
+            response = await client.post("/orders", json={"stocks": "EURUSD", "quantity": 1})
+            assert response.status_code == 201, f"Failed sending new order request: {response.status_code}"
+            order_id = response.json()["id"]
+            response = await client.delete(f"/orders/{order_id}")
+            assert response.status_code == 204, f"Expected 204, got {response.status_code}"
+
+            store = app.orders.order_store
+            for _ in range(200):
+                if store.archive_usage()[0]:
+                    break
+                await asyncio.sleep(0.01)
+            assert store.archive_usage()[0] == 1
+            assert len(store) == 0
+
+            response = await client.get(f"/orders/{order_id}")
+            assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+            assert response.json()["id"] == order_id
+            assert response.json()["status"] == "CANCELED"
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+@pytest.mark.parametrize("snapshot", [False, True])
+async def test_stats_of_archived_orders_survive_restart(tmp_path, snapshot):
+    store, wal = open_state(tmp_path)
+    code = symbols.intern("USDJPY")
+    orders = [OrderRecord(new_id(), code, 10.0, created_at=now_timestamp()) for _ in range(6)]
+    store.add_many(orders)
+    store.transition_many([order.id for order in orders[:4]], PENDING, EXECUTED)
+    store.transition(orders[4].id, PENDING, CANCELED)
+    assert store.archive(now_timestamp() + 1) == 5
+    if snapshot:
+        # the archived orders' aggregates go in the snapshot, the archive record is gone with its segment
+        await wal.snapshot()
+    before = store.stats()
+    await wal.close()
+    store.cold.close()
+
+    store, wal = open_state(tmp_path)
+    after = store.stats()
+    assert after["pairs"]["USDJPY"] == before["pairs"]["USDJPY"]
+    assert after["pairs"]["USDJPY"]["orders"] == {"PENDING": 1, "EXECUTED": 4, "CANCELED": 1}
+    assert after["pairs"]["USDJPY"]["executed_quantity"] == pytest.approx(40.0)
+    assert len(store) == 1
+    assert store.get(orders[0].id).status == EXECUTED
+    await wal.close()
+    store.cold.close()
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# the state tests drive the server's modules in-process instead of going through a running server,
+# they're imported from the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+
+@pytest.fixture(scope="function")
+def wal_dir(tmp_path):
+    return str(tmp_path / "wal")
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from execution_scheduler import ExecutionScheduler
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_failed_batch_retried():
+    batches = []
+
+    async def execute(order_ids):
+        batches.append(list(order_ids))
+        if len(batches) == 1:
+            raise RuntimeError("State server unreachable")
+
+    scheduler = ExecutionScheduler(execute, default_delay=0, retry_delay=0.05)
+    scheduler.schedule_many([(1, None), (2, None)])
+    await asyncio.sleep(0.2)
+    await scheduler.stop()
+
+    # the orders aren't left pending without a timer, the batch is executed again
+    assert batches == [[1, 2], [1, 2]]
+    assert scheduler.depth == 0
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_order_canceled_during_failed_batch_not_retried():
+    batches = []
+
+    async def execute(order_ids):
+        batches.append(list(order_ids))
+        if len(batches) == 1:
+            scheduler.cancel(2)
+            raise RuntimeError("State server unreachable")
+
+    scheduler = ExecutionScheduler(execute, default_delay=0, retry_delay=0.05)
+    scheduler.schedule_many([(1, None), (2, None)])
+    await asyncio.sleep(0.2)
+    await scheduler.stop()
+
+    assert batches == [[1, 2], [1]]
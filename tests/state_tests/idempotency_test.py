@@ -0,0 +1,63 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import IdempotencyCache
+
+
+@pytest.mark.state
+def test_key_in_flight_handed_over_after_its_lease():
+    cache = IdempotencyCache(ttl=60, lease=0.05)
+    assert cache.begin("key", "request") is None
+    # a retry while the first request is in flight waits for its response
+    assert cache.begin("key", "request") == ("request", None)
+
+    # the worker handling it died, once its lease is over the next retry handles the request again
+    time.sleep(0.06)
+    assert cache.begin("key", "request") is None
+    cache.finish("key", "request", b"order")
+    # the response is kept for the ttl, not the lease
+    time.sleep(0.06)
+    assert cache.begin("key", "request") == ("request", b"order")
+
+
+@pytest.mark.state
+def test_request_past_its_lease_leaves_the_key_to_the_next():
+    cache = IdempotencyCache(ttl=60, lease=0.05)
+    assert cache.begin("key", "first") is None
+    time.sleep(0.06)
+    # the key was reused for another request once the first one's lease was over
+    assert cache.begin("key", "second") is None
+
+    # the first request reporting back late doesn't touch the entry of the one holding the key now
+    cache.finish("key", "first", b"first order")
+    cache.fail("key", "first")
+    assert cache.begin("key", "second") == ("second", None)
+    cache.finish("key", "second", b"second order")
+    assert cache.begin("key", "first") == ("second", b"second order")
+    # nor does a failure once the key was answered
+    cache.fail("key", "second")
+    assert cache.begin("key", "second") == ("second", b"second order")
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_wait_for_request_in_flight_elsewhere_is_bounded(monkeypatch):
+    # imported here, the archive tests configure the server before it's first imported
+    from routers import orders
+
+    cache = IdempotencyCache(ttl=60, lease=60)
+    # another worker is handling the key and never answers
+    cache.begin("key", "request")
+    monkeypatch.setattr(orders, "idempotency_cache", cache)
+    monkeypatch.setattr(orders, "IDEMPOTENCY_MAX_WAIT", 0.1)
+
+    async def handle():
+        raise AssertionError("The request is handled elsewhere")
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as error:
+        await orders.idempotent("key", "request", handle)
+    assert error.value.status_code == 409
+    assert time.monotonic() - started < 1
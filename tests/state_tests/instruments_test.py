@@ -0,0 +1,18 @@
+import pytest
+
+from instruments import InstrumentRegistry
+
+
+@pytest.mark.state
+@pytest.mark.parametrize("symbol", ["EURUSDX", "EURÜSD", "EUR\x00SD", ""])
+def test_symbol_binary_updates_cant_carry_rejected(symbol):
+    # binary updates hold the pair in 6 ASCII bytes, longer or non-ASCII pairs would be cut or fail to encode
+    with pytest.raises(ValueError):
+        InstrumentRegistry().add(symbol, lot_size=0.01, min_quantity=0.01, max_quantity=100, tick_size=0.0001)
+
+
+@pytest.mark.state
+def test_six_letter_pair_accepted():
+    instrument = InstrumentRegistry().add("EURUSD", lot_size=0.01, min_quantity=0.01, max_quantity=100,
+                                          tick_size=0.0001)
+    assert instrument.symbol == "EURUSD"
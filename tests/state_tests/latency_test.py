@@ -0,0 +1,24 @@
+import pytest
+
+from latency import FixedLatency, LatencyInjector
+
+
+@pytest.mark.state
+def test_literal_route_wins_over_path_parameter():
+    by_id = FixedLatency(0.2)
+    batch = FixedLatency(0.01)
+    default = FixedLatency(0.5)
+    # the templated route is listed first, the literal one still wins
+    injector = LatencyInjector(default=default, routes={"DELETE /orders/{orderId}": by_id, "* /orders/batch": batch})
+    assert injector.model_for("DELETE", "/orders/batch") is batch
+    assert injector.model_for("DELETE", "/orders/123") is by_id
+
+
+@pytest.mark.state
+def test_path_parameter_never_matches_literal_path_of_the_api():
+    by_id = FixedLatency(0.2)
+    default = FixedLatency(0.5)
+    injector = LatencyInjector(default=default, routes={"DELETE /orders/{orderId}": by_id},
+                               literal_paths=["/orders", "/orders/batch"])
+    assert injector.model_for("DELETE", "/orders/batch") is default
+    assert injector.model_for("DELETE", "/orders/123") is by_id
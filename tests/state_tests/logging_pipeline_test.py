@@ -0,0 +1,104 @@
+import json
+import logging
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+import logging_pipeline
+from logging_pipeline import DroppingQueueHandler, SamplingFilter, setup_logging
+
+
+def record(name: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 0, "Order %s executed", ("id",), None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # the filter's monotonic clock, moved forward by the tests
+    clock = SimpleNamespace(now=1000.0)
+    clock.monotonic = lambda: clock.now
+    monkeypatch.setattr(logging_pipeline, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def root_logger(monkeypatch):
+    # setup_logging configures the root logger once per process, it's restored after the test
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    monkeypatch.setattr(logging_pipeline, "_pipeline", None)
+    yield root
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+@pytest.mark.state
+def test_rate_limit_refills_over_time(clock):
+    sampler = SamplingFilter(rate_limits={"routers": 2})
+    # a full bucket lets a burst of one second worth of records through, the rest are dropped
+    assert [sampler.filter(record("routers.orders")) for _ in range(4)] == [True, True, False, False]
+    assert sampler.dropped == 2
+    clock.now += 0.5
+    assert [sampler.filter(record("routers.orders")) for _ in range(2)] == [True, False]
+    # a quiet logger's bucket doesn't fill beyond one second worth
+    clock.now += 10
+    assert [sampler.filter(record("routers.orders")) for _ in range(3)] == [True, True, False]
+    assert sampler.dropped == 4
+    # buckets are per logger, and loggers without a rule aren't limited
+    assert sampler.filter(record("routers.stats"))
+    assert all(sampler.filter(record("state")) for _ in range(10))
+    # warnings and errors always go through
+    assert sampler.filter(record("routers.orders", logging.WARNING))
+    assert sampler.dropped == 4
+
+
+@pytest.mark.state
+def test_sampling_applies_to_logger_and_its_children(monkeypatch):
+    draws = iter([0.05, 0.5, 0.05, 0.5, 0.99])
+    monkeypatch.setattr(logging_pipeline, "random", SimpleNamespace(random=lambda: next(draws)))
+    sampler = SamplingFilter(sampling={"websocket_manager": 0.1, "": 1.0})
+    assert sampler.filter(record("websocket_manager"))
+    assert not sampler.filter(record("websocket_manager"))
+    assert sampler.filter(record("websocket_manager.outbox"))
+    assert not sampler.filter(record("websocket_manager.outbox"))
+    # the root rule keeps everything else, whatever the draw
+    assert sampler.filter(record("wal"))
+    assert sampler.dropped == 2
+
+
+@pytest.mark.state
+def test_full_queue_drops_and_counts():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(record("wal"))
+    handler.handle(record("wal"))
+    assert handler.dropped == 1
+    # queued as is, the message is formatted by the writer thread
+    queued = handler.queue.get_nowait()
+    assert (queued.msg, queued.args) == ("Order %s executed", ("id",))
+
+
+@pytest.mark.state
+def test_setup_writes_json_lines(root_logger, capsys):
+    pipeline = setup_logging(level="INFO", rate_limits={"noisy": 1})
+    assert setup_logging() is pipeline
+    logging.getLogger("wal").info("Recovered %d order(s)", 3, extra={"segment": 7})
+    logging.getLogger("wal").debug("Not written")
+    for _ in range(3):
+        logging.getLogger("noisy").info("Burst")
+    pipeline.stop()
+
+    lines = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert [(line["logger"], line["message"]) for line in lines] == [("wal", "Recovered 3 order(s)"),
+                                                                      ("noisy", "Burst")]
+    assert lines[0]["level"] == "INFO" and lines[0]["segment"] == 7
+    assert pipeline.dropped == 2
+
+
+@pytest.mark.state
+def test_off_level_disables_every_record(root_logger):
+    pipeline = setup_logging(level="off")
+    assert not logging.getLogger("wal").isEnabledFor(logging.CRITICAL)
+    pipeline.stop()
+    with pytest.raises(ValueError):
+        setup_logging(log_format="xml")
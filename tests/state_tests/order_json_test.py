@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from models.schemas import OrderOutput
+from order_json import OrderEncoder
+from order_record import (EXECUTED, ORDER_TYPE_CODES, ORDER_TYPES, PENDING, SIDE_CODES, SIDES, STATUSES, OrderRecord,
+                          format_id, format_timestamp, new_id, now_timestamp, symbols)
+from order_store import OrderStore
+
+
+def model_json(order: OrderRecord) -> bytes:
+    # what FastAPI wrote for the order from the response model
+    return OrderOutput(stocks=order.stocks, quantity=order.quantity, side=SIDES[order.side],
+                       order_type=ORDER_TYPES[order.order_type], price=order.price, id=format_id(order.id),
+                       status=STATUSES[order.status], created_at=format_timestamp(order.created_at),
+                       filled_quantity=order.filled_quantity,
+                       average_price=order.average_price).model_dump_json().encode()
+
+
+@pytest.mark.state
+@pytest.mark.parametrize("fields", [{}, {"side": SIDE_CODES["BUY"], "order_type": ORDER_TYPE_CODES["LIMIT"],
+                                         "price": 1.1}])
+def test_encoded_like_the_response_model(fields):
+    order = OrderRecord(new_id(), symbols.intern("EURUSD"), 10.0, created_at=now_timestamp(), **fields)
+    encoder = OrderEncoder()
+    assert encoder.order(order) == model_json(order)
+    assert json.loads(encoder.orders([order, order])) == [json.loads(model_json(order))] * 2
+
+
+@pytest.mark.state
+def test_cached_until_the_order_changes():
+    store = OrderStore()
+    order = OrderRecord(new_id(), symbols.intern("EURUSD"), 10.0, created_at=now_timestamp())
+    store.add(order)
+    encoder = OrderEncoder()
+
+    encoded = encoder.order(store.get(order.id))
+    assert encoder.order(store.get(order.id)) is encoded
+    assert (encoder.hits, encoder.misses) == (1, 1)
+
+    # a fill changes the filled quantity, executing the order its status, either one encodes it again
+    filled = store.apply_fill(order.id, 4.0, 1.2)
+    assert json.loads(encoder.order(filled))["filled_quantity"] == 4.0
+    executed = store.transition(order.id, PENDING, EXECUTED)
+    assert json.loads(encoder.order(executed))["status"] == "EXECUTED"
+    assert (encoder.hits, encoder.misses) == (1, 3)
+    assert encoder.order(store.get(order.id)) == model_json(executed)
+    assert len(encoder) == 1
+
+
+@pytest.mark.state
+def test_oldest_entries_evicted_once_full():
+    code = symbols.intern("EURUSD")
+    orders = [OrderRecord(new_id(), code, 10.0, created_at=now_timestamp()) for _ in range(3)]
+    encoder = OrderEncoder(max_size=2)
+    for order in orders:
+        encoder.order(order)
+    assert len(encoder) == 2
+    encoder.order(orders[2])
+    encoder.order(orders[0])
+    assert (encoder.hits, encoder.misses) == (1, 4)
@@ -0,0 +1,137 @@
+import uuid
+
+import pytest
+
+import order_store
+from order_archive import OrderArchive
+from order_record import (CANCELED, EXECUTED, ORDER_TYPE_CODES, PENDING, SIDE_CODES, OrderRecord, format_id, new_id,
+                          now_timestamp, parse_id, symbols)
+from order_store import OrderStore
+
+
+@pytest.mark.state
+def test_created_at_filters_with_orders_out_of_time_order():
+    # workers sharing state or a clock stepping back add orders whose created_at goes backwards
+    code = symbols.intern("EURUSD")
+    now = now_timestamp()
+    store = OrderStore()
+    orders = [OrderRecord(new_id(), code, 10.0, created_at=now + offset) for offset in (30, 10, 40, 20, 50)]
+    store.add_many(orders)
+
+    orders_after, _ = store.page(created_after=now + 15)
+    assert [order.created_at - now for order in orders_after] == [30, 40, 20, 50]
+    orders_before, _ = store.page(created_before=now + 35, stocks="EURUSD")
+    assert [order.created_at - now for order in orders_before] == [30, 10, 20]
+    orders_between, cursor = store.page(created_after=now + 15, created_before=now + 45, limit=2)
+    assert [order.created_at - now for order in orders_between] == [30, 40]
+    orders_between, cursor = store.page(cursor, created_after=now + 15, created_before=now + 45, limit=2)
+    assert [order.created_at - now for order in orders_between] == [20]
+    assert cursor is None
+
+
+@pytest.mark.state
+def test_pending_orders_claimed_once():
+    # with shared state only the first worker arms the timers of the recovered orders
+    code = symbols.intern("EURUSD")
+    store = OrderStore()
+    store.add(OrderRecord(new_id(), code, 10.0, created_at=now_timestamp()))
+    assert len(store.claim_pending()) == 1
+    assert store.claim_pending() == []
+
+
+@pytest.mark.state
+def test_indexes_follow_status_changes():
+    eurusd, gbpusd = symbols.intern("EURUSD"), symbols.intern("GBPUSD")
+    store = OrderStore()
+    orders = [OrderRecord(new_id(), code, 10.0, created_at=now_timestamp()) for code in (eurusd, gbpusd, eurusd)]
+    store.add_many(orders)
+    assert [order.id for order in store.by_status(PENDING)] == [order.id for order in orders]
+    assert [order.id for order in store.by_pair("EURUSD")] == [orders[0].id, orders[2].id]
+    assert store.by_pair("USDJPY") == []
+
+    canceled = store.transition(orders[0].id, PENDING, CANCELED)
+    assert canceled.status == CANCELED
+    # the status is checked and set in one step, an order canceled already can't be canceled again
+    assert store.transition(orders[0].id, PENDING, CANCELED) is None
+    assert store.transition(new_id(), PENDING, CANCELED) is None
+    assert [order.id for order in store.by_status(PENDING)] == [orders[1].id, orders[2].id]
+    assert [order.id for order in store.by_status(CANCELED)] == [orders[0].id]
+    assert store.count_by_status(PENDING) == 2
+    # the pair index keeps the order whatever its status
+    assert [order.status for order in store.by_pair("EURUSD")] == [CANCELED, PENDING]
+    assert store.get(orders[0].id).status == CANCELED
+
+
+@pytest.mark.state
+def test_record_round_trip():
+    # ids, enums and timestamps are stored as integers and missing prices as NaN, they come back as they went in
+    code = symbols.intern("EURUSD")
+    created_at = now_timestamp()
+    limit = OrderRecord(new_id(), code, 1.5, side=SIDE_CODES["SELL"], order_type=ORDER_TYPE_CODES["LIMIT"],
+                        price=1.25, created_at=created_at)
+    plain = OrderRecord(new_id(), code, 2.0, created_at=created_at)
+    store = OrderStore()
+    store.add_many([limit, plain])
+    for order in (limit, plain):
+        assert store.get(order.id).to_state() == order.to_state()
+    assert store.get(plain.id).price is None
+    assert store.get(plain.id).average_price is None
+    assert format_id(limit.id) == str(uuid.UUID(int=limit.id))
+    assert parse_id(format_id(limit.id)) == limit.id
+    assert parse_id("not-an-id") is None
+
+
+@pytest.mark.state
+def test_indexes_survive_compaction(tmp_path, monkeypatch):
+    # archiving enough orders drops their rows from the columns, the remaining ones are found as before
+    monkeypatch.setattr(order_store, "COMPACT_MIN_ROWS", 1)
+    eurusd, gbpusd = symbols.intern("EURUSD"), symbols.intern("GBPUSD")
+    now = now_timestamp()
+    store = OrderStore(cold=OrderArchive(str(tmp_path)))
+    orders = [OrderRecord(new_id(), code, 10.0, created_at=now + offset)
+              for offset, code in enumerate((eurusd, gbpusd, eurusd, gbpusd, eurusd))]
+    store.add_many(orders)
+    for order in orders[:3]:
+        store.transition(order.id, PENDING, EXECUTED)
+
+    assert store.archive(created_before=now + 10) == 3
+    assert len(store._columns.ids) == 2
+    assert [order.id for order in store.by_status(PENDING)] == [orders[3].id, orders[4].id]
+    assert store.by_status(EXECUTED) == []
+    assert [order.id for order in store.by_pair("EURUSD")] == [orders[4].id]
+    assert store.get(orders[4].id, cold=False).to_state() == orders[4].to_state()
+    # archived orders are still found in the cold tier
+    assert store.get(orders[0].id).status == EXECUTED
+    assert store.get(orders[0].id, cold=False) is None
+    # the cursor counts orders in creation order, compaction doesn't move it
+    page, cursor = store.page(limit=1)
+    assert [order.id for order in page] == [orders[3].id]
+    page, cursor = store.page(cursor, limit=1)
+    assert [order.id for order in page] == [orders[4].id]
+
+
+@pytest.mark.state
+@pytest.mark.parametrize("seek_ratio", [0, 1000], ids=["status index", "scan"])
+def test_status_filter_pages_in_creation_order(seek_ratio, monkeypatch):
+    # the status index holds orders in the order they got their status, pages still follow creation order
+    monkeypatch.setattr(order_store, "STATUS_SEEK_RATIO", seek_ratio)
+    eurusd, gbpusd = symbols.intern("EURUSD"), symbols.intern("GBPUSD")
+    store = OrderStore()
+    orders = [OrderRecord(new_id(), code, 10.0, created_at=now_timestamp()) for code in (eurusd, gbpusd) * 3]
+    store.add_many(orders)
+    for order in reversed(orders[1:]):
+        store.transition(order.id, PENDING, CANCELED)
+
+    page, cursor = store.page(status=CANCELED, limit=2)
+    assert [order.id for order in page] == [order.id for order in orders[1:3]]
+    page, cursor = store.page(cursor, status=CANCELED, limit=2)
+    assert [order.id for order in page] == [order.id for order in orders[3:5]]
+    page, cursor = store.page(cursor, status=CANCELED, limit=2)
+    assert [order.id for order in page] == [orders[5].id]
+    assert cursor is None
+    # with both filters the pair is checked per order when the status index is used
+    page, _ = store.page(status=CANCELED, stocks="EURUSD")
+    assert [order.id for order in page] == [orders[2].id, orders[4].id]
+    page, _ = store.page(status=PENDING, stocks="EURUSD")
+    assert [order.id for order in page] == [orders[0].id]
+    assert store.page(status=CANCELED, stocks="USDJPY") == ([], None)
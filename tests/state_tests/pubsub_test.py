@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+from pubsub import BroadcastHub, HubChannel
+
+
+class Worker:
+    # a worker's end of the hub, keeps what it's delivered
+    def __init__(self, path: str):
+        self.delivered = []
+        self.received = asyncio.Event()
+        self.channel = HubChannel(path, self.deliver)
+
+    async def deliver(self, updates, aggregate, first_seq):
+        self.delivered.append((updates, aggregate, first_seq))
+        self.received.set()
+
+    async def wait(self, count: int):
+        while len(self.delivered) < count:
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), timeout=5)
+
+
+@pytest.fixture
+def commit_failures():
+    # the state server's group commits fail once this isn't empty
+    return []
+
+
+@pytest_asyncio.fixture
+async def hub(tmp_path, commit_failures):
+    async def commit():
+        if commit_failures:
+            raise OSError("No space left on device")
+
+    hub = BroadcastHub(str(tmp_path / "hub.sock"), commit)
+    await hub.start()
+    yield hub
+    await hub.stop()
+
+
+@pytest_asyncio.fixture
+async def workers(hub):
+    workers = [Worker(hub.path), Worker(hub.path)]
+    for worker in workers:
+        await worker.channel.connect()
+    yield workers
+    for worker in workers:
+        await worker.channel.close()
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_updates_numbered_the_same_on_every_worker(hub, workers):
+    first, second = workers
+    # every worker learns the hub's epoch when it connects
+    assert first.channel.epoch == second.channel.epoch == hub.epoch
+
+    await first.channel.publish([["frame 1", "id 1", False, ["orders"]], ["frame 2", "id 2", True, []]])
+    await first.wait(1)
+    await second.channel.publish([["frame 3", None, False, ["stats"]]], aggregate=True)
+    for worker in workers:
+        await worker.wait(2)
+
+    # the publisher gets its own updates back, numbered like everyone else's
+    assert first.delivered == second.delivered == [
+        ([("frame 1", "id 1", False, ["orders"]), ("frame 2", "id 2", True, [])], False, 1),
+        ([("frame 3", None, False, ["stats"])], True, 3)]
+    assert hub.last_seq == 3
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_failed_group_commit_raised_in_the_worker(workers, commit_failures, monkeypatch):
+    # imported here, the archive tests configure the server before it's first imported
+    import config
+    from routers import orders
+
+    channel = workers[0].channel
+    await asyncio.wait_for(channel.commit(), timeout=5)
+    commit_failures.append(True)
+    with pytest.raises(OSError):
+        await asyncio.wait_for(channel.commit(), timeout=5)
+
+    # requests waiting on it get a 503 instead of an acknowledgement
+    monkeypatch.setattr(orders, "hub_channel", channel)
+    monkeypatch.setattr(config, "WAL_MODE", "group")
+    with pytest.raises(HTTPException) as error:
+        await orders.commit()
+    assert error.value.status_code == 503
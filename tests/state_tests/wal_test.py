@@ -0,0 +1,135 @@
+import asyncio
+import os
+
+import pytest
+
+from order_record import CANCELED, EXECUTED, PENDING, OrderRecord, new_id, now_timestamp, symbols
+from order_store import OrderStore
+from wal import SEGMENT_PREFIX, SNAPSHOT_PREFIX, WriteAheadLog
+
+
+def new_orders(count, stocks="EURUSD"):
+    code = symbols.intern(stocks)
+    created_at = now_timestamp()
+    return [OrderRecord(new_id(), code, 10.0, created_at=created_at + i) for i in range(count)]
+
+
+def recovered_store(directory, **settings):
+    wal = WriteAheadLog(directory, **settings)
+    store = OrderStore(journal=wal)
+    store.load(wal.recover().values())
+    return store, wal
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_orders_recovered_from_log(wal_dir):
+    wal = WriteAheadLog(wal_dir, mode="group", commit_interval=0.001)
+    store = OrderStore(journal=wal)
+    wal.recover()
+    wal.start()
+    orders = new_orders(3)
+    store.add_many(orders)
+    store.transition(orders[0].id, PENDING, CANCELED)
+    store.apply_fill(orders[1].id, 4.0, 1.1)
+    await store.commit()
+    await wal.close()
+
+    recovered, recovered_wal = recovered_store(wal_dir)
+    assert len(recovered) == 3
+    assert recovered.get(orders[0].id).status == CANCELED
+    partially_filled = recovered.get(orders[1].id)
+    assert partially_filled.status == PENDING
+    assert partially_filled.filled_quantity == 4.0
+    assert partially_filled.average_price == 1.1
+    assert recovered.get(orders[2].id).status == PENDING
+    # aggregates are rebuilt from the recovered orders
+    assert recovered.stats()["pairs"]["EURUSD"]["pending_quantity"] == pytest.approx(16.0)
+    assert recovered_wal.lsn == wal.lsn
+    await recovered_wal.close()
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_group_commit_waits_until_durable(wal_dir):
+    wal = WriteAheadLog(wal_dir, mode="group", commit_interval=0.05)
+    store = OrderStore(journal=wal)
+    wal.recover()
+    wal.start()
+    orders = new_orders(2)
+    for order in orders:
+        store.add(order)
+    # nothing is written before the group's fsync
+    assert wal.durable_lsn < wal.lsn
+    await asyncio.gather(store.commit(), store.commit())
+    assert wal.durable_lsn == wal.lsn == 2
+    segment = [name for name in os.listdir(wal_dir) if name.startswith(SEGMENT_PREFIX)][0]
+    with open(os.path.join(wal_dir, segment)) as file:
+        assert len(file.readlines()) == 2
+    await wal.close()
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_snapshot_replaces_log_segments(wal_dir):
+    wal = WriteAheadLog(wal_dir, mode="async", commit_interval=0.001, snapshot_every=10)
+    store = OrderStore(journal=wal)
+    wal.recover()
+    wal.start()
+    orders = new_orders(12)
+    store.add_many(orders)
+    store.transition_many([order.id for order in orders[:5]], PENDING, EXECUTED)
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if wal.snapshot_lsn:
+            break
+    assert wal.snapshot_lsn >= 10
+    # one more change after the snapshot, recovery replays it on top
+    store.transition(orders[-1].id, PENDING, CANCELED)
+    await wal.close()
+
+    names = os.listdir(wal_dir)
+    assert len([name for name in names if name.startswith(SNAPSHOT_PREFIX)]) == 1
+    recovered, recovered_wal = recovered_store(wal_dir)
+    assert len(recovered) == 12
+    assert recovered.count_by_status(EXECUTED) == 5
+    assert recovered.count_by_status(CANCELED) == 1
+    await recovered_wal.close()
+
+
+@pytest.mark.state
+def test_snapshot_state_copies_the_orders(wal_dir):
+    wal = WriteAheadLog(wal_dir, mode="async")
+    store = OrderStore(journal=wal)
+    wal.recover()
+    orders = new_orders(2)
+    store.add_many(orders)
+    lsn, export, _ = store.snapshot_state()
+    assert lsn == 2
+    # changes after the copy was taken don't reach the snapshot
+    store.transition(orders[0].id, PENDING, CANCELED)
+    store.add_many(new_orders(1))
+    assert [order["status"] for order in export()] == [PENDING, PENDING]
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_commit_fails_once_the_log_cant_be_written(wal_dir):
+    wal = WriteAheadLog(wal_dir, mode="group", commit_interval=0.001)
+    store = OrderStore(journal=wal)
+    wal.recover()
+    wal.start()
+
+    def full_disk(data):
+        raise OSError(28, "No space left on device")
+
+    wal._write = full_disk
+    store.add_many(new_orders(1))
+    with pytest.raises(OSError):
+        await asyncio.wait_for(store.commit(), timeout=5)
+    # the log stays failed, later commits fail right away instead of waiting for a flush
+    store.add_many(new_orders(1))
+    with pytest.raises(OSError):
+        await asyncio.wait_for(store.commit(), timeout=1)
+    assert wal.durable_lsn == 0
+    await wal.close()
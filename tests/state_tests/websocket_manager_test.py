@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from order_binary import decode_frame
+from order_record import OrderRecord, new_id, now_timestamp, symbols
+from websocket_manager import ConnectionManager, Payload
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_binary_encoded_only_when_needed():
+    manager = ConnectionManager()
+    order = OrderRecord(new_id(), symbols.intern("EURUSD"), 10.0, created_at=now_timestamp())
+    await manager.publish([({"action": "new_order", "data": order}, None)])
+
+    # nobody connected with the binary subprotocol, the update kept for replay is only JSON so far
+    payload = manager.events[0].payload
+    assert payload._binary is None
+    text = json.loads(payload.text)
+    assert (text["seq"], text["epoch"]) == (1, manager.epoch)
+
+    # encoded on first use, the same whether from the published message or from the JSON of another worker
+    decoded = decode_frame(payload.binary)
+    assert decoded == decode_frame(Payload(payload.text, seq=1, epoch=manager.epoch).binary)
+    assert decoded[0]["seq"] == 1 and decoded[0]["epoch"] == manager.epoch
+    assert decoded[0]["data"] == text["data"]
+
+
+class StalledWebSocket:
+    # a client that never reads what it's sent
+    def __init__(self):
+        self.scope = {}
+        self.closed = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.Event().wait()
+
+    async def close(self, code=1000, reason=None):
+        self.closed = (code, reason)
+
+
+@pytest.mark.state
+@pytest.mark.asyncio
+async def test_slow_consumer_closed():
+    manager = ConnectionManager(queue_size=1, slow_consumer_policy="disconnect")
+    websocket = StalledWebSocket()
+    await manager.connect(websocket)
+    manager.send(websocket, Payload('{"action":"stats"}'))
+    manager.send(websocket, Payload('{"action":"stats"}'))
+
+    # the connection is dropped right away and closed in a task kept until it's done
+    assert websocket not in manager.active_connections
+    assert len(manager._closing) == 1
+    task, = manager._closing
+    await task
+    assert websocket.closed == (1008, "Slow consumer")
+    await asyncio.sleep(0)
+    assert not manager._closing
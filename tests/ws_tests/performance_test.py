@@ -1,11 +1,16 @@
 import asyncio
-import json
+import os
 import pytest
 import aiohttp
 from websockets import connect
-from statistics import mean, stdev
 import time
 
+from load.load_generator import LoadConfig, compare, format_report, read_report, run_load, write_report
+
+# requests per second and seconds of load of the open-loop test
+LOAD_RATE = float(os.getenv("LOAD_RATE", "20"))
+LOAD_DURATION = float(os.getenv("LOAD_DURATION", "5"))
+
 
 # place order helper
 async def place_order(client, base_url, order_data):
@@ -16,58 +21,67 @@ async def place_order(client, base_url, order_data):
 
 @pytest.mark.performance
 @pytest.mark.asyncio
-async def test_performance(forex_api_session):
+async def test_open_loop_load(forex_api_session):
+    # mixed creates, gets and cancels at Poisson arrivals with orders timed until executed, the JSON report
+    # goes next to the html one. LOAD_BASELINE points at a saved report to fail on regressions against it
+    config = LoadConfig(base_url=forex_api_session.base_url, rate=LOAD_RATE, duration=LOAD_DURATION,
+                        subscribers=2, seed=1)
+    report = await run_load(config)
+    print(format_report(report))
+    write_report(report, "test_results/load_report.json")
+
+    for operation, result in report["operations"].items():
+        assert result["errors"] == 0, f"{operation} requests failed: {result['statuses']}"
+    assert report["operations"]["create"]["statuses"].get("201"), "No orders were created"
+    assert report["executions"]["missing"] == 0, f"{report['executions']['missing']} order(s) never executed"
+
+    baseline = os.getenv("LOAD_BASELINE")
+    if baseline:
+        regressions = compare(report, read_report(baseline), threshold=float(os.getenv("LOAD_THRESHOLD", "0.2")))
+        assert not regressions, f"Regressed against {baseline}: {regressions}"
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_delayed_requests_served_concurrently(forex_api_session):
+    # simulated latency must only delay its own request, not serialize the whole server
     base_url = forex_api_session.base_url
     uri = f"ws://{base_url.split('//')[1]}/ws"
     order_data = {"stocks": "EURUSD", "quantity": 10}
 
     async with aiohttp.ClientSession() as client:
-        # open ws connection
         async with connect(uri, ping_interval=None) as websocket:
-            # place 100 orders simultaneously
-            tasks = [place_order(client, base_url, order_data) for _ in range(100)]
             start_time = time.time()
-            responses = await asyncio.gather(*tasks)
-            end_time = time.time()
-            print(f"Time to place 100 orders: {end_time - start_time:.2f} seconds")
-
-            # check response and collect order IDs
-            order_ids = []
-            for response in responses:
-                assert 'id' in response, f"Response missing 'id': {response}"
-                order_ids.append(response['id'])
-
-            print(f"Placed 100 orders successfully.")
-
-            # subscribe to specific order IDs
-            for order_id in order_ids:
-                subscribe_message = json.dumps({"action": "subscribe", "order_id": order_id})
-                await websocket.send(subscribe_message)
-
-            # read ws messages
-            executed_timestamps = {}
-            for _ in range(100):  # Expect only the EXECUTED messages
-                message = await asyncio.wait_for(websocket.recv(), timeout=20)
-                message_data = json.loads(message)
-                order_id = message_data['data']['id']
-                if message_data['data']['status'] == 'EXECUTED':
-                    executed_timestamps[order_id] = time.time()
-                    print(f"Executed message for order {order_id}: {message_data}")
-
-            # compute delays
-            execution_delays = []
-            for order_id in order_ids:
-                if order_id in executed_timestamps:
-                    delay = executed_timestamps[order_id] - start_time
-                    execution_delays.append(delay)
-                else:
-                    print(f"Missing timestamps for order {order_id}")
-
-            if execution_delays:
-                avg_delay = mean(execution_delays)
-                stddev_delay = stdev(execution_delays)
-                print(f"Average Order Execution Delay: {avg_delay:.2f} seconds")
-                print(f"Standard Deviation of Delay: {stddev_delay:.2f} seconds")
-            else:
-                print("No execution delays were recorded.")
-            print(f"Total Time: {end_time - start_time:.2f} seconds")
\ No newline at end of file
+            responses = await asyncio.gather(*[place_order(client, base_url, order_data) for _ in range(20)])
+            elapsed = time.time() - start_time
+            print(f"Time to place 20 concurrent orders: {elapsed:.2f} seconds")
+            assert all('id' in response for response in responses), f"Failed placing orders: {responses}"
+            # each request is delayed by at most ~1 second, serialized they would take 2+ seconds at minimum
+            assert elapsed < 2, f"Concurrent requests look serialized, took {elapsed:.2f} seconds"
+
+            # the websocket stays responsive while requests are being delayed
+            await websocket.ping()
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_batch_vs_single_orders(forex_api_session):
+    base_url = forex_api_session.base_url
+    order_data = {"stocks": "EURUSD", "quantity": 10}
+    order_count = 100
+
+    async with aiohttp.ClientSession() as client:
+        start_time = time.time()
+        responses = await asyncio.gather(*[place_order(client, base_url, order_data) for _ in range(order_count)])
+        single_time = time.time() - start_time
+        assert all('id' in response for response in responses), f"Failed placing orders: {responses}"
+
+        start_time = time.time()
+        batch_response = await client.post(f"{base_url}/orders/batch", json=[order_data] * order_count)
+        results = await batch_response.json()
+        batch_time = time.time() - start_time
+        assert all(result["success"] for result in results), f"Failed placing batch: {results}"
+
+    print(f"Single posts: {order_count} orders in {single_time:.2f} seconds "
+          f"({order_count / single_time:.0f} orders/s)")
+    print(f"Batch post: {order_count} orders in {batch_time:.2f} seconds ({order_count / batch_time:.0f} orders/s)")
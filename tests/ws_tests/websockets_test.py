@@ -1,5 +1,8 @@
 import asyncio
 import json
+import random
+import struct
+import uuid
 import pytest
 import aiohttp
 from websockets import connect
@@ -45,6 +48,9 @@ async def test_websocket_order_status(forex_api_session):
 
             assert executed_data["data"]["id"] == order_id
             assert executed_data["data"]["status"] == "EXECUTED"
+            # executed at the simulated quote of the pair
+            assert executed_data["fill"]["quantity"] == 10
+            assert executed_data["data"]["average_price"] == executed_data["fill"]["price"] > 0
 
             await websocket.close()
 
@@ -134,3 +140,335 @@ async def test_multiple_users_notified(forex_api_session):
 
             await websocket1.close()
             await websocket2.close()
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_no_messages_after_unsubscribe(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri) as websocket:
+            order_data = {"stocks": "EURUSD", "quantity": 10}
+            order_response = await place_order(client, base_url, order_data)
+            order_id = order_response.get('id')
+            assert order_id is not None, "Order ID should not be None"
+
+            # subscribe and unsubscribe right away
+            await websocket.send(json.dumps({"action": "subscribe", "order_id": order_id}))
+            await websocket.send(json.dumps({"action": "unsubscribe", "order_id": order_id}))
+            print(f"Subscribed and unsubscribed from order ID: {order_id}")
+
+            # the order still executes but the update must not reach this client
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(websocket.recv(), timeout=12)
+
+            get_response = await client.get(f"{base_url}/orders/{order_id}")
+            assert (await get_response.json())["status"] == "EXECUTED"
+
+            await websocket.close()
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_batch_cancel_single_frame(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri) as websocket:
+            order_data = [{"stocks": "EURUSD", "quantity": 10}] * 3
+            batch_response = await client.post(f"{base_url}/orders/batch", json=order_data)
+            order_ids = [result["order"]["id"] for result in await batch_response.json()]
+
+            for order_id in order_ids:
+                await websocket.send(json.dumps({"action": "subscribe", "order_id": order_id}))
+
+            cancel_response = await client.delete(f"{base_url}/orders/batch", json=order_ids)
+            assert cancel_response.status == 200, f"Failed to cancel orders: {await cancel_response.text()}"
+
+            # all cancellations arrive aggregated in one frame
+            cancelled_message = await asyncio.wait_for(websocket.recv(), timeout=15)
+            cancelled_data = json.loads(cancelled_message)
+            print(f"Cancelled message: {cancelled_data}")
+
+            assert isinstance(cancelled_data, list), "Expected one aggregated frame for the batch"
+            assert sorted(item["data"]["id"] for item in cancelled_data) == sorted(order_ids)
+            assert all(item["data"]["status"] == "CANCELED" for item in cancelled_data)
+
+            await websocket.close()
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_partial_fills_notified(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+    # far from any other test's prices so nothing else in the book matches
+    price = 9.99
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri) as websocket:
+            sell_order = await place_order(client, base_url,
+                                           {"stocks": "NZDUSD", "quantity": 10, "side": "SELL", "price": price})
+            await websocket.send(json.dumps({"action": "subscribe", "order_id": sell_order["id"]}))
+
+            # two buys fill the resting sell in two steps
+            await place_order(client, base_url, {"stocks": "NZDUSD", "quantity": 4, "side": "BUY", "price": price})
+            partial_data = json.loads(await asyncio.wait_for(websocket.recv(), timeout=12))
+            print(f"Partial fill message: {partial_data}")
+            assert partial_data["action"] == "order_partially_filled"
+            assert partial_data["data"]["filled_quantity"] == 4
+            assert partial_data["fill"] == {"price": price, "quantity": 4}
+
+            await place_order(client, base_url, {"stocks": "NZDUSD", "quantity": 6, "side": "BUY", "price": price})
+            executed_data = json.loads(await asyncio.wait_for(websocket.recv(), timeout=12))
+            print(f"Executed message: {executed_data}")
+            assert executed_data["action"] == "order_executed"
+            assert executed_data["data"]["status"] == "EXECUTED"
+            assert executed_data["fill"] == {"price": price, "quantity": 6}
+
+            await websocket.close()
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_topic_subscriptions(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri) as pair_socket, connect(uri) as status_socket:
+            # pairs no other test trades, so nothing else lands on these topics
+            await pair_socket.send(json.dumps({"action": "subscribe", "topic": "symbol:EURCHF"}))
+            await status_socket.send(json.dumps({"action": "subscribe", "topic": "status:CANCELED"}))
+            await asyncio.sleep(0.5)
+
+            # the new order event reaches the pair's subscribers without knowing the id beforehand
+            order = await place_order(client, base_url, {"stocks": "EURCHF", "quantity": 10})
+            new_data = json.loads(await asyncio.wait_for(pair_socket.recv(), timeout=5))
+            assert new_data["action"] == "new_order"
+            assert new_data["data"]["id"] == order["id"]
+
+            other_order = await place_order(client, base_url, {"stocks": "AUDJPY", "quantity": 10})
+            await client.delete(f"{base_url}/orders/{other_order['id']}")
+            cancelled_data = json.loads(await asyncio.wait_for(status_socket.recv(), timeout=5))
+            assert cancelled_data["action"] == "order_cancelled"
+            assert cancelled_data["data"]["id"] == other_order["id"]
+
+            # after unsubscribing the pair's orders no longer arrive, the status topic still gets them
+            await pair_socket.send(json.dumps({"action": "unsubscribe", "topic": "symbol:EURCHF"}))
+            await asyncio.sleep(0.5)
+            await client.delete(f"{base_url}/orders/{order['id']}")
+            cancelled_data = json.loads(await asyncio.wait_for(status_socket.recv(), timeout=5))
+            assert cancelled_data["data"]["id"] == order["id"]
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(pair_socket.recv(), timeout=1.5)
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_coalesced_frames(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+    # a pair no other test trades, at a price of its own so leftovers of earlier runs don't match
+    price = round(150 + random.randint(1, 99999) * 0.001, 3)
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri) as websocket:
+            await websocket.send(json.dumps({"action": "subscribe", "topic": "symbol:EURJPY",
+                                             "coalesce": {"window_ms": 500, "max_messages": 100}}))
+            await asyncio.sleep(0.5)
+
+            sell_order = await place_order(client, base_url,
+                                           {"stocks": "EURJPY", "quantity": 10, "side": "SELL", "price": price})
+            frame = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert [(item["action"], item["data"]["id"]) for item in frame] == [("new_order", sell_order["id"])]
+
+            # the buy's creation and both executions come out of one request and arrive as one frame, the
+            # buy's execution replaced its creation
+            buy_order = await place_order(client, base_url,
+                                          {"stocks": "EURJPY", "quantity": 10, "side": "BUY", "price": price})
+            frame = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            print(f"Coalesced frame: {frame}")
+            assert isinstance(frame, list), "Expected the updates gathered into one frame"
+            assert sorted((item["action"], item["data"]["id"]) for item in frame) == sorted(
+                [("order_executed", sell_order["id"]), ("order_executed", buy_order["id"])])
+
+
+# record layout of the binary subprotocol's updates
+BINARY_UPDATE = struct.Struct("<QIB16s6sBBBddqdddd")
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_binary_subprotocol(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri, subprotocols=["trading.binary.v2"]) as binary_socket, connect(uri) as json_socket:
+            assert binary_socket.subprotocol == "trading.binary.v2"
+            assert json_socket.subprotocol is None
+            # a pair no other test trades
+            for websocket in (binary_socket, json_socket):
+                await websocket.send(json.dumps({"action": "subscribe", "topic": "symbol:USDCAD"}))
+            await asyncio.sleep(0.5)
+
+            order = await place_order(client, base_url, {"stocks": "USDCAD", "quantity": 10})
+            frame = await asyncio.wait_for(binary_socket.recv(), timeout=5)
+            assert isinstance(frame, bytes)
+            (seq, epoch, action, order_id, stocks, side, order_type, status, quantity, price, _, filled_quantity, _,
+             _, _) = BINARY_UPDATE.unpack(frame)
+            assert (action, order_id, stocks, status) == (0, uuid.UUID(order["id"]).bytes, b"USDCAD", 0)
+            assert (side, order_type, quantity, filled_quantity) == (0, 0, 10.0, 0.0)
+
+            # the same update still reaches JSON clients as text
+            json_data = json.loads(await asyncio.wait_for(json_socket.recv(), timeout=5))
+            assert json_data["action"] == "new_order"
+            assert json_data["data"]["id"] == order["id"]
+            assert (json_data["seq"], json_data["epoch"]) == (seq, epoch)
+
+            await client.delete(f"{base_url}/orders/{order['id']}")
+            frame = await asyncio.wait_for(binary_socket.recv(), timeout=5)
+            action, order_id, _, _, _, status = BINARY_UPDATE.unpack(frame)[2:8]
+            assert (action, order_id, status) == (2, uuid.UUID(order["id"]).bytes, 2)
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_resume_from_sequence_number(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+    # a pair no other test trades
+    topic = "symbol:GBPJPY"
+
+    async with aiohttp.ClientSession() as client:
+        async with connect(uri) as websocket:
+            await websocket.send(json.dumps({"action": "subscribe", "topic": topic}))
+            await asyncio.sleep(0.5)
+            first_order = await place_order(client, base_url, {"stocks": "GBPJPY", "quantity": 10})
+            new_data = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert new_data["data"]["id"] == first_order["id"]
+            last_seq = new_data["seq"]
+            epoch = new_data["epoch"]
+
+        # updates while the client is away
+        second_order = await place_order(client, base_url, {"stocks": "GBPJPY", "quantity": 10})
+        await client.delete(f"{base_url}/orders/{first_order['id']}")
+
+        # the missed updates are replayed in order, then live ones follow
+        async with connect(uri) as websocket:
+            await websocket.send(json.dumps({"action": "resume", "seq": last_seq, "epoch": epoch, "topics": [topic]}))
+            replayed = [json.loads(await asyncio.wait_for(websocket.recv(), timeout=5)) for _ in range(2)]
+            assert [(item["action"], item["data"]["id"]) for item in replayed] == [
+                ("new_order", second_order["id"]), ("order_cancelled", first_order["id"])]
+            assert last_seq < replayed[0]["seq"] < replayed[1]["seq"]
+
+        # a sequence number the server can't replay from gets a snapshot of the pending orders instead
+        async with connect(uri) as websocket:
+            await websocket.send(json.dumps({"action": "resume", "seq": 10 ** 15, "epoch": epoch, "topics": [topic],
+                                             "order_ids": [first_order["id"]]}))
+            snapshot = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert snapshot["action"] == "snapshot"
+            assert snapshot["epoch"] == epoch
+            statuses = {order["id"]: order["status"] for order in snapshot["orders"]}
+            assert statuses[first_order["id"]] == "CANCELED"
+            assert statuses[second_order["id"]] == "PENDING"
+
+            await client.delete(f"{base_url}/orders/{second_order['id']}")
+            cancelled_data = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert cancelled_data["action"] == "order_cancelled"
+            assert cancelled_data["data"]["id"] == second_order["id"]
+            assert cancelled_data["seq"] > snapshot["seq"]
+
+        # the same sequence number from another run of the server, e.g. before a restart, isn't replayed from
+        async with connect(uri) as websocket:
+            await websocket.send(json.dumps({"action": "resume", "seq": last_seq, "epoch": (epoch + 1) % 2 ** 32,
+                                             "topics": [topic]}))
+            snapshot = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert snapshot["action"] == "snapshot"
+            assert snapshot["epoch"] == epoch
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_quote_topic(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with connect(uri) as websocket:
+        # the current quote comes right away, then every change of it
+        await websocket.send(json.dumps({"action": "subscribe", "topic": "quote:EURGBP"}))
+        quotes = []
+        while len(quotes) < 2:
+            quotes.append(json.loads(await asyncio.wait_for(websocket.recv(), timeout=10)))
+        for quote in quotes:
+            assert quote["action"] == "quote"
+            assert quote["data"]["stocks"] == "EURGBP"
+            assert 0 < quote["data"]["bid"] < quote["data"]["ask"]
+        assert quotes[0]["data"]["time"] < quotes[1]["data"]["time"]
+
+        await websocket.send(json.dumps({"action": "unsubscribe", "topic": "quote:EURGBP"}))
+        await websocket.send(json.dumps({"action": "subscribe", "topic": "quotes"}))
+        pairs = set()
+        while len(pairs) < 12:
+            quote = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            pairs.add(quote["data"]["stocks"])
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_stats_topic(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with connect(uri) as websocket:
+        # the current stats come right away, then every STATS_INTERVAL_MS
+        await websocket.send(json.dumps({"action": "subscribe", "topic": "stats"}))
+        first = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+        assert first["action"] == "stats"
+        assert set(first["data"]) == {"orders", "pairs", "rates"}
+
+        order = {"stocks": "USDCHF", "quantity": 2}
+        response = forex_api_session.post_orders(order_request=order)
+        assert response.status_code == 201
+        before = first["data"]["pairs"].get("USDCHF", {"orders": {"PENDING": 0}})["orders"]["PENDING"]
+        # pushed stats catch up with the new order
+        while True:
+            stats = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert stats["action"] == "stats"
+            if stats["data"]["pairs"].get("USDCHF", {}).get("orders", {}).get("PENDING", 0) > before:
+                break
+        forex_api_session.delete_order_by_id(order_id=response.json()["id"])
+
+
+async def open_connections(client, base_url):
+    # this worker's websocket connections per its metrics
+    response = await client.get(f"{base_url}/metrics")
+    for line in (await response.text()).splitlines():
+        if line.startswith("trading_ws_connections "):
+            return float(line.split()[1])
+    return None
+
+
+@pytest.mark.ws
+@pytest.mark.asyncio
+async def test_invalid_messages_ignored(forex_api_session):
+    base_url = forex_api_session.base_url
+    uri = f"ws://{base_url.split('//')[1]}/ws"
+
+    async with aiohttp.ClientSession() as client:
+        before = await open_connections(client, base_url)
+        async with connect(uri) as websocket:
+            # frames that aren't a JSON object are skipped, the connection keeps working
+            for frame in ("not json", "[1, 2]", "42", '"subscribe"'):
+                await websocket.send(frame)
+            await websocket.send(json.dumps({"action": "subscribe", "topic": "stats"}))
+            stats = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            assert stats["action"] == "stats"
+            assert await open_connections(client, base_url) == before + 1
+        # closing it releases the connection
+        await asyncio.sleep(0.5)
+        assert await open_connections(client, base_url) == before
@@ -0,0 +1,276 @@
+# append-only write-ahead log and snapshots for the order store
+import asyncio
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# async: fsync in the background, commit() returns right away (bounded loss window)
+# group: fsync in the background, commit() waits for the batch holding the caller's records
+# sync: write and fsync every record before returning from append()
+WAL_MODES = ("async", "group", "sync")
+
+SEGMENT_PREFIX = "wal-"
+SNAPSHOT_PREFIX = "snapshot-"
+
+
+def _numbered_files(directory: str, prefix: str, suffix: str) -> List[Tuple[int, str]]:
+    # files named <prefix><lsn><suffix>, sorted by lsn
+    files = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            number = name[len(prefix):-len(suffix)]
+            if number.isdigit():
+                files.append((int(number), os.path.join(directory, name)))
+    return sorted(files)
+
+
+def _fsync_directory(directory: str):
+    # make renames and new files durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, mode: str = "group", commit_interval: float = 0.002,
+                 snapshot_every: int = 100_000):
+        if mode not in WAL_MODES:
+            raise ValueError(f"Unknown WAL mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        # callable returning the lsn, a function listing every order as of that lsn and the aggregates of the
+        # archived orders, all taken consistently. the listing runs off the event loop. set by whoever owns
+        # the state
+        self.snapshot_source: Optional[Callable[[], Tuple[int, Callable[[], List[dict]], dict]]] = None
+        os.makedirs(directory, exist_ok=True)
+        # last lsn handed out, last lsn written and fsynced, and lsn of the latest snapshot
+        self.lsn = 0
+        self.durable_lsn = 0
+        self.snapshot_lsn = 0
+        # aggregates of the orders archived up to the recovered lsn, the snapshot's followed by those of every
+        # archive record after it
+        self.archived: List[dict] = []
+        # encoded records waiting for the flusher, the lock also covers handing out lsns so a flush
+        # never claims a record that isn't buffered yet
+        self._buffer: List[str] = []
+        self._buffer_lock = threading.Lock()
+        self._file = None
+        self._flushed = asyncio.Event()
+        self._pending = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # loop running the flusher, appends may come from other threads (the shared state server)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._snapshotting = False
+        # lsn at the last snapshot that couldn't be written, the next one is tried snapshot_every records later
+        self._snapshot_failed_lsn = 0
+        # why records couldn't be written, once set the log takes no more writes: a failed write may have
+        # left a torn record behind that recovery stops at, so nothing after it could be recovered anyway
+        self.failure: Optional[BaseException] = None
+
+    def recover(self) -> Dict[int, dict]:
+        # rebuild the order state from the latest snapshot plus the log records after it,
+        # then open a fresh log segment for new records
+        orders: Dict[int, dict] = {}
+        snapshots = _numbered_files(self.directory, SNAPSHOT_PREFIX, ".json")
+        if snapshots:
+            self.snapshot_lsn, path = snapshots[-1]
+            with open(path, "r") as file:
+                header = json.loads(next(file))
+                if header.get("archived"):
+                    self.archived.append(header["archived"])
+                for line in file:
+                    order = json.loads(line)
+                    orders[order["id"]] = order
+        self.lsn = self.snapshot_lsn
+        replayed = 0
+        for _, path in _numbered_files(self.directory, SEGMENT_PREFIX, ".log"):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write at the tail of the log, nothing after it was acknowledged
+                        logger.warning("Ignoring truncated WAL record in %s", path)
+                        break
+                    if record["lsn"] <= self.lsn:
+                        continue
+                    self._apply(orders, record)
+                    if record["op"] == "archive" and record.get("totals"):
+                        self.archived.append(record["totals"])
+                    self.lsn = record["lsn"]
+                    replayed += 1
+        self.durable_lsn = self.lsn
+        self._open_segment()
+        logger.info("Recovered %d order(s) from snapshot %s and %d WAL record(s)",
+                    len(orders), self.snapshot_lsn, replayed)
+        return orders
+
+    @staticmethod
+    def _apply(orders: Dict[int, dict], record: dict):
+        op = record["op"]
+        if op == "add":
+            orders[record["order"]["id"]] = record["order"]
+        elif op == "update":
+            orders[record["id"]].update(record["fields"])
+        elif op == "archive":
+            # moved to the order archive, which recovers them on its own
+            for order_id in record["ids"]:
+                orders.pop(order_id, None)
+
+    def _open_segment(self):
+        # every segment is named after the first lsn it may hold
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.lsn + 1:020d}.log"), "a")
+        _fsync_directory(self.directory)
+
+    def append(self, op: str, **fields) -> int:
+        # log one record and return its lsn, callers serialize appends with their own lock so
+        # the log order matches the order changes were applied in
+        with self._buffer_lock:
+            self.lsn += 1
+            lsn = self.lsn
+            line = json.dumps({"lsn": lsn, "op": op, **fields}) + "\n"
+            if self.mode == "sync":
+                self._check()
+                try:
+                    self._write(line)
+                except Exception as e:
+                    self._failed(e)
+                    raise
+                self.durable_lsn = lsn
+            else:
+                self._buffer.append(line)
+        # wake the flusher, in sync mode it only takes the snapshots
+        if self._loop is None or threading.get_ident() == self._loop_thread:
+            self._pending.set()
+        else:
+            self._loop.call_soon_threadsafe(self._pending.set)
+        return lsn
+
+    async def commit(self):
+        # wait until every record appended so far is durable, a no-op outside of group mode. raises OSError
+        # once the log failed, the records can't be made durable anymore
+        self._check()
+        if self.mode != "group":
+            return
+        target = self.lsn
+        while self.durable_lsn < target:
+            await self._flushed.wait()
+            self._check()
+
+    def _check(self):
+        if self.failure is not None:
+            raise OSError("Write-ahead log failed, changes can't be made durable") from self.failure
+
+    def _failed(self, error: BaseException):
+        if self.failure is None:
+            self.failure = error
+            logger.error("Write-ahead log failed, it takes no more writes: %s", error)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._task = self._loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._pending.wait()
+            # let more records pile up so one fsync covers the whole group
+            await asyncio.sleep(self.commit_interval)
+            self._pending.clear()
+            await self._flush(loop)
+            if (self.failure is None and not self._snapshotting
+                    and self.lsn - max(self.snapshot_lsn, self._snapshot_failed_lsn) >= self.snapshot_every):
+                try:
+                    await self.snapshot()
+                except Exception as e:
+                    # the log segments still hold every record, recovery only takes longer
+                    self._snapshot_failed_lsn = self.lsn
+                    logger.error("Failed writing WAL snapshot: %s", e)
+
+    async def _flush(self, loop):
+        with self._buffer_lock:
+            lines, self._buffer = self._buffer, []
+            target = self.lsn
+        if self.failure is None:
+            if lines:
+                try:
+                    await loop.run_in_executor(None, self._write, "".join(lines))
+                except Exception as e:
+                    self._failed(e)
+            if self.failure is None:
+                self.durable_lsn = target
+        # wake every waiter of this group, failed or not, then re-arm for the next one
+        self._flushed.set()
+        self._flushed = asyncio.Event()
+
+    def _write(self, data: str):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def snapshot(self):
+        # write every order to a new snapshot, then drop the log segments and snapshots it replaces
+        if self.snapshot_source is None:
+            return
+        self._snapshotting = True
+        try:
+            loop = asyncio.get_running_loop()
+            await self._flush(loop)
+            # the source copies the orders under the lock appends are made with, so the copy
+            # matches the lsn read together with it
+            lsn, export, archived = self.snapshot_source()
+            with self._buffer_lock:
+                self._open_segment()
+            count = await loop.run_in_executor(None, self._write_snapshot, lsn, export, archived)
+            self.snapshot_lsn = lsn
+            logger.info("Wrote snapshot of %s order(s) at lsn %s", count, lsn)
+        finally:
+            self._snapshotting = False
+
+    def _write_snapshot(self, lsn: int, export: Callable[[], List[dict]], archived: dict) -> int:
+        orders = export()
+        path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{lsn:020d}.json")
+        with open(path + ".tmp", "w") as file:
+            file.write(json.dumps({"lsn": lsn, "orders": len(orders), "archived": archived}) + "\n")
+            for order in orders:
+                file.write(json.dumps(order) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_directory(self.directory)
+        # everything up to lsn now lives in the snapshot
+        for number, old_path in _numbered_files(self.directory, SNAPSHOT_PREFIX, ".json"):
+            if number < lsn:
+                os.remove(old_path)
+        segments = _numbered_files(self.directory, SEGMENT_PREFIX, ".log")
+        for (_, old_path), (next_start, _) in zip(segments, segments[1:]):
+            if next_start <= lsn + 1:
+                os.remove(old_path)
+        return len(orders)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.mode != "sync":
+            await self._flush(asyncio.get_running_loop())
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,42 +1,501 @@
 # manage ws connections and order updates
-import json
-from collections import defaultdict
+import asyncio
+import itertools
+import secrets
+import time
+from collections import OrderedDict, deque
 from fastapi import WebSocket
-from typing import Set, Dict
+from typing import Collection, Deque, NamedTuple, Set, Dict, List, Optional, Tuple, Union
 import logging
 
+from metrics import FAST_BUCKETS, registry
+from order_binary import BINARY_SUBPROTOCOL, encode_update, from_json, with_seq
+from order_json import OrderEncoder
+from order_record import PENDING, STATUSES, OrderRecord, symbols
+
 logger = logging.getLogger(__name__)
 
+fanout_seconds = registry.histogram("trading_ws_fanout_seconds",
+                                    "Time to queue a batch of order updates for every subscriber", buckets=FAST_BUCKETS)
+dropped_messages = registry.counter("trading_ws_dropped_messages_total",
+                                    "Outbound WebSocket messages dropped because a queue was full")
+frames_sent = registry.counter("trading_ws_frames_total",
+                               "WebSocket frames sent, a coalesced frame holds several updates")
+slow_consumer_disconnects = registry.counter("trading_ws_slow_consumer_disconnects_total",
+                                             "WebSocket connections closed because their queue was full")
+resumes = registry.counter("trading_ws_resumes_total",
+                           "WebSocket clients resumed from a sequence number, by replay or snapshot", ("result",))
+replayed_updates = registry.counter("trading_ws_replayed_updates_total",
+                                    "Order updates sent again to resuming WebSocket clients")
+
+# what to do when a connection's outbound queue is full
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "conflate", "disconnect")
+# topics a connection can subscribe to besides single orders: every order, one currency pair
+# (symbol:EURUSD) or the orders in one status (status:EXECUTED)
+ALL_ORDERS_TOPIC = "orders"
+SYMBOL_TOPIC_PREFIX = "symbol:"
+STATUS_TOPIC_PREFIX = "status:"
+# market data topics, the quotes of one currency pair (quote:EURUSD) or of all of them
+ALL_QUOTES_TOPIC = "quotes"
+QUOTE_TOPIC_PREFIX = "quote:"
+# order aggregates pushed at a fixed interval
+STATS_TOPIC = "stats"
+
+
+class Payload:
+    # an update encoded once per websocket format: JSON text right away, the binary record of order_binary.py
+    # only once a binary client is sent it, from the published message or, when another worker published it,
+    # from the JSON. records aren't changed once handed out, so a late encoding is the same as an early one
+    __slots__ = ("text", "message", "seq", "epoch", "_binary")
+
+    def __init__(self, text: str, message: Optional[dict] = None, seq: int = 0, epoch: int = 0):
+        self.text = text
+        self.message = message
+        self.seq = seq
+        self.epoch = epoch
+        self._binary: Optional[bytes] = None
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            message = self.message if self.message is not None else from_json(self.text)
+            self._binary = with_seq(encode_update(message), self.seq, self.epoch)
+        return self._binary
+
+
+class Event(NamedTuple):
+    # a numbered update kept in the replay buffer
+    seq: int
+    payload: Payload
+    order_id: Optional[str]
+    topics: Collection[str]
+
+
+def numbered(payload: Payload, seq: int, epoch: int) -> Payload:
+    # the update with its sequence number and epoch, the first keys of the JSON object and the first fields
+    # of the record
+    return Payload('{"seq":%d,"epoch":%d,%s' % (seq, epoch, payload.text[1:]), payload.message, seq, epoch)
+
+
+class Outbox:
+    # bounded outbound queue of a single connection, drained by its own writer task. payloads are queued
+    # in the connection's format, text frames of JSON or binary frames of fixed-size update records. a
+    # snapshot always goes out as JSON text
+    _sequence = itertools.count()
+
+    def __init__(self, websocket: WebSocket, max_size: int, policy: str, binary: bool = False):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.policy = policy
+        self.binary = binary
+        # queue key -> payload, the key is the order id when conflating so a newer update
+        # for the same order replaces the queued one
+        self._queue: OrderedDict = OrderedDict()
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.task: Optional[asyncio.Task] = None
+        # coalescing, off unless the client asks for it: updates are gathered for window seconds (or until
+        # batch_size are queued) and go out as one frame, newer updates of an order replace the queued one
+        self.window = 0.0
+        self.batch_size = 1
+        self._flush = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def coalesce(self, window: float, batch_size: int):
+        # window 0 turns coalescing off
+        self.window = window
+        self.batch_size = max(1, batch_size)
+        self._flush.set()
+
+    def join(self, payloads: List[Union[str, bytes]]) -> Union[str, bytes]:
+        # several updates in one frame, a JSON array or binary records back to back
+        return b"".join(payloads) if isinstance(payloads[0], bytes) else "[" + ",".join(payloads) + "]"
+
+    async def _send(self, payload: Union[str, bytes]):
+        if isinstance(payload, bytes):
+            await self.websocket.send_bytes(payload)
+        else:
+            await self.websocket.send_text(payload)
+        frames_sent.inc()
+
+    def put(self, payload: Union[str, bytes], key: Optional[str] = None, conflate: bool = False) -> bool:
+        # enqueue without waiting on the socket, returns False if the consumer must be disconnected
+        if (conflate or self.policy == "conflate" or self.window) and key is not None:
+            if key in self._queue:
+                self._queue[key] = payload
+                return True
+        else:
+            key = next(self._sequence)
+        if len(self._queue) >= self.max_size:
+            if self.policy == "disconnect":
+                return False
+            self._queue.popitem(last=False)
+            self.dropped += 1
+            dropped_messages.inc()
+        self._queue[key] = payload
+        self._ready.set()
+        if self.window and len(self._queue) >= self.batch_size:
+            self._flush.set()
+        return True
+
+    async def drain(self):
+        while True:
+            await self._ready.wait()
+            if self.window:
+                await self._gather()
+                # what was gathered goes out in frames of up to batch_size updates, updates queued
+                # while sending wait for a window of their own
+                remaining = len(self._queue)
+                while remaining and self._queue:
+                    count = min(remaining, self.batch_size, len(self._queue))
+                    remaining -= count
+                    payloads = [self._queue.popitem(last=False)[1] for _ in range(count)]
+                    for _, frame in itertools.groupby(payloads, key=type):
+                        await self._send(self.join(list(frame)))
+                if self._queue:
+                    continue
+            while self._queue:
+                _, payload = self._queue.popitem(last=False)
+                await self._send(payload)
+            self._ready.clear()
+
+    async def _gather(self):
+        # wait until the window is over or a full batch is queued
+        if len(self._queue) >= self.batch_size:
+            return
+        self._flush.clear()
+        timer = asyncio.get_running_loop().call_later(self.window, self._flush.set)
+        try:
+            await self._flush.wait()
+        finally:
+            timer.cancel()
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, queue_size: int = 1000, slow_consumer_policy: str = "drop_oldest",
+                 encoder: Optional[OrderEncoder] = None, replay_size: int = 10000):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        # encodes order updates into frames, shares its cache with the REST responses
+        self.encoder = encoder or OrderEncoder()
         # initialize and store all active connections
         self.active_connections: Set[WebSocket] = set()
-        # store subscribers and order id
-        self.order_subscribers: Dict[str, Set[WebSocket]] = defaultdict(set)
+        # subscription index in both directions, order id -> connections and connection -> order ids,
+        # entries only exist while they have at least one subscription
+        self.order_subscribers: Dict[str, Set[WebSocket]] = {}
+        self.connection_subscriptions: Dict[WebSocket, Set[str]] = {}
+        # the same for topics, topic -> connections and connection -> topics
+        self.topic_subscribers: Dict[str, Set[WebSocket]] = {}
+        self.connection_topics: Dict[WebSocket, Set[str]] = {}
+        # symbol code * number of statuses + status code -> the topics of an update in that state
+        self._update_topics: Dict[int, Tuple[str, str]] = {}
+        # outbound queue and writer task of every active connection
+        self.outboxes: Dict[WebSocket, Outbox] = {}
+        # the latest numbered updates, so clients reconnecting with the last sequence number they saw get
+        # what they missed. numbers count every update delivered, they come from the hub when workers share it
+        self.events: Deque[Event] = deque(maxlen=replay_size)
+        self.last_seq = 0
+        # numbers start over with every process, the epoch tells a client resuming from a number of an earlier
+        # one apart. the hub's when workers share it
+        self.epoch = secrets.randbits(32)
+        # cross-worker broadcast channel, updates published through it come back to deliver() on every
+        # worker, None when this process is the only worker
+        self.channel = None
+        # slow consumers being closed, referenced until their close is done so the tasks aren't collected
+        self._closing: Set[asyncio.Task] = set()
+
+    def subscription_count(self) -> int:
+        return sum(len(order_ids) for order_ids in self.connection_subscriptions.values())
+
+    def topic_subscription_count(self) -> int:
+        return sum(len(topics) for topics in self.connection_topics.values())
+
+    def queued_messages(self) -> List[int]:
+        # outbound queue length of every connection
+        return [len(outbox) for outbox in self.outboxes.values()]
 
     async def connect(self, websocket: WebSocket):
-        # accept new connection and add it to active connections
-        await websocket.accept()
+        # accept new connection and add it to active connections, clients asking for the binary
+        # subprotocol get binary frames, everyone else JSON
+        binary = BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        await websocket.accept(subprotocol=BINARY_SUBPROTOCOL if binary else None)
         self.active_connections.add(websocket)
+        outbox = Outbox(websocket, self.queue_size, self.slow_consumer_policy, binary=binary)
+        outbox.task = asyncio.create_task(self._write(outbox))
+        self.outboxes[websocket] = outbox
         logger.info("WebSocket connected")
 
     def disconnect(self, websocket: WebSocket):
-        # remove websockets connection from active connections and subscriptions
+        # remove websockets connection from active connections and subscriptions, safe to call twice
+        if websocket not in self.active_connections:
+            return
         self.active_connections.remove(websocket)
-        for subscribers in self.order_subscribers.values():
-            if websocket in subscribers:
-                subscribers.remove(websocket)
+        for order_id in self.connection_subscriptions.pop(websocket, ()):
+            self._remove_subscriber(order_id, websocket)
+        for topic in self.connection_topics.pop(websocket, ()):
+            self._remove_topic_subscriber(topic, websocket)
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None and outbox.task is not asyncio.current_task():
+            outbox.task.cancel()
         logger.info("WebSocket disconnected")
 
-    async def broadcast(self, message: dict, order_id: str = None):
-        # send messages to subscribed clients
-        if order_id:
-            subscribers = self.order_subscribers[order_id]
-            logger.info(f"Broadcasting message to {len(subscribers)} subscriber(s) for order ID: {order_id}")
-            for connection in subscribers:
-                await connection.send_text(json.dumps(message))
+    def subscribe(self, websocket: WebSocket, order_id: str):
+        if websocket not in self.active_connections:
+            return
+        self.order_subscribers.setdefault(order_id, set()).add(websocket)
+        self.connection_subscriptions.setdefault(websocket, set()).add(order_id)
+
+    def unsubscribe(self, websocket: WebSocket, order_id: str) -> bool:
+        order_ids = self.connection_subscriptions.get(websocket)
+        if not order_ids or order_id not in order_ids:
+            return False
+        order_ids.remove(order_id)
+        if not order_ids:
+            del self.connection_subscriptions[websocket]
+        self._remove_subscriber(order_id, websocket)
+        return True
+
+    def coalesce(self, websocket: WebSocket, window: float, max_messages: int):
+        # gather a connection's updates for window seconds, or up to max_messages, into one array frame,
+        # a window of 0 sends every update in a frame of its own again
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            outbox.coalesce(window, min(max_messages, self.queue_size))
+
+    def subscribe_topic(self, websocket: WebSocket, topic: str):
+        if websocket not in self.active_connections:
+            return
+        self.topic_subscribers.setdefault(topic, set()).add(websocket)
+        self.connection_topics.setdefault(websocket, set()).add(topic)
+
+    def unsubscribe_topic(self, websocket: WebSocket, topic: str) -> bool:
+        topics = self.connection_topics.get(websocket)
+        if not topics or topic not in topics:
+            return False
+        topics.remove(topic)
+        if not topics:
+            del self.connection_topics[websocket]
+        self._remove_topic_subscriber(topic, websocket)
+        return True
+
+    def release_order(self, order_id: str):
+        # drop every subscription to an order that reached a terminal state
+        for websocket in self.order_subscribers.pop(order_id, ()):
+            order_ids = self.connection_subscriptions.get(websocket)
+            if order_ids is not None:
+                order_ids.discard(order_id)
+                if not order_ids:
+                    del self.connection_subscriptions[websocket]
+
+    def _remove_subscriber(self, order_id: str, websocket: WebSocket):
+        subscribers = self.order_subscribers.get(order_id)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.order_subscribers[order_id]
+
+    def _remove_topic_subscriber(self, topic: str, websocket: WebSocket):
+        subscribers = self.topic_subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.topic_subscribers[topic]
+
+    def _topics(self, order: OrderRecord) -> Tuple[str, str]:
+        # the pair and status topics of an update, built once per pair and status
+        key = order.symbol * len(STATUSES) + order.status
+        topics = self._update_topics.get(key)
+        if topics is None:
+            topics = self._update_topics[key] = (SYMBOL_TOPIC_PREFIX + symbols.names[order.symbol],
+                                                 STATUS_TOPIC_PREFIX + STATUSES[order.status])
+        return topics
+
+    def _recipients(self, order_id: Optional[str], topics: Collection[str]) -> Collection[WebSocket]:
+        # every connection subscribed to the order or to one of the update's topics, each once. only the
+        # matching index entries are visited, so the cost follows the number of matching subscribers
+        groups = [self.order_subscribers.get(order_id) if order_id else None,
+                  self.topic_subscribers.get(ALL_ORDERS_TOPIC)]
+        groups.extend(self.topic_subscribers.get(topic) for topic in topics)
+        groups = [group for group in groups if group]
+        if not groups:
+            return ()
+        if len(groups) == 1:
+            return groups[0]
+        return set().union(*groups)
+
+    async def _write(self, outbox: Outbox):
+        try:
+            await outbox.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Failed sending to WebSocket, dropping connection: %s", e)
+            self.disconnect(outbox.websocket)
+
+    async def _close_slow_consumer(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1008, reason="Slow consumer")
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, payload: Payload, key: Optional[str] = None):
+        # queue an already serialized message for one connection, in the connection's format
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            self._put(outbox, payload.binary if outbox.binary else payload.text, key)
+
+    def _put(self, outbox: Outbox, payload: Union[str, bytes, None], key: Optional[str] = None,
+             conflate: bool = False):
+        if payload is None:
+            return
+        if not outbox.put(payload, key, conflate):
+            websocket = outbox.websocket
+            logger.warning("WebSocket outbound queue full (%s), disconnecting slow consumer", outbox.max_size)
+            slow_consumer_disconnects.inc()
+            self.disconnect(websocket)
+            task = asyncio.create_task(self._close_slow_consumer(websocket))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def publish(self, updates: List[Tuple[dict, Optional[str]]], aggregate: bool = False):
+        # send (message, order id) updates to their subscribers on every worker, messages carry the
+        # order record under "data" and are encoded to JSON here into (payload, order id, done, topics) updates
+        frames = [(Payload(self.encoder.message(message), message), order_id, message["data"].status != PENDING,
+                   self._topics(message["data"])) for message, order_id in updates]
+        if self.channel is not None:
+            # the hub relays JSON lines, workers with binary clients encode the records from the JSON
+            await self.channel.publish([(payload.text, order_id, done, topics)
+                                        for payload, order_id, done, topics in frames], aggregate)
         else:
-            logger.info(f"Broadcasting message to {len(self.active_connections)} active connection(s)")
-            for connection in self.active_connections:
-                await connection.send_text(json.dumps(message))
+            await self.deliver(frames, aggregate, self.last_seq + 1)
+
+    async def receive(self, updates: List[tuple], aggregate: bool, first_seq: int):
+        # updates relayed by the broadcast hub, as published above and numbered by the hub
+        await self.deliver([(Payload(text), order_id, done, topics)
+                            for text, order_id, done, topics in updates], aggregate, first_seq)
+
+    async def deliver(self, updates: List[Tuple[Payload, Optional[str], bool, Collection[str]]],
+                      aggregate: bool, first_seq: int):
+        # number the encoded updates from first_seq on, keep them for replay, send them to this worker's
+        # subscribers and release the subscriptions of orders that are done. aggregated updates reach
+        # every subscriber as a single frame
+        start = time.perf_counter()
+        updates = [(numbered(payload, seq, self.epoch), order_id, done, topics)
+                   for seq, (payload, order_id, done, topics) in enumerate(updates, first_seq)]
+        self.events.extend(Event(seq, payload, order_id, topics)
+                           for seq, (payload, order_id, _, topics) in enumerate(updates, first_seq))
+        self.last_seq = first_seq + len(updates) - 1
+        if aggregate:
+            await self.broadcast_many([(payload, order_id, topics) for payload, order_id, _, topics in updates])
+        else:
+            for payload, order_id, _, topics in updates:
+                await self.broadcast(payload, order_id=order_id, topics=topics)
+        fanout_seconds.observe(time.perf_counter() - start)
+        for _, order_id, done, _ in updates:
+            if order_id and done:
+                self.release_order(order_id)
+
+    def replayable(self, seq: int, epoch: Optional[int]) -> bool:
+        # whether the replay buffer still holds every update after seq of the epoch
+        if epoch != self.epoch:
+            return False
+        first_seq = self.events[0].seq if self.events else self.last_seq + 1
+        return first_seq - 1 <= seq <= self.last_seq
+
+    def resume(self, websocket: WebSocket, seq: int, epoch: Optional[int], order_ids: Collection[str],
+               topics: Collection[str], snapshot: Optional[Tuple[int, List[OrderRecord]]] = None) -> bool:
+        # catch a reconnected client up on the updates of the orders and topics it follows that came after
+        # seq of epoch. they are replayed from the buffer while it still reaches back that far and the epoch is
+        # this server's, otherwise the client gets the snapshot, (sequence number it was read at, orders),
+        # followed by the updates after that number, which may repeat a change the snapshot already shows.
+        # returns whether seq could be replayed from. the client subscribes before this and nothing is awaited
+        # in between, so no update is missed
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            return False
+        replayed_from_seq = self.replayable(seq, epoch)
+        if not replayed_from_seq:
+            resumes.labels("snapshot").inc()
+            snapshot_seq, orders = snapshot
+            if not self.replayable(snapshot_seq, self.epoch):
+                # the buffer moved past the snapshot while it was read, it's as recent as it gets
+                snapshot_seq = self.last_seq
+            self._put(outbox, '{"action":"snapshot","seq":%d,"epoch":%d,"orders":%s}'
+                      % (snapshot_seq, self.epoch, self.encoder.orders(orders).decode()))
+            logger.info("WebSocket resumed from %d with a snapshot of %d order(s)", seq, len(orders))
+            seq = snapshot_seq
+        else:
+            resumes.labels("replay").inc()
+        first_seq = self.events[0].seq if self.events else self.last_seq + 1
+        everything = ALL_ORDERS_TOPIC in topics
+        replayed = 0
+        for event in itertools.islice(self.events, seq + 1 - first_seq, None):
+            if everything or event.order_id in order_ids or any(topic in topics for topic in event.topics):
+                self.send(websocket, event.payload, key=event.order_id)
+                replayed += 1
+        replayed_updates.inc(replayed)
+        logger.info("WebSocket resumed from %d, %d update(s) replayed", seq, replayed)
+        return replayed_from_seq
+
+    def publish_quotes(self, quotes: List[Tuple[str, str]]):
+        # the latest (pair, encoded quote) of every pair to the subscribers of its quote topic and of all
+        # quotes. quotes aren't numbered or kept for replay, and a newer quote of a pair replaces the one
+        # still queued so a slow client only ever waits on the latest. they are JSON for binary clients too
+        everyone = self.topic_subscribers.get(ALL_QUOTES_TOPIC, set())
+        for pair, payload in quotes:
+            topic = QUOTE_TOPIC_PREFIX + pair
+            subscribers = self.topic_subscribers.get(topic)
+            for connection in (everyone | subscribers) if subscribers else everyone:
+                self.send_latest(connection, topic, payload)
+
+    def publish_latest(self, topic: str, payload: str):
+        # a JSON message where only the latest counts to the topic's subscribers, like the quotes
+        for connection in list(self.topic_subscribers.get(topic, ())):
+            self.send_latest(connection, topic, payload)
+
+    def send_latest(self, websocket: WebSocket, topic: str, payload: str):
+        # queued under the topic, so it replaces the topic's message if that one is still waiting
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            self._put(outbox, payload, key=topic, conflate=True)
+
+    def has_quote_subscribers(self) -> bool:
+        return any(topic == ALL_QUOTES_TOPIC or topic.startswith(QUOTE_TOPIC_PREFIX)
+                   for topic in self.topic_subscribers)
+
+    async def broadcast(self, payload: Payload, order_id: str = None, topics: Collection[str] = ()):
+        # send an encoded message to the clients subscribed to the order or its topics, it is only queued
+        # here so a slow socket never holds up the publisher. without either it goes to every client
+        if order_id or topics:
+            subscribers = self._recipients(order_id, topics)
+            logger.info("Broadcasting message to %d subscriber(s) for order ID: %s", len(subscribers), order_id)
+        else:
+            subscribers = self.active_connections
+            logger.info("Broadcasting message to %d active connection(s)", len(subscribers))
+        for connection in list(subscribers):
+            self.send(connection, payload, key=order_id)
+
+    async def broadcast_many(self, messages: List[Tuple[Payload, Optional[str], Collection[str]]]):
+        # send several (encoded message, order id, topics) updates, every connection gets all of its updates
+        # in a single frame, a JSON array or back to back binary records when there is more than one
+        pending: Dict[WebSocket, List[Tuple[Payload, Optional[str]]]] = {}
+        for payload, order_id, topics in messages:
+            subscribers = self._recipients(order_id, topics) if order_id or topics else self.active_connections
+            for connection in subscribers:
+                pending.setdefault(connection, []).append((payload, order_id))
+        logger.info("Broadcasting %d message(s) to %d connection(s)", len(messages), len(pending))
+        for connection, items in pending.items():
+            outbox = self.outboxes.get(connection)
+            if outbox is not None and outbox.window:
+                # coalescing connections batch and conflate updates themselves
+                for payload, order_id in items:
+                    self.send(connection, payload, key=order_id)
+            elif len(items) == 1:
+                self.send(connection, items[0][0])
+            elif outbox is not None:
+                self._put(outbox, outbox.join([payload.binary if outbox.binary else payload.text
+                                               for payload, _ in items]))